@@ -1,6 +1,11 @@
+from .refsets import CohortLongitudinalRefset
 from .refsets import LongitudinalRefset, NoRefsetObjectsExist
+from .reference import BulkReferenceDeleter, DeferredReferenceDeleter
+from .reference import BulkReferenceUpdater, DeferredReferenceUpdater
 from .reference import ReferenceDeleter
 from .reference import ReferenceGetter
+from .reference import ReferencePrefetch
+from .reference import reference_instrumentation, reference_operation
 from .reference import ReferenceUpdater
 from .reference import ReferenceFieldNotFound
 from .reference_model_config import ReferenceModelConfig
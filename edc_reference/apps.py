@@ -1,21 +1,74 @@
+import logging
 import sys
 
 from django.apps import AppConfig as DjangoAppConfig
+from django.conf import settings
 from django.core.checks.registry import register
 
 from .site import site_reference_configs
 from .system_checks import check_site_reference_configs
 
+logger = logging.getLogger('edc_reference')
+
 
 class AppConfig(DjangoAppConfig):
     name = 'edc_reference'
     verbose_name = 'Edc Reference'
 
     def ready(self):
+        from .reference import reference_cache, reference_instrumentation
+        from .reference import shared_reference_cache
         from .signals import reference_post_delete
         sys.stdout.write(f'Loading {self.verbose_name} ...\n')
 
-        site_reference_configs.autodiscover()
+        self.load_reference_configs(
+            snapshot_path=getattr(settings, 'EDC_REFERENCE_REGISTRY_SNAPSHOT', None))
+
+        cache_maxsize = getattr(settings, 'EDC_REFERENCE_CACHE_MAXSIZE', 0)
+        if cache_maxsize:
+            reference_cache.enable(
+                maxsize=cache_maxsize,
+                ttl=getattr(settings, 'EDC_REFERENCE_CACHE_TTL', None))
+            sys.stdout.write(
+                f' * reference cache enabled, maxsize={cache_maxsize}, '
+                f'ttl={reference_cache.ttl}.\n')
+        cache_alias = getattr(settings, 'EDC_REFERENCE_SHARED_CACHE', None)
+        if cache_alias:
+            shared_reference_cache.enable(
+                alias=cache_alias,
+                timeout=getattr(settings, 'EDC_REFERENCE_SHARED_CACHE_TIMEOUT', None))
+            sys.stdout.write(
+                f' * shared reference cache enabled, alias={cache_alias}.\n')
+
+        instrumentation = getattr(settings, 'EDC_REFERENCE_INSTRUMENTATION', None)
+        if instrumentation:
+            reference_instrumentation.enable(
+                callbacks=None if instrumentation is True else instrumentation)
+            sys.stdout.write(' * reference instrumentation enabled.\n')
 
         sys.stdout.write(f' Done loading {self.verbose_name}.\n')
         register(check_site_reference_configs)
+
+    def load_reference_configs(self, snapshot_path=None, site=None):
+        """Loads the reference model configs from the snapshot, if
+        current, or autodiscovers them and writes the snapshot.
+
+        A snapshot that cannot be written, e.g. on a read-only
+        file system, is logged and the autodiscovered configs used.
+        """
+        site = site or site_reference_configs
+        if snapshot_path and site.load_snapshot(path=snapshot_path):
+            sys.stdout.write(
+                f' * loaded reference model configs from snapshot {snapshot_path}.\n')
+        else:
+            site.autodiscover()
+            if snapshot_path:
+                try:
+                    site.write_snapshot(path=snapshot_path)
+                except OSError as e:
+                    logger.warning(
+                        f'Unable to write reference model configs snapshot '
+                        f'{snapshot_path}. Got {e}')
+                else:
+                    sys.stdout.write(
+                        f' * wrote reference model configs snapshot {snapshot_path}.\n')
@@ -0,0 +1,3 @@
+from .index_benchmark import IndexBenchmark
+from .reference_benchmark import ReferenceBenchmark, BenchmarkQueryCountError
+from .refset_memory_benchmark import RefsetMemoryBenchmark
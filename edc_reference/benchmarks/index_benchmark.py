@@ -0,0 +1,140 @@
+import sys
+
+from datetime import timedelta
+from django.db import transaction
+from edc_base.utils import get_utcnow
+from time import perf_counter
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+class IndexBenchmark:
+
+    """A class to time the reference model's hot queries and
+    show their query plans on a table of synthetic rows.
+
+    Rows are written and the queries run in a transaction that is
+    rolled back unless `keep`=True.
+
+    rows = subjects * timepoints * models * fields
+    """
+
+    identifier_prefix = 'benchmark-'
+    batch_size = 5000
+
+    def __init__(self, reference_model_cls=None, subjects=None, timepoints=None,
+                 models=None, fields=None, repeat=None, keep=None, verbose=None):
+        self.reference_model_cls = reference_model_cls
+        self.subjects = subjects or 2000
+        self.timepoints = timepoints or 10
+        self.models = models or 10
+        self.fields = fields or 10
+        self.repeat = repeat or 5
+        self.keep = keep
+        self.verbose = verbose
+        self.report_datetime = get_utcnow()
+        self.results = []
+
+    @property
+    def rows(self):
+        return self.subjects * self.timepoints * self.models * self.fields
+
+    def identifier(self, index=None):
+        return f'{self.identifier_prefix}{index:07d}'
+
+    def timepoint(self, index=None):
+        return f'{(index + 1) * 1000}'
+
+    def model(self, index=None):
+        return f'benchmark.crf{index}'
+
+    def field_name(self, index=None):
+        return f'field{index}'
+
+    @property
+    def queries(self):
+        """Returns a list of (name, queryset) for the hot query
+        patterns, each for a subject in the middle of the table.
+        """
+        objects = self.reference_model_cls.objects
+        identifier = self.identifier(self.subjects // 2)
+        timepoint = self.timepoint(self.timepoints // 2)
+        model = self.model(self.models // 2)
+        return [
+            ('getter (natural key)', objects.filter(
+                identifier=identifier, timepoint=timepoint,
+                report_datetime=self.get_report_datetime(self.timepoints // 2),
+                model=model, field_name=self.field_name(0))),
+            ('refset (identifier, timepoint, model)', objects.filter(
+                identifier=identifier, timepoint=timepoint, model=model).only(
+                    *self.reference_model_cls.refset_fields)),
+            ('longitudinal (identifier, model)', objects.filter(
+                identifier=identifier, model=model)),
+            ('longitudinal visits (identifier, model, field_name)', objects.filter(
+                identifier=identifier, model=model, field_name=self.field_name(0))),
+            ('populater (model)', objects.filter(model=model)[:1]),
+            ('prefetch (identifier)', objects.filter(identifier=identifier)),
+        ]
+
+    def get_report_datetime(self, index=None):
+        return self.report_datetime + timedelta(days=index)
+
+    def run(self):
+        """Populates the table, runs the queries and returns a list
+        of dictionaries of name, plan, best and mean seconds.
+        """
+        try:
+            with transaction.atomic():
+                self.populate()
+                self.results = [self.run_query(name, queryset)
+                                for name, queryset in self.queries]
+                if not self.keep:
+                    raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+        return self.results
+
+    def run_query(self, name=None, queryset=None):
+        timings = []
+        for _ in range(self.repeat):
+            start = perf_counter()
+            list(queryset.all())
+            timings.append(perf_counter() - start)
+        return dict(
+            name=name,
+            plan=queryset.explain(),
+            best=min(timings),
+            mean=sum(timings) / len(timings))
+
+    def populate(self):
+        """Bulk creates the synthetic rows and returns the number
+        created.
+        """
+        references = []
+        created = 0
+        for subject in range(self.subjects):
+            for timepoint in range(self.timepoints):
+                for model in range(self.models):
+                    for field in range(self.fields):
+                        references.append(self.reference_model_cls(
+                            identifier=self.identifier(subject),
+                            timepoint=self.timepoint(timepoint),
+                            report_datetime=self.get_report_datetime(timepoint),
+                            model=self.model(model),
+                            field_name=self.field_name(field),
+                            datatype='IntegerField',
+                            value_int=field))
+                        if len(references) == self.batch_size:
+                            created += self.write(references)
+                            references = []
+                            if self.verbose:
+                                sys.stdout.write(
+                                    f' * populating {created}/{self.rows} rows ...\r')
+        created += self.write(references)
+        return created
+
+    def write(self, references=None):
+        self.reference_model_cls.objects.bulk_create(references)
+        return len(references)
@@ -0,0 +1,241 @@
+import json
+import tracemalloc
+
+from contextlib import redirect_stdout
+from dateutil.relativedelta import relativedelta
+from django.apps import apps as django_apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+from io import StringIO
+from time import perf_counter
+
+from ..populater import Populater
+from ..reference import ReferenceGetter, ReferenceUpdater, reference_cache
+from ..refsets import LongitudinalRefset, Refset
+from ..site import site_reference_configs
+
+
+class BenchmarkQueryCountError(Exception):
+    pass
+
+
+class ReferenceBenchmark:
+
+    """A class to measure queries, wall time and peak memory of
+    the reference write and read paths at several data sizes.
+
+    Each size is a number of subjects, each with `visits` visit
+    and CRF model instances. Per-subject operations run for the
+    last subject created.
+
+    By default uses the test models. The reference names must be
+    registered with `site_reference_configs`.
+
+    For example:
+
+        benchmark = ReferenceBenchmark(sizes=[1, 10, 100])
+        benchmark.run()
+        benchmark.check()
+        benchmark.write('benchmark.json')
+    """
+
+    visit_model = 'edc_reference.subjectvisit'
+    crf_model = 'edc_reference.crfone'
+    crf_visit_attr = 'subject_visit'
+    field_name = 'field_int'
+    identifier_prefix = 'benchmark-'
+    visits = 5
+    # upper bound on queries for each per-subject operation
+    max_queries = dict(updater=2, getter=1, refset=1, longitudinal=2, fieldset=0)
+    # queries may grow by at most one per this many rows between sizes
+    rows_per_query = 20
+
+    def __init__(self, sizes=None, repeat=None):
+        self.sizes = sorted(sizes or [1, 10])
+        self.repeat = repeat or 3
+        self.subjects = 0
+        self.results = []
+
+    @property
+    def reference_model_cls(self):
+        return django_apps.get_model(
+            site_reference_configs.get_reference_model(name=self.crf_model))
+
+    def run(self):
+        """Creates the data for each size, measures each operation
+        and returns a list of dictionaries of operation, size, rows,
+        queries, best and mean seconds and peak memory in bytes.
+        """
+        self.results = []
+        for size in self.sizes:
+            self.populate(size=size)
+            for operation, func, rows in self.get_operations(size=size):
+                self.results.append(self.measure(
+                    operation=operation, func=func, size=size, rows=rows))
+        return self.results
+
+    def measure(self, operation=None, func=None, size=None, rows=None):
+        """Times `func` over `repeat` runs then runs it once more
+        to count queries and trace peak memory.
+        """
+        timings = []
+        for _ in range(self.repeat):
+            reference_cache.clear()
+            start = perf_counter()
+            func()
+            timings.append(perf_counter() - start)
+        reference_cache.clear()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return dict(
+            operation=operation,
+            size=size,
+            rows=rows,
+            queries=len(context.captured_queries),
+            best=min(timings),
+            mean=sum(timings) / len(timings),
+            peak_memory=peak)
+
+    def get_operations(self, size=None):
+        """Returns a list of (operation, func, rows).
+        """
+        identifier = self.identifier(self.subjects - 1)
+        visit_model_cls = django_apps.get_model(self.visit_model)
+        crf_model_cls = django_apps.get_model(self.crf_model)
+        visit = visit_model_cls.objects.filter(
+            subject_identifier=identifier).order_by('report_datetime')[self.visits // 2]
+        crf = crf_model_cls.objects.select_related(self.crf_visit_attr).get(
+            **{self.crf_visit_attr: visit})
+        longitudinal_refset = self.longitudinal_refset(identifier=identifier)
+
+        def updater():
+            setattr(crf, self.field_name, (getattr(crf, self.field_name) or 0) + 1)
+            ReferenceUpdater(model_obj=crf)
+
+        def getter():
+            ReferenceGetter(
+                name=self.crf_model,
+                field_name=self.field_name,
+                subject_identifier=identifier,
+                report_datetime=visit.report_datetime,
+                visit_code=visit.visit_code)
+
+        def refset():
+            Refset(
+                name=self.crf_model,
+                subject_identifier=identifier,
+                report_datetime=visit.report_datetime,
+                timepoint=visit.visit_code,
+                reference_model_cls=self.reference_model_cls)
+
+        def populater():
+            with redirect_stdout(StringIO()):
+                Populater(names=[self.visit_model, self.crf_model], bulk=True).populate()
+
+        return [
+            ('updater', updater, self.visits),
+            ('getter', getter, self.visits),
+            ('refset', refset, self.visits),
+            ('longitudinal', lambda: self.longitudinal_refset(identifier), self.visits),
+            ('fieldset', lambda: list(longitudinal_refset.fieldset(self.field_name)),
+             self.visits),
+            ('populater', populater, size * self.visits * 2),
+        ]
+
+    def longitudinal_refset(self, identifier=None):
+        return LongitudinalRefset(
+            name=self.crf_model,
+            subject_identifier=identifier,
+            visit_model=self.visit_model,
+            reference_model_cls=self.reference_model_cls)
+
+    def populate(self, size=None):
+        """Creates subjects, and their visit and CRF model
+        instances, until there are `size` subjects.
+        """
+        visit_model_cls = django_apps.get_model(self.visit_model)
+        report_datetime = get_utcnow()
+        for subject in range(self.subjects, size):
+            for index in range(self.visits):
+                visit = visit_model_cls.objects.create(
+                    subject_identifier=self.identifier(subject),
+                    report_datetime=report_datetime - relativedelta(
+                        months=self.visits - index),
+                    visit_code=f'{(index + 1) * 1000}')
+                self.create_crf(visit=visit, index=index)
+        self.subjects = max(self.subjects, size)
+
+    def create_crf(self, visit=None, index=None):
+        crf_model_cls = django_apps.get_model(self.crf_model)
+        return crf_model_cls.objects.create(
+            **{self.crf_visit_attr: visit},
+            field_str=f'value{index}',
+            field_date=visit.report_datetime.date(),
+            field_datetime=visit.report_datetime,
+            field_int=index)
+
+    def identifier(self, index=None):
+        return f'{self.identifier_prefix}{index:07d}'
+
+    def check(self):
+        """Raises BenchmarkQueryCountError if an operation exceeds
+        `max_queries` or its queries grow with size by more than one
+        per `rows_per_query` rows.
+        """
+        errors = []
+        results_by_operation = {}
+        for result in self.results:
+            results_by_operation.setdefault(result['operation'], []).append(result)
+        for operation, results in results_by_operation.items():
+            bound = self.max_queries.get(operation)
+            for result in results:
+                if bound is not None and result['queries'] > bound:
+                    errors.append(
+                        f'{operation} made {result["queries"]} queries, expected '
+                        f'at most {bound}. size={result["size"]}')
+            first, last = results[0], results[-1]
+            allowed = (last['rows'] - first['rows']) // self.rows_per_query
+            if last['queries'] - first['queries'] > allowed:
+                errors.append(
+                    f'{operation} queries grew from {first["queries"]} to '
+                    f'{last["queries"]} between size={first["size"]} and '
+                    f'size={last["size"]}, expected at most {allowed} more')
+        if errors:
+            raise BenchmarkQueryCountError('. '.join(errors))
+
+    def to_json(self):
+        return json.dumps(dict(
+            vendor=connection.vendor,
+            sizes=self.sizes,
+            repeat=self.repeat,
+            results=self.results), indent=2)
+
+    def write(self, path=None):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+    @staticmethod
+    def compare(previous=None, current=None):
+        """Returns a list of dictionaries of operation, size, and the
+        change in queries and ratio of best times and peak memory
+        between two lists of results, e.g. loaded from `write`.
+        """
+        previous = {(r['operation'], r['size']): r for r in previous}
+        comparison = []
+        for result in current:
+            before = previous.get((result['operation'], result['size']))
+            if not before:
+                continue
+            comparison.append(dict(
+                operation=result['operation'],
+                size=result['size'],
+                queries=result['queries'] - before['queries'],
+                best=result['best'] / (before['best'] or 1),
+                peak_memory=result['peak_memory'] / (before['peak_memory'] or 1)))
+        return comparison
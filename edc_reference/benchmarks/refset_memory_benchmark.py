@@ -0,0 +1,110 @@
+import tracemalloc
+
+from dateutil.relativedelta import relativedelta
+from django.apps import apps as django_apps
+from edc_base.utils import get_utcnow
+
+from ..refsets import Refset
+from ..site import site_reference_configs
+
+
+class RefsetMemoryBenchmark:
+
+    """A class to measure the memory held per subject visit by a
+    `Refset` and by the compact record generated for the same
+    reference name.
+
+    References are built in memory, unsaved, so no database
+    access is needed. Only memory still allocated after building
+    the objects is counted, not the references themselves.
+
+    For example:
+
+        benchmark = RefsetMemoryBenchmark(name='edc_reference.crfone')
+        benchmark.run()
+        {'name': 'edc_reference.crfone', 'visits': 1000, 'fields': 4,
+         'refset': 1180.4, 'record': 96.1}
+    """
+
+    subject_identifier = 'benchmark-0000000'
+    visits = 1000
+
+    def __init__(self, name=None, visits=None):
+        self.name = name
+        self.visits = visits or self.visits
+        self.field_names = [
+            f for f in site_reference_configs.get_fields(name=self.name)
+            if f != 'report_datetime']
+
+    @property
+    def reference_model_cls(self):
+        return django_apps.get_model(
+            site_reference_configs.get_reference_model(name=self.name))
+
+    def run(self):
+        """Returns a dictionary of the bytes per visit held by
+        refsets and by records.
+        """
+        references_by_visit = self.get_references()
+        return dict(
+            name=self.name,
+            visits=self.visits,
+            fields=len(self.field_names),
+            refset=self.measure(self.refsets, references_by_visit) / self.visits,
+            record=self.measure(self.records, references_by_visit) / self.visits)
+
+    @staticmethod
+    def measure(func=None, references_by_visit=None):
+        """Returns the bytes still allocated by the objects `func`
+        returns.
+        """
+        tracemalloc.start()
+        try:
+            objs = func(references_by_visit)
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del objs
+        return current
+
+    def refsets(self, references_by_visit=None):
+        return [
+            Refset(
+                name=self.name,
+                subject_identifier=self.subject_identifier,
+                report_datetime=report_datetime,
+                timepoint=timepoint,
+                references=references)
+            for (timepoint, report_datetime), references in references_by_visit.items()]
+
+    def records(self, references_by_visit=None):
+        record_cls = site_reference_configs.get_config(name=self.name).record_cls
+        return [
+            record_cls(
+                subject_identifier=self.subject_identifier,
+                timepoint=timepoint,
+                report_datetime=report_datetime,
+                values={obj.field_name: obj.value for obj in references})
+            for (timepoint, report_datetime), references in references_by_visit.items()]
+
+    def get_references(self):
+        """Returns a dictionary of unsaved reference model
+        instances by (timepoint, report_datetime).
+        """
+        report_datetime = get_utcnow()
+        references_by_visit = {}
+        for index in range(self.visits):
+            timepoint = f'{(index + 1) * 1000}'
+            visit_datetime = report_datetime - relativedelta(days=self.visits - index)
+            references = []
+            for field_name in self.field_names:
+                reference = self.reference_model_cls(
+                    identifier=self.subject_identifier,
+                    timepoint=timepoint,
+                    report_datetime=visit_datetime,
+                    model=self.name,
+                    field_name=field_name)
+                reference.set_value(value=f'{field_name}{index}', internal_type='CharField')
+                references.append(reference)
+            references_by_visit.update({(timepoint, visit_datetime): references})
+        return references_by_visit
@@ -0,0 +1,59 @@
+from django.apps import apps as django_apps
+from django.core.management.base import BaseCommand
+from edc_constants.constants import YES, NO
+from edc_reference.benchmarks import IndexBenchmark
+
+
+class Command(BaseCommand):
+
+    help = ('Times the reference model\'s hot queries and shows their query '
+            'plans on a table of synthetic rows. Rows are rolled back.')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--subjects',
+            dest='subjects',
+            type=int,
+            default=None,
+            help='Number of subjects. Each has 1000 rows (Default: 2000)',
+        )
+
+        parser.add_argument(
+            '--repeat',
+            dest='repeat',
+            type=int,
+            default=None,
+            help='Number of times to run each query (Default: 5)',
+        )
+
+        parser.add_argument(
+            '--reference-model',
+            dest='reference_model',
+            default='edc_reference.reference',
+            help='reference model label_lower (Default: edc_reference.reference)',
+        )
+
+        parser.add_argument(
+            '--keep',
+            dest='keep',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'Keep the synthetic rows (Default: {NO})'),
+        )
+
+    def handle(self, *args, **options):
+        benchmark = IndexBenchmark(
+            reference_model_cls=django_apps.get_model(options.get('reference_model')),
+            subjects=options.get('subjects'),
+            repeat=options.get('repeat'),
+            keep=options.get('keep') == YES,
+            verbose=True)
+        self.stdout.write(f'Benchmarking on {benchmark.rows} rows.\n')
+        for result in benchmark.run():
+            self.stdout.write(
+                f'\n * {result["name"]}: best {result["best"] * 1000:.2f}ms, '
+                f'mean {result["mean"] * 1000:.2f}ms\n')
+            self.stdout.write(f'{result["plan"]}\n')
@@ -1,6 +1,7 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from edc_reference.populater import Populater
+from edc_reference.parallel_populater import ParallelPopulater
+from edc_reference.populater import Populater, PopulaterAttributeError
 from edc_constants.constants import YES, NO
 
 
@@ -46,6 +47,15 @@ class Command(BaseCommand):
             help=(f'Summarize existing data (Default: {NO})'),
         )
 
+        parser.add_argument(
+            '--group-by',
+            dest='group_by',
+            nargs='*',
+            choices=Populater.summary_group_by,
+            default=None,
+            help=('With --summarize, also count by these columns'),
+        )
+
         parser.add_argument(
             '--dry-run',
             dest='dry_run',
@@ -66,6 +76,67 @@ class Command(BaseCommand):
             help=(f'Delete existing data (Default: {NO})'),
         )
 
+        parser.add_argument(
+            '--bulk',
+            dest='bulk',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'Write references in bulk per chunk (Default: {NO})'),
+        )
+
+        parser.add_argument(
+            '--resume',
+            dest='resume',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'Resume from the last checkpoint (Default: {NO})'),
+        )
+
+        parser.add_argument(
+            '--incremental',
+            dest='incremental',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'Only source rows modified since the last incremental run '
+                  f'(Default: {NO})'),
+        )
+
+        parser.add_argument(
+            '--remove-orphans',
+            dest='remove_orphans',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'After a full populate, delete references without a source row '
+                  f'or configured field. Reads all source rows; not with '
+                  f'--incremental (Default: {NO})'),
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=None,
+            help=(f'Number of source model rows per chunk '
+                  f'(Default: {Populater.chunk_size})'),
+        )
+
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=None,
+            help=('Number of worker processes. Partitions the work by '
+                  'reference name and primary key range (Default: 1)'),
+        )
+
     def handle(self, *args, **options):
         names = options.get('names')
         exclude_names = options.get('exclude_names')
@@ -77,13 +148,35 @@ class Command(BaseCommand):
         summarize = None if summarize == NO else YES
         dry_run = options.get('dry_run')
         dry_run = None if dry_run == NO else YES
-        populater = Populater(
-            names=names,
-            exclude_names=exclude_names,
-            skip_existing=skip_existing,
-            delete_existing=delete_existing,
-            dry_run=dry_run)
+        bulk = options.get('bulk')
+        bulk = None if bulk == NO else YES
+        resume = options.get('resume')
+        resume = None if resume == NO else YES
+        incremental = options.get('incremental')
+        incremental = None if incremental == NO else YES
+        remove_orphans = options.get('remove_orphans')
+        remove_orphans = None if remove_orphans == NO else YES
+        opts = {}
+        populater_cls = Populater
+        if (options.get('workers') or 1) > 1:
+            populater_cls = ParallelPopulater
+            opts.update(workers=options.get('workers'))
+        try:
+            populater = populater_cls(
+                names=names,
+                exclude_names=exclude_names,
+                skip_existing=skip_existing,
+                delete_existing=delete_existing,
+                dry_run=dry_run,
+                bulk=bulk,
+                resume=resume,
+                incremental=incremental,
+                remove_orphans=remove_orphans,
+                chunk_size=options.get('chunk_size'),
+                **opts)
+        except PopulaterAttributeError as e:
+            raise CommandError(e)
         if summarize:
-            populater.summarize()
+            populater.summarize(group_by=options.get('group_by'))
         else:
             populater.populate()
@@ -0,0 +1,33 @@
+from django.apps import apps as django_apps
+from django.core.management.base import BaseCommand
+from edc_reference.reference import ReferenceSnapshotUpdater
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the reference snapshot model from the reference model'
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--names',
+            dest='names',
+            nargs='*',
+            default=None,
+            help=(
+                'run for a select list of reference names (label_lower or panel_name)'),
+        )
+
+        parser.add_argument(
+            '--reference-model',
+            dest='reference_model',
+            default='edc_reference.reference',
+            help='reference model label_lower (Default: edc_reference.reference)',
+        )
+
+    def handle(self, *args, **options):
+        reference_model_cls = django_apps.get_model(options.get('reference_model'))
+        created = ReferenceSnapshotUpdater().rebuild(
+            reference_model_cls=reference_model_cls,
+            names=options.get('names'))
+        self.stdout.write(f'Done. Created {created} snapshots.\n')
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from edc_constants.constants import YES, NO
+from edc_reference.reference_verifier import ReferenceVerifier
+
+
+class Command(BaseCommand):
+
+    help = ('Verifies the reference model against the source models and '
+            'optionally repairs the differences')
+
+    def add_arguments(self, parser):
+
+        parser.add_argument(
+            '--names',
+            dest='names',
+            nargs='*',
+            default=None,
+            help=(
+                'run for a select list of reference names (label_lower or panel_name)'),
+        )
+
+        parser.add_argument(
+            '--repair',
+            dest='repair',
+            nargs='?',
+            choices=[YES, NO],
+            const=YES,
+            default=NO,
+            help=(f'Write missing and mismatched and delete extra references '
+                  f'(Default: {NO})'),
+        )
+
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=None,
+            help=(f'Number of rows fetched per chunk '
+                  f'(Default: {ReferenceVerifier.chunk_size})'),
+        )
+
+    def handle(self, *args, **options):
+        verifier = ReferenceVerifier(
+            names=options.get('names'),
+            repair=options.get('repair') == YES,
+            chunk_size=options.get('chunk_size'))
+        summary = verifier.verify()
+        for name, item in summary.items():
+            for sample in item['samples']:
+                self.stdout.write(f'   {name}: {sample}\n')
@@ -1,6 +1,8 @@
 from django.db import models
 from django.core.exceptions import ObjectDoesNotExist
 
+from .reference.reference_prefetch import get_prefetched
+
 
 class ReferenceManager(models.Manager):
 
@@ -27,16 +29,13 @@ class ReferenceManager(models.Manager):
         """Returns an instance of reference model
         for this model on this visit for this field.
         """
-        try:
-            model_obj = self.get(
-                identifier=visit.subject_identifier,
-                model=name,
-                report_datetime=visit.report_datetime,
-                timepoint=visit.visit_code,
-                field_name=field_name)
-        except ObjectDoesNotExist:
-            model_obj = None
-        return model_obj
+        opts = dict(
+            identifier=visit.subject_identifier,
+            model=name,
+            report_datetime=visit.report_datetime,
+            timepoint=visit.visit_code,
+            field_name=field_name)
+        return self.get_for_visit(**opts)
 
     def get_requisition_for_visit(self, name=None, visit=None):
         """Returns an instance of reference model
@@ -48,8 +47,33 @@ class ReferenceManager(models.Manager):
             report_datetime=visit.report_datetime,
             timepoint=visit.visit_code,
             field_name='panel')
+        return self.get_for_visit(**opts)
+
+    def get_for_visit(self, **opts):
+        """Returns an instance of reference model from an active
+        `ReferencePrefetch` scope or the database, or None.
+        """
+        references = get_prefetched(reference_model_cls=self.model, **opts)
+        if references is not None:
+            return references[0] if references else None
         try:
             model_obj = self.get(**opts)
         except ObjectDoesNotExist:
             model_obj = None
         return model_obj
+
+
+class ReferenceSnapshotManager(models.Manager):
+
+    def get_by_natural_key(self, identifier, timepoint, model, report_datetime):
+        return self.get(identifier=identifier, timepoint=timepoint, model=model,
+                        report_datetime=report_datetime)
+
+    def get_references(self, **options):
+        """Returns a list of `SnapshotReference` tuples for the
+        snapshots matching options or None if there are none.
+        """
+        references = []
+        for snapshot in self.filter(**options):
+            references.extend(snapshot.references())
+        return references or None
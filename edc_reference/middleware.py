@@ -0,0 +1,35 @@
+from .reference import ReferencePrefetch
+
+
+class ReferencePrefetchMiddleware:
+
+    """Prefetches the references for the subject, and visit if
+    given, in the view's URL kwargs for the life of the request.
+
+    Add to MIDDLEWARE after authentication:
+
+        'edc_reference.middleware.ReferencePrefetchMiddleware'
+    """
+
+    prefetch_cls = ReferencePrefetch
+    subject_identifier_kwarg = 'subject_identifier'
+    timepoint_kwarg = 'visit_code'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            prefetch = getattr(request, 'reference_prefetch', None)
+            if prefetch:
+                prefetch.__exit__(None, None, None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        subject_identifier = view_kwargs.get(self.subject_identifier_kwarg)
+        if subject_identifier:
+            request.reference_prefetch = self.prefetch_cls(
+                subject_identifier=subject_identifier,
+                timepoint=view_kwargs.get(self.timepoint_kwarg)).__enter__()
+        return None
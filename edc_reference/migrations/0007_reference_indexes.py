@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_reference', '0006_referencesnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='reference',
+            index_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='reference',
+            name='edc_referen_identif_351847_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reference',
+            name='edc_referen_report__69deaa_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reference',
+            index=models.Index(fields=['identifier', 'model', 'field_name', 'timepoint'], name='edc_referen_identif_41946f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reference',
+            index=models.Index(fields=['model', 'field_name'], name='edc_referen_model_3615db_idx'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_reference', '0007_reference_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='populatercheckpoint',
+            name='high_water_mark',
+            field=models.DateTimeField(help_text='Start of the last incremental run', null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_reference', '0008_populatercheckpoint_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='referencesnapshot',
+            unique_together={('identifier', 'timepoint', 'model', 'report_datetime')},
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edc_reference', '0009_referencesnapshot_report_datetime'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reference',
+            name='edc_referen_identif_6df120_idx',
+        ),
+        migrations.AddIndex(
+            model_name='reference',
+            index=models.Index(fields=['identifier', 'timepoint', 'model'], include=['id', 'report_datetime', 'field_name', 'datatype', 'value_str', 'value_int', 'value_date', 'value_datetime', 'value_uuid'], name='edc_reference_refset_idx'),
+        ),
+    ]
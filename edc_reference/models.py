@@ -1,8 +1,25 @@
+import json
+
+from collections import namedtuple
+from datetime import date, datetime
+from uuid import UUID
 from django.db import models
+from django.utils.dateparse import parse_date, parse_datetime
 from edc_base.model_mixins import BaseUuidModel
 from edc_base.sites import CurrentSiteManager, SiteModelMixin
 
-from .managers import ReferenceManager
+from .managers import ReferenceManager, ReferenceSnapshotManager
+
+
+SnapshotReference = namedtuple(
+    'SnapshotReference',
+    'identifier timepoint report_datetime model field_name datatype value')
+
+# the columns a Refset reads from the database, included in its
+# index so that, on PostgreSQL, the read is an index-only scan.
+REFSET_FIELDS = [
+    'id', 'report_datetime', 'field_name', 'datatype', 'value_str',
+    'value_int', 'value_date', 'value_datetime', 'value_uuid']
 
 
 class ReferenceFieldDatatypeNotFound(Exception):
@@ -39,6 +56,8 @@ class Reference(SiteModelMixin, BaseUuidModel):
 
     objects = ReferenceManager()
 
+    refset_fields = REFSET_FIELDS
+
     def __str__(self):
         return (f'{self.identifier}@{self.timepoint} {self.model}.'
                 f'{self.field_name}={self.value}')
@@ -48,36 +67,55 @@ class Reference(SiteModelMixin, BaseUuidModel):
                 self.model, self.field_name)
     natural_key.dependencies = ['sites.Site']
 
-    def update_value(self, value=None, internal_type=None, field=None, related_name=None):
+    @classmethod
+    def get_value_fields(cls):
+        """Returns a dictionary of value field names by datatype,
+        e.g. {'CharField': 'value_str', ...}.
+        """
+        if '_value_fields' not in cls.__dict__:
+            cls._value_fields = {
+                fld.get_internal_type(): fld.name
+                for fld in cls._meta.get_fields()
+                if fld.name.startswith('value')}
+        return cls._value_fields
+
+    def update_value(self, value=None, internal_type=None, field=None,
+                     related_name=None, value_field=None):
         """Updates the correct `value` field based on the
         field class datatype.
         """
+        self.set_value(
+            value=value, internal_type=internal_type, field=field,
+            related_name=related_name, value_field=value_field)
+        self.save()
+
+    def set_value(self, value=None, internal_type=None, field=None,
+                  related_name=None, value_field=None):
+        """Sets the correct `value` field based on the field class
+        datatype without saving.
+
+        If `value_field` is not given it is looked up by datatype.
+
+        See also `update_value`.
+        """
         internal_type = internal_type or field.get_internal_type()
         if internal_type in ['ForeignKey', 'OneToOneField']:
             self.datatype = 'UUIDField'
         else:
             self.datatype = internal_type
-        update = None
-        value_fields = [fld for fld in self._meta.get_fields()
-                        if fld.name.startswith('value')]
-        for fld in value_fields:
-            if fld.name.startswith('value'):  # e.g. value_str, value_int, etc
-                if fld.get_internal_type() == self.datatype:
-                    update = (fld.name, value)
-                    break
-        if update:
+        value_fields = self.get_value_fields()
+        value_field = value_field or value_fields.get(self.datatype)
+        if value_field:
             self.related_name = related_name
-            setattr(self, *update)
-            for fld in value_fields:
-                if fld.name != update[0]:
-                    setattr(self, fld.name, None)
+            for name in value_fields.values():
+                setattr(self, name, None)
+            setattr(self, value_field, value)
         else:
             raise ReferenceFieldDatatypeNotFound(
                 f'Reference field internal_type not found. Got \'{self.datatype}\'. '
                 f'model={self.model}.{self.field_name} '
                 f'Expected a django.models.field internal type like \'CharField\', '
                 '\'DateTimeField\', etc.')
-        self.save()
 
     @property
     def value(self):
@@ -89,14 +127,126 @@ class Reference(SiteModelMixin, BaseUuidModel):
         return value
 
     class Meta:
+        # the unique index also serves lookups on the natural key
+        # and on its leading columns, e.g. ReferenceUpdater and
+        # the manager's visit lookups.
         unique_together = ['identifier', 'timepoint',
                            'report_datetime', 'model', 'field_name']
-        index_together = ['identifier', 'timepoint',
-                          'report_datetime', 'model', 'field_name']
         ordering = ('identifier', 'report_datetime')
         indexes = [
-            models.Index(fields=['identifier', 'timepoint', 'model']),
+            # Refset, covering on PostgreSQL; INCLUDE is ignored
+            # by other backends.
+            models.Index(
+                fields=['identifier', 'timepoint', 'model'],
+                include=REFSET_FIELDS, name='edc_reference_refset_idx'),
+            # LongitudinalRefset, visit and crf references
             models.Index(
-                fields=['identifier', 'report_datetime', 'timepoint', 'model']),
-            models.Index(fields=['report_datetime', 'timepoint']),
+                fields=['identifier', 'model', 'field_name', 'timepoint']),
+            # Populater, filter(model=name)
+            models.Index(fields=['model', 'field_name']),
+        ]
+
+
+class PopulaterCheckpoint(BaseUuidModel):
+
+    """A model to record the progress of the `Populater` for
+    each reference name so that an interrupted run can be resumed.
+
+    See `Populater`.
+    """
+
+    name = models.CharField(max_length=250, unique=True)
+
+    last_pk = models.CharField(max_length=50, null=True)
+
+    rows = models.IntegerField(default=0)
+
+    done_datetime = models.DateTimeField(null=True)
+
+    high_water_mark = models.DateTimeField(
+        null=True,
+        help_text='Start of the last incremental run')
+
+    def __str__(self):
+        return f'{self.name} {self.rows} rows done={self.done_datetime}'
+
+    class Meta:
+        ordering = ('name', )
+
+
+class ReferenceSnapshot(BaseUuidModel):
+
+    """A model of one row per (identifier, timepoint,
+    report_datetime, model), the natural key of `Reference` less
+    field_name, with the values of all reference fields in a JSON
+    `payload`.
+
+    Maintained by the reference updaters and deleters if
+    `EDC_REFERENCE_SNAPSHOT` is True. See `ReferenceSnapshotUpdater`.
+    """
+
+    identifier = models.CharField(max_length=50)
+
+    timepoint = models.CharField(max_length=50)
+
+    report_datetime = models.DateTimeField()
+
+    model = models.CharField(max_length=250)
+
+    payload = models.TextField(default='{}')
+
+    objects = ReferenceSnapshotManager()
+
+    def __str__(self):
+        return f'{self.identifier}@{self.timepoint} {self.model}'
+
+    def natural_key(self):
+        return (self.identifier, self.timepoint, self.model, self.report_datetime)
+
+    def set_values(self, references=None):
+        """Sets the payload from a list of reference model
+        instances.
+        """
+        payload = {}
+        for reference in references:
+            value = reference.value
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            elif isinstance(value, UUID):
+                value = str(value)
+            payload[reference.field_name] = [reference.datatype, value]
+        self.payload = json.dumps(payload, sort_keys=True)
+
+    def get_values(self):
+        """Returns a dictionary of field_name: (datatype, value)
+        from the payload.
+        """
+        values = {}
+        for field_name, (datatype, value) in json.loads(self.payload).items():
+            if value is not None:
+                if datatype == 'DateTimeField':
+                    value = parse_datetime(value)
+                elif datatype == 'DateField':
+                    value = parse_date(value)
+                elif datatype == 'UUIDField':
+                    value = UUID(value)
+            values[field_name] = (datatype, value)
+        return values
+
+    def references(self):
+        """Returns a list of `SnapshotReference` tuples, one per
+        field, with the attributes read by `Refset`.
+        """
+        return [
+            SnapshotReference(
+                self.identifier, self.timepoint, self.report_datetime,
+                self.model, field_name, datatype, value)
+            for field_name, (datatype, value) in self.get_values().items()]
+
+    class Meta:
+        # report_datetime last; Refset looks up the leading columns
+        unique_together = ['identifier', 'timepoint', 'model', 'report_datetime']
+        ordering = ('identifier', 'report_datetime')
+        indexes = [
+            models.Index(fields=['identifier', 'model']),
         ]
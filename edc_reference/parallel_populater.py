@@ -0,0 +1,140 @@
+import arrow
+import django
+import multiprocessing
+import sys
+
+from collections import Counter
+from django.apps import apps as django_apps
+from django.db import connections
+from edc_base.utils import get_utcnow
+
+from .populater import Populater, DryRunDummy
+
+
+def init_worker():
+    """Initializes a worker process.
+
+    Closes connections inherited from the parent so that each
+    worker opens its own database connection.
+    """
+    if not django_apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def populate_partition(task):
+    """Populates one partition (name, lower_pk, upper_pk) in a
+    worker process and returns (name, rows).
+    """
+    populater_cls, options, name, lower_pk, upper_pk = task
+    populater = populater_cls(names=[name], **options)
+    if populater.dry_run:
+        populater.reference_updater_cls = DryRunDummy
+    rows = populater.populate_range(
+        name=name, lower_pk=lower_pk, upper_pk=upper_pk)
+    return name, rows
+
+
+class ParallelPopulater(Populater):
+
+    """Populates the reference model using a pool of `workers`
+    processes.
+
+    Work is partitioned by reference name and, for source models
+    with more than `partition_size` rows, by primary key range.
+    Each worker uses its own database connection. Progress is
+    reported by the parent process as partitions complete.
+
+    A reference name's checkpoint is marked done once all of its
+    partitions complete, so `resume` skips completed names.
+    """
+
+    populater_cls = Populater
+    partition_size = 10000
+
+    def __init__(self, workers=None, partition_size=None, **kwargs):
+        super().__init__(**kwargs)
+        self.workers = workers or 1
+        self.partition_size = partition_size or self.partition_size
+
+    @property
+    def options(self):
+        """Returns the options passed to the populater in each
+        worker.
+        """
+        return dict(dry_run=self.dry_run, bulk=self.bulk,
+                    chunk_size=self.chunk_size)
+
+    def populate_names(self, names=None):
+        if self.incremental:
+            # modified rows are few; no need to partition
+            return super().populate_names(names=names)
+        sys.stdout.write(f' - running with {self.workers} workers.\n')
+        tasks = []
+        totals = Counter()
+        partitions = Counter()
+        for name in names:
+            checkpoint = self.get_checkpoint(name=name)
+            if checkpoint and checkpoint.done_datetime:
+                sys.stdout.write(
+                    f' * {name} {checkpoint.rows} . OK  (checkpoint)      \n')
+                continue
+            totals[name] = self.get_queryset(name=name).count()
+            for lower_pk, upper_pk in self.partitions(name=name):
+                partitions[name] += 1
+                tasks.append((self.populater_cls, self.options,
+                              name, lower_pk, upper_pk))
+        sys.stdout.write(
+            f' * {len(tasks)} partitions for {len(totals)} reference names.\n')
+        start_time = arrow.utcnow().to('Africa/Gaborone').datetime
+        rows = Counter()
+        done = Counter()
+        for name, count in self.run(tasks=tasks):
+            rows[name] += count
+            done[name] += 1
+            tdelta = arrow.utcnow().to('Africa/Gaborone').datetime - start_time
+            sys.stdout.write(
+                f' * {name} {done[name]}/{partitions[name]} partitions, '
+                f'{rows[name]} / {totals[name]} ... {str(tdelta)}\n')
+            if done[name] == partitions[name]:
+                self.update_checkpoint(name=name, rows=rows[name])
+        if self.remove_orphans:
+            for name in names:
+                self.delete_orphans(name=name)
+
+    def run(self, tasks=None):
+        """Yields (name, rows) for each completed task.
+
+        Runs tasks in this process if there is only one worker.
+        """
+        if self.workers == 1:
+            for task in tasks:
+                yield populate_partition(task)
+        else:
+            connections.close_all()
+            with multiprocessing.Pool(
+                    processes=self.workers, initializer=init_worker) as pool:
+                for result in pool.imap_unordered(populate_partition, tasks):
+                    yield result
+
+    def partitions(self, name=None):
+        """Returns a list of (lower_pk, upper_pk) primary key
+        bounds for this name where lower_pk < pk <= upper_pk.
+
+        A bound of None is open.
+        """
+        qs = self.get_queryset(name=name).order_by('pk')
+        total = qs.count()
+        size = max(self.partition_size, -(-total // self.workers))
+        bounds = [None]
+        for offset in range(size, total, size):
+            bounds.append(qs.values_list('pk', flat=True)[offset - 1])
+        bounds.append(None)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def update_checkpoint(self, name=None, rows=None):
+        if not self.dry_run:
+            checkpoint = self.get_checkpoint(name=name)
+            checkpoint.rows = rows
+            checkpoint.done_datetime = get_utcnow()
+            checkpoint.save()
@@ -1,10 +1,14 @@
 import arrow
 import sys
 
+from datetime import timedelta
 from django.apps import apps as django_apps
+from django.db.models import Count, Q
+from edc_base.utils import get_utcnow
 from edc_reference.models import Reference
 
-from .reference import ReferenceUpdater
+from .reference import BulkReferenceDeleter, BulkReferenceUpdater, BulkReferenceWriter
+from .reference import ReferenceUpdater, invalidate_references, reference_snapshot_updater
 from .site import site_reference_configs
 
 
@@ -19,12 +23,62 @@ class DryRunDummy:
 
 class Populater:
 
+    """Populates the reference model for the registered reference
+    names.
+
+    Source model rows are read in keyset-paginated chunks of
+    `chunk_size` ordered by primary key. A checkpoint is saved per
+    reference name after each chunk so that, if `resume`=True, an
+    interrupted run continues from the last chunk written.
+
+    If `bulk`=True, the references for each chunk are built in
+    memory and written with `BulkReferenceWriter` instead of
+    calling `reference_updater_cls` per row.
+
+    If `incremental`=True, only source rows created or modified
+    since the high-water mark saved on the checkpoint by the
+    previous incremental run are processed. `delete_existing` is
+    not combined with `incremental`; it would leave only the
+    references of the modified rows.
+
+    If `remove_orphans`=True, references that no longer match a
+    source row or a configured field are deleted after a full
+    populate. Finding orphans reads every source row of the name,
+    so it is not combined with `incremental`; use
+    `ReferenceVerifier` with `repair`=True on its own schedule
+    instead.
+    """
+
     reference_updater_cls = ReferenceUpdater
+    bulk_reference_updater_cls = BulkReferenceUpdater
+    bulk_reference_writer_cls = BulkReferenceWriter
+    bulk_reference_deleter_cls = BulkReferenceDeleter
+    checkpoint_model = 'edc_reference.populatercheckpoint'
+    chunk_size = 500
+    summary_group_by = ['datatype', 'site']
+    # re-read rows modified shortly before the high-water mark to
+    # include transactions not yet committed when it was taken
+    high_water_mark_overlap = timedelta(minutes=5)
 
     def __init__(self, names=None, exclude_names=None, skip_existing=None,
-                 dry_run=None, delete_existing=None):
+                 dry_run=None, delete_existing=None, bulk=None, resume=None,
+                 chunk_size=None, incremental=None, remove_orphans=None):
         self.skip_existing = skip_existing
         self.delete_existing = delete_existing
+        self.bulk = bulk
+        self.resume = resume
+        self.incremental = incremental
+        self.remove_orphans = remove_orphans
+        if self.incremental and self.remove_orphans:
+            raise PopulaterAttributeError(
+                'Invalid options. remove_orphans reads all source rows and '
+                'cannot be combined with incremental. Use verify_references '
+                '--repair instead.')
+        if self.incremental and self.delete_existing:
+            raise PopulaterAttributeError(
+                'Invalid options. delete_existing deletes all references of '
+                'each name and cannot be combined with incremental.')
+        self.chunk_size = chunk_size or self.chunk_size
         if not names:
             names = list(site_reference_configs.registry)
         if not exclude_names:
@@ -32,14 +86,127 @@ class Populater:
         exclude_names = [n.strip() for n in exclude_names]
         self.names = [n.strip() for n in names if n not in exclude_names]
         self.dry_run = dry_run
+        self._existing_names = None
 
-    def summarize(self):
-        for name in self.names:
-            reference_model = site_reference_configs.get_reference_model(
-                name=name)
+    @property
+    def checkpoint_model_cls(self):
+        return django_apps.get_model(self.checkpoint_model)
+
+    def summarize(self, group_by=None):
+        """Writes and returns the summary from `get_summary`.
+        """
+        summary = self.get_summary(group_by=group_by)
+        for name, item in summary.items():
+            if not item['registered']:
+                sys.stdout.write(
+                    f' * {name}: {item["references"]} records, not registered\n')
+                continue
+            sys.stdout.write(
+                f' * {name}: {item["references"]} records, '
+                f'{item["source_rows"]} source rows, '
+                f'coverage {item["coverage"]:.1%}, net missing {item["missing"]}, '
+                f'net orphans {item["orphans"]}\n')
+            for group in item['groups']:
+                attrs = ', '.join(
+                    f'{k}={v}' for k, v in group.items() if k not in ['model', 'count'])
+                sys.stdout.write(f'     - {attrs}: {group["count"]}\n')
+        return summary
+
+    def get_summary(self, group_by=None):
+        """Returns a dictionary by reference name of reference
+        counts, source model row counts, coverage and missing and
+        orphan reference rows.
+
+        References are counted with one GROUP BY model, field_name
+        query per reference model, and source rows with one count
+        per source model. `group_by` adds any of `summary_group_by`
+        to the GROUP BY.
+
+        `missing` and `orphans` are net estimates from the counts,
+        not per row: for each field, `missing` is the shortfall of
+        references against source rows and `orphans` the excess,
+        plus all references for fields not in the config. A missing
+        reference and an orphan for the same field cancel out; use
+        `ReferenceVerifier` to compare row by row. Reference names
+        in the table that are not registered are included with
+        `registered`=False.
+        """
+        group_by = group_by or []
+        for attr in group_by:
+            if attr not in self.summary_group_by:
+                raise PopulaterAttributeError(
+                    f'Invalid group_by. Expected one of {self.summary_group_by}. '
+                    f'Got {attr}.')
+        source_counts = self.get_source_counts(names=self.names)
+        groups_by_name = {}
+        reference_models = {
+            site_reference_configs.get_reference_model(name=name) for name in self.names}
+        for reference_model in reference_models:
             reference_model_cls = django_apps.get_model(reference_model)
-            count = reference_model_cls.objects.filter(model=name).count()
-            sys.stdout.write(f' * {name}: {count} records\n')
+            for group in reference_model_cls.objects.values(
+                    'model', 'field_name', *group_by).annotate(
+                        count=Count('pk')).order_by('model', 'field_name', *group_by):
+                groups_by_name.setdefault(group['model'], []).append(group)
+        summary = {}
+        for name in self.names:
+            summary.update({name: self.summarize_name(
+                name=name, source_rows=source_counts.get(name, 0),
+                groups=groups_by_name.pop(name, []))})
+        for name, groups in groups_by_name.items():
+            if name not in site_reference_configs.registry:
+                summary.update({name: dict(
+                    registered=False, groups=groups,
+                    references=sum(group['count'] for group in groups))})
+        return summary
+
+    def summarize_name(self, name=None, source_rows=None, groups=None):
+        fields = site_reference_configs.get_fields(name=name)
+        counts = dict.fromkeys(fields, 0)
+        orphans = 0
+        for group in groups:
+            if group['field_name'] in counts:
+                counts[group['field_name']] += group['count']
+            else:
+                orphans += group['count']
+        missing = sum(max(source_rows - count, 0) for count in counts.values())
+        orphans += sum(max(count - source_rows, 0) for count in counts.values())
+        expected = source_rows * len(fields)
+        return dict(
+            registered=True,
+            references=sum(group['count'] for group in groups),
+            source_rows=source_rows,
+            expected=expected,
+            coverage=(expected - missing) / expected if expected else 1.0,
+            missing=missing,
+            orphans=orphans,
+            groups=groups)
+
+    def get_source_counts(self, names=None):
+        """Returns a dictionary of source model row counts by
+        reference name; one count per source model.
+
+        Requisition panels are counted with one GROUP BY panel.
+        """
+        names_by_model = {}
+        for name in names:
+            names_by_model.setdefault('.'.join(name.split('.')[:2]), []).append(name)
+        counts = {}
+        for model, model_names in names_by_model.items():
+            model_cls = django_apps.get_model(model)
+            if all(name == model for name in model_names):
+                counts.update({model: model_cls.objects.count()})
+            else:
+                panel_counts = dict(
+                    model_cls.objects.values_list('panel__name').annotate(
+                        count=Count('pk')).order_by())
+                for name in model_names:
+                    try:
+                        panel_name = name.split('.')[2]
+                    except IndexError:
+                        counts.update({name: sum(panel_counts.values())})
+                    else:
+                        counts.update({name: panel_counts.get(panel_name, 0)})
+        return counts
 
     def populate(self):
         if self.dry_run:
@@ -54,6 +221,17 @@ class Populater:
         if self.skip_existing:
             sys.stdout.write(
                 ' - skipping reference names with existing references\n')
+        if self.bulk:
+            sys.stdout.write(
+                f' - writing in bulk, chunks of {self.chunk_size}.\n')
+        if self.resume:
+            sys.stdout.write(
+                ' - resuming from last checkpoint, if any\n')
+        if self.incremental:
+            sys.stdout.write(
+                ' - incremental, rows modified since the last run only\n')
+        if self.remove_orphans:
+            sys.stdout.write(' - removing orphaned references\n')
         if self.dry_run:
             sys.stdout.write(
                 ' - This is a dry run. No data will be created/modified.\n')
@@ -68,36 +246,270 @@ class Populater:
         if self.delete_existing:
             sys.stdout.write(' * deleting existing records ... \r')
             if not self.dry_run:
-                for name in names:
-                    Reference.objects.filter(model=name).delete()
+                self.delete_references(
+                    names=[name for name in names if not self.resuming(name=name)])
             sys.stdout.write(' * deleting existing records ... done.\n')
 
+        self.populate_names(names=names)
+        t_end = arrow.utcnow().to('Africa/Gaborone').strftime('%H:%M')
+        sys.stdout.write(f'Done. Ended: {t_end}\n')
+
+    def delete_references(self, names=None):
+        """Deletes the references and snapshots of these names.
+        """
         for name in names:
-            index = 0
-            sys.stdout.write(f' * {name}           \r')
-            model_cls = django_apps.get_model('.'.join(name.split('.')[:2]))
-            qs = model_cls.objects.all()
-            total = qs.count()
-            sub_start_time = arrow.utcnow().to('Africa/Gaborone').datetime
-            for index, model_obj in enumerate(qs):
-                index += 1
-                sub_end_time = arrow.utcnow().to('Africa/Gaborone').datetime
-                tdelta = sub_end_time - sub_start_time
-                sys.stdout.write(
-                    f' * {name} {index} / {total} ... {str(tdelta)}    \r')
-                self.reference_updater_cls(model_obj=model_obj)
+            Reference.objects.filter(model=name).delete()
+            if reference_snapshot_updater.enabled:
+                reference_snapshot_updater.snapshot_model_cls.objects.filter(
+                    model=name).delete()
+
+    def populate_names(self, names=None):
+        for name in names:
+            if self.incremental:
+                self.populate_incremental(name=name)
+            else:
+                self.populate_name(name=name)
+            if self.remove_orphans:
+                self.delete_orphans(name=name)
+
+    def populate_incremental(self, name=None):
+        """Populates the reference model for source rows of this
+        name created or modified since the high-water mark, or
+        all if there is none, and saves the new high-water mark.
+
+        Returns the number of source rows processed.
+        """
+        started = get_utcnow()
+        checkpoint = self.checkpoint_model_cls.objects.filter(name=name).first()
+        high_water_mark = checkpoint.high_water_mark if checkpoint else None
+        qs = self.get_queryset(name=name)
+        if high_water_mark:
+            qs = qs.filter(self.get_modified_q(
+                name=name, since=high_water_mark - self.high_water_mark_overlap))
+        rows = 0
+        for chunk in self.chunks(queryset=qs):
+            self.populate_chunk(name=name, model_objs=chunk)
+            rows += len(chunk)
+        if not self.dry_run:
+            self.checkpoint_model_cls.objects.update_or_create(
+                name=name, defaults=dict(high_water_mark=started))
+        sys.stdout.write(
+            f' * {name} {rows} modified since {high_water_mark} . OK      \n')
+        return rows
+
+    def get_modified_q(self, name=None, since=None):
+        """Returns a Q for source rows modified after `since` or
+        related to a modified row of another registered model,
+        e.g. a CRF of a modified visit.
+        """
+        model_cls = django_apps.get_model('.'.join(name.split('.')[:2]))
+        registry = site_reference_configs.registry
+        q = Q(modified__gt=since)
+        for fld in model_cls._meta.concrete_fields:
+            if ((fld.many_to_one or fld.one_to_one)
+                    and fld.related_model._meta.label_lower in registry):
+                q |= Q(**{f'{fld.name}__modified__gt': since})
+        return q
+
+    def delete_orphans(self, name=None):
+        """Deletes references of this name for fields not in the
+        config or that do not match the identifier, timepoint and
+        report_datetime of a source row.
+
+        This is a full scan of the source rows of this name.
+
+        Returns the number of orphaned references found.
+        """
+        reference_model = site_reference_configs.get_reference_model(name=name)
+        reference_model_cls = django_apps.get_model(reference_model)
+        references = reference_model_cls.objects.filter(model=name)
+        fields = site_reference_configs.get_fields(name=name)
+        stale = references.exclude(field_name__in=fields)
+        stale_groups = set(
+            stale.values_list('identifier', 'timepoint').order_by().distinct())
+        found = stale.count()
+        counts = {
+            (identifier, timepoint, report_datetime): count
+            for identifier, timepoint, report_datetime, count in references.filter(
+                field_name__in=fields).values_list(
+                'identifier', 'timepoint', 'report_datetime').annotate(
+                    count=Count('pk')).order_by()}
+        updater = self.bulk_reference_updater_cls()
+        source_keys = set()
+        # paged by primary key; QuerySet.iterator() does not stream on MySQL
+        for chunk in self.chunks(queryset=self.get_queryset(name=name)):
+            for model_obj in chunk:
+                options = updater.get_options(model_obj=model_obj)
+                source_keys.add((options.get('identifier'), options.get('timepoint'),
+                                 options.get('report_datetime')))
+        orphan_keys = set(counts) - source_keys
+        found += sum(counts[key] for key in orphan_keys)
+        if not self.dry_run:
+            stale.delete()
+            if reference_snapshot_updater.enabled:
+                reference_snapshot_updater.refresh(
+                    reference_model_cls=reference_model_cls,
+                    groups=[(*group, name) for group in stale_groups])
+            for identifier, timepoint in stale_groups:
+                invalidate_references(identifier=identifier, timepoint=timepoint, model=name)
+            self.bulk_reference_deleter_cls().delete_keys(
+                keys=[(reference_model, *key, name) for key in orphan_keys])
+        sys.stdout.write(f' * {name} {found} orphaned references . OK      \n')
+        return found
+
+    def populate_name(self, name=None):
+        """Populates the reference model for one reference name,
+        one chunk at a time.
+        """
+        sys.stdout.write(f' * {name}           \r')
+        checkpoint = self.get_checkpoint(name=name)
+        if checkpoint and checkpoint.done_datetime:
+            sys.stdout.write(
+                f' * {name} {checkpoint.rows} . OK  (checkpoint)      \n')
+            return
+        index = checkpoint.rows if checkpoint else 0
+        last_pk = checkpoint.last_pk if checkpoint else None
+        qs = self.get_queryset(name=name)
+        total = qs.count()
+        sub_start_time = arrow.utcnow().to('Africa/Gaborone').datetime
+        for chunk in self.chunks(queryset=qs, last_pk=last_pk):
+            self.populate_chunk(name=name, model_objs=chunk)
+            index += len(chunk)
+            if checkpoint:
+                checkpoint.last_pk = str(chunk[-1].pk)
+                checkpoint.rows = index
+                checkpoint.save()
             sub_end_time = arrow.utcnow().to('Africa/Gaborone').datetime
             tdelta = sub_end_time - sub_start_time
             sys.stdout.write(
-                f' * {name} {index} / {total} . OK  in {str(tdelta)}      \n')
-        t_end = arrow.utcnow().to('Africa/Gaborone').strftime('%H:%M')
-        sys.stdout.write(f'Done. Ended: {t_end}\n')
+                f' * {name} {index} / {total} ... {str(tdelta)}    \r')
+        if checkpoint:
+            checkpoint.done_datetime = get_utcnow()
+            checkpoint.save()
+        sub_end_time = arrow.utcnow().to('Africa/Gaborone').datetime
+        tdelta = sub_end_time - sub_start_time
+        sys.stdout.write(
+            f' * {name} {index} / {total} . OK  in {str(tdelta)}      \n')
+
+    def populate_range(self, name=None, lower_pk=None, upper_pk=None):
+        """Populates the reference model for one reference name
+        for source rows where lower_pk < pk <= upper_pk.
+
+        Returns the number of source rows processed.
+
+        Bounds of None are open. No checkpoint is saved.
+        """
+        rows = 0
+        qs = self.get_queryset(name=name)
+        for chunk in self.chunks(queryset=qs, last_pk=lower_pk, upper_pk=upper_pk):
+            self.populate_chunk(name=name, model_objs=chunk)
+            rows += len(chunk)
+        return rows
+
+    def populate_chunk(self, name=None, model_objs=None):
+        if self.bulk:
+            self.bulk_update(name=name, model_objs=model_objs)
+        else:
+            for model_obj in model_objs:
+                self.reference_updater_cls(model_obj=model_obj)
+
+    def get_queryset(self, name=None):
+        """Returns a queryset of source model instances for this
+        reference name with forward relations selected.
+
+        For requisitions, the name includes the panel name.
+        """
+        model_cls = django_apps.get_model('.'.join(name.split('.')[:2]))
+        qs = model_cls.objects.all()
+        try:
+            panel_name = name.split('.')[2]
+        except IndexError:
+            pass
+        else:
+            qs = qs.filter(panel__name=panel_name)
+        related = [fld.name for fld in model_cls._meta.concrete_fields
+                   if fld.many_to_one or fld.one_to_one]
+        return qs.select_related(*related)
+
+    def chunks(self, queryset=None, last_pk=None, upper_pk=None):
+        """Yields lists of model instances using keyset pagination
+        on the primary key.
+        """
+        queryset = queryset.order_by('pk')
+        if upper_pk is not None:
+            queryset = queryset.filter(pk__lte=upper_pk)
+        while True:
+            qs = queryset
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            chunk = list(qs[:self.chunk_size])
+            if not chunk:
+                break
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def bulk_update(self, name=None, model_objs=None):
+        """Builds the reference model instances for a chunk of
+        model instances and writes them in bulk.
+        """
+        reference_model_cls = django_apps.get_model(
+            site_reference_configs.get_reference_model(name=name))
+        updater = self.bulk_reference_updater_cls()
+        references = []
+        for model_obj in model_objs:
+            references.extend(updater.get_references(
+                model_obj=model_obj, reference_model_cls=reference_model_cls))
+        if not self.dry_run:
+            writer = self.bulk_reference_writer_cls(
+                reference_model_cls=reference_model_cls)
+            writer.write(references=references)
+
+    def get_checkpoint(self, name=None):
+        """Returns the checkpoint model instance for this name
+        or None if this is a dry run.
+
+        If not resuming, the checkpoint is reset.
+        """
+        if self.dry_run:
+            return None
+        checkpoint, _ = self.checkpoint_model_cls.objects.get_or_create(
+            name=name)
+        if not self.resume:
+            checkpoint.last_pk = None
+            checkpoint.rows = 0
+            checkpoint.done_datetime = None
+            checkpoint.save()
+        return checkpoint
+
+    def resuming(self, name=None):
+        """Returns True if resuming and a checkpoint exists with
+        progress for this name.
+        """
+        if self.resume:
+            return self.checkpoint_model_cls.objects.filter(
+                name=name, rows__gt=0).exists()
+        return False
 
     def skip(self, name=None):
-        if self.skip_existing:
-            reference_model = site_reference_configs.get_reference_model(
-                name=name)
-            reference_model_cls = django_apps.get_model(
-                reference_model)
-            return reference_model_cls.objects.filter(model=name).exists()
+        if self.skip_existing and not self.resuming(name=name):
+            return name in self.existing_names
         return False
+
+    @property
+    def existing_names(self):
+        """Returns the set of selected reference names with
+        references; one DISTINCT query per reference model.
+        """
+        if self._existing_names is None:
+            self._existing_names = set()
+            names_by_reference_model = {}
+            for name in self.names:
+                names_by_reference_model.setdefault(
+                    site_reference_configs.get_reference_model(name=name),
+                    []).append(name)
+            for reference_model, names in names_by_reference_model.items():
+                reference_model_cls = django_apps.get_model(reference_model)
+                self._existing_names.update(
+                    reference_model_cls.objects.filter(model__in=names).values_list(
+                        'model', flat=True).order_by().distinct())
+        return self._existing_names
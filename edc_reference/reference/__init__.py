@@ -1,3 +1,13 @@
+from .bulk_reference_deleter import BulkReferenceDeleter, DeferredReferenceDeleter
+from .bulk_reference_updater import BulkReferenceUpdater
+from .bulk_reference_writer import BulkReferenceWriter
+from .deferred_reference_updater import DeferredReferenceUpdater
+from .instrumentation import ReferenceInstrumentation, Measurement, log_measurement
+from .instrumentation import reference_instrumentation, reference_operation
+from .reference_cache import ReferenceCache, invalidate_references, reference_cache
 from .reference_deleter import ReferenceDeleter
 from .reference_getter import ReferenceGetter, ReferenceObjectDoesNotExist
+from .reference_prefetch import ReferencePrefetch, get_prefetched
+from .reference_snapshot_updater import ReferenceSnapshotUpdater, reference_snapshot_updater
 from .reference_updater import ReferenceUpdater, ReferenceFieldNotFound
+from .shared_reference_cache import SharedReferenceCache, shared_reference_cache
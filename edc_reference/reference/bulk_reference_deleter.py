@@ -0,0 +1,161 @@
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models import Q
+
+from ..site import site_reference_configs
+from .pending import get_pending
+from .reference_cache import invalidate_references
+from .reference_snapshot_updater import reference_snapshot_updater
+
+
+class BulkReferenceDeleter:
+
+    """A class to delete the reference model instances for many
+    model instances, or for a subject, in a few set-based
+    DELETEs.
+
+    For example:
+
+        deleter = BulkReferenceDeleter()
+        deleter.delete_for_queryset(
+            queryset=CrfOne.objects.filter(subject_visit__in=...))
+        deleter.delete_for_subject(subject_identifier='123')
+    """
+
+    batch_size = 100
+    crf_visit_attr = 'visit'
+    snapshot_updater = reference_snapshot_updater
+
+    def __init__(self):
+        self.deleted = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}() deleted={self.deleted}'
+
+    def get_key(self, model_obj=None):
+        """Returns a tuple of (reference_model, identifier, timepoint,
+        report_datetime, model) for this model instance.
+        """
+        try:
+            # given a crf model as model_obj
+            visit = getattr(model_obj, self.crf_visit_attr)
+        except AttributeError:
+            # given a visit model as model_obj
+            visit = model_obj
+        reference_model = site_reference_configs.get_reference_model(
+            name=model_obj.reference_name)
+        return (reference_model, visit.subject_identifier, visit.visit_code,
+                visit.report_datetime, model_obj.reference_name)
+
+    def delete_for_queryset(self, queryset=None):
+        """Deletes the reference model instances for each model
+        instance in the queryset.
+        """
+        related = [fld.name for fld in queryset.model._meta.concrete_fields
+                   if fld.many_to_one or fld.one_to_one]
+        self.delete_keys(keys={
+            self.get_key(model_obj=model_obj)
+            for model_obj in queryset.select_related(*related).iterator()})
+
+    def delete_for_subject(self, subject_identifier=None, names=None):
+        """Deletes the reference model instances for this subject
+        and, if given, these reference names only.
+        """
+        names_by_reference_model = {}
+        for name in names or site_reference_configs.registry:
+            names_by_reference_model.setdefault(
+                site_reference_configs.get_reference_model(name=name),
+                []).append(name)
+        for reference_model, model_names in names_by_reference_model.items():
+            reference_model_cls = django_apps.get_model(reference_model)
+            queryset = reference_model_cls.objects.filter(
+                identifier=subject_identifier, model__in=model_names)
+            groups = set(queryset.values_list('timepoint', 'model').distinct())
+            with transaction.atomic():
+                deleted, _ = queryset.delete()
+                if self.snapshot_updater.enabled:
+                    self.snapshot_updater.snapshot_model_cls.objects.filter(
+                        identifier=subject_identifier,
+                        model__in=model_names).delete()
+            self.deleted += deleted
+            for timepoint, model in groups:
+                invalidate_references(
+                    identifier=subject_identifier, timepoint=timepoint,
+                    model=model)
+
+    def delete_keys(self, keys=None):
+        """Deletes the reference model instances for each key
+        returned by `get_key`, `batch_size` keys per DELETE.
+        """
+        keys_by_reference_model = {}
+        for reference_model, *key in keys:
+            keys_by_reference_model.setdefault(
+                reference_model, set()).add(tuple(key))
+        for reference_model, model_keys in keys_by_reference_model.items():
+            reference_model_cls = django_apps.get_model(reference_model)
+            model_keys = list(model_keys)
+            for index in range(0, len(model_keys), self.batch_size):
+                q = Q()
+                for identifier, timepoint, report_datetime, model in model_keys[
+                        index:index + self.batch_size]:
+                    q |= Q(identifier=identifier, timepoint=timepoint,
+                           report_datetime=report_datetime, model=model)
+                with transaction.atomic():
+                    deleted, _ = reference_model_cls.objects.filter(q).delete()
+                self.deleted += deleted
+            if self.snapshot_updater.enabled:
+                self.snapshot_updater.refresh(
+                    reference_model_cls=reference_model_cls,
+                    groups=[(k[0], k[1], k[3]) for k in model_keys])
+            for identifier, timepoint, _, model in model_keys:
+                invalidate_references(
+                    identifier=identifier, timepoint=timepoint, model=model)
+
+
+class DeferredReferenceDeleter:
+
+    """A class to delete the reference model instances for a model
+    instance when the current transaction commits, together with
+    those of any other instances deleted in the same transaction.
+
+    Outside of a transaction, deletes immediately.
+
+    To use, set `reference_deleter_cls` on the model class:
+
+        class CrfOne(ReferenceModelMixin, BaseUuidModel):
+
+            reference_deleter_cls = DeferredReferenceDeleter
+            ...
+
+    On commit, keys are deleted only for instances that no longer
+    exist, so references for instances whose delete is rolled back,
+    e.g. with a savepoint, are not deleted.
+    """
+
+    bulk_deleter_cls = BulkReferenceDeleter
+    pending_name = 'delete'
+
+    def __init__(self, model_obj=None):
+        deleter = self.bulk_deleter_cls()
+        key = deleter.get_key(model_obj=model_obj)
+        if transaction.get_connection().in_atomic_block:
+            get_pending(name=self.pending_name, flush=self.flush, factory=dict).update(
+                {(model_obj.__class__, model_obj.pk): key})
+        else:
+            deleter.delete_keys(keys=[key])
+
+    @classmethod
+    def flush(cls, keys=None):
+        """Deletes the keys, a dictionary of key by (model class, pk),
+        of instances that no longer exist.
+        """
+        pks_by_model = {}
+        for model_cls, pk in keys:
+            pks_by_model.setdefault(model_cls, []).append(pk)
+        existing = set()
+        for model_cls, pks in pks_by_model.items():
+            existing.update(
+                (model_cls, pk) for pk in model_cls.objects.filter(
+                    pk__in=pks).values_list('pk', flat=True))
+        cls.bulk_deleter_cls().delete_keys(
+            keys=[key for model_key, key in keys.items() if model_key not in existing])
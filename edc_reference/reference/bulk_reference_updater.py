@@ -0,0 +1,56 @@
+from django.apps import apps as django_apps
+
+from ..site import site_reference_configs
+from .bulk_reference_writer import BulkReferenceWriter
+from .reference_updater import ReferenceUpdater
+
+
+class BulkReferenceUpdater(ReferenceUpdater):
+    """Updates or creates all reference model instances for this
+    model_obj in one transaction.
+
+    Values are computed in memory and written with one SELECT,
+    one bulk INSERT and one bulk UPDATE instead of a get, create
+    and save per field.
+
+    To use, set `reference_updater_cls` on the model class:
+
+        class CrfOne(ReferenceModelMixin, BaseUuidModel):
+
+            reference_updater_cls = BulkReferenceUpdater
+            ...
+
+    See `BulkReferenceWriter` for the `post_save` signal and audit
+    fields of the reference model.
+    """
+
+    writer_cls = BulkReferenceWriter
+
+    def update_references(self, model_obj=None):
+        reference_model = site_reference_configs.get_reference_model(
+            name=model_obj.reference_name)
+        reference_model_cls = django_apps.get_model(reference_model)
+        self.writer = self.writer_cls(reference_model_cls=reference_model_cls)
+        self.writer.write(
+            references=self.get_references(
+                model_obj=model_obj, reference_model_cls=reference_model_cls))
+        self.created = self.writer.created
+        self.updated = self.writer.updated
+        self.skipped = self.writer.skipped
+
+    def get_references(self, model_obj=None, reference_model_cls=None):
+        """Returns a list of unsaved reference model instances;
+        one for each reference field.
+        """
+        references = []
+        options = self.get_options(model_obj=model_obj)
+        for field_name, value, internal_type, related_name, value_field in (
+                self.get_values(model_obj=model_obj)):
+            reference = reference_model_cls(field_name=field_name, **options)
+            reference.set_value(
+                value=value,
+                internal_type=internal_type,
+                related_name=related_name,
+                value_field=value_field)
+            references.append(reference)
+        return references
@@ -0,0 +1,168 @@
+from django.apps import apps as django_apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_save
+from edc_base.utils import get_utcnow
+
+from .reference_cache import invalidate_references
+from .reference_snapshot_updater import reference_snapshot_updater
+
+
+class BulkReferenceWriter:
+    """A class to write a list of unsaved reference model instances
+    in bulk.
+
+    Instances are matched on the natural key against existing
+    rows with one query per `lookup_batch_size` visits. Changed
+    matches are updated with `bulk_update`, unchanged matches are
+    counted in `skipped` and the rest are inserted with
+    `bulk_create`. All writes are done in one transaction.
+
+    `bulk_create` and `bulk_update` do not send `post_save`, so,
+    if `send_post_save`=True, it is sent for each created and
+    updated instance in the same transaction, as `save` would,
+    so that receivers such as edc-sync's outgoing transactions
+    see every write. `pre_save` is not sent. The audit fields
+    in `audit_fields` are set on updated instances as `save`
+    would set them.
+    """
+
+    batch_size = 500
+    lookup_batch_size = 100
+    snapshot_updater = reference_snapshot_updater
+    send_post_save = True
+    audit_fields = ['modified', 'user_modified', 'hostname_modified', 'revision']
+
+    def __init__(self, reference_model_cls=None):
+        self.reference_model_cls = reference_model_cls
+        self.value_fields = [
+            fld.name for fld in reference_model_cls._meta.get_fields()
+            if fld.name.startswith('value')]
+        self.update_fields = self.value_fields + ['datatype', 'related_name']
+        field_names = [fld.name for fld in reference_model_cls._meta.get_fields()]
+        self.audit_fields = [f for f in self.audit_fields if f in field_names]
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(reference_model_cls='
+                f'{self.reference_model_cls._meta.label_lower}) '
+                f'created={self.created}, updated={self.updated}, '
+                f'skipped={self.skipped}')
+
+    @staticmethod
+    def natural_key(reference=None):
+        return (reference.identifier, reference.timepoint,
+                reference.report_datetime, reference.model,
+                reference.field_name)
+
+    def write(self, references=None):
+        """Updates or creates the reference model instances in
+        `references`.
+        """
+        references = {self.natural_key(r): r for r in references or []}
+        if not references:
+            return
+        existing = self.get_existing(references=references.values())
+        to_create = []
+        to_update = []
+        for key, reference in references.items():
+            try:
+                obj = existing[key]
+            except KeyError:
+                to_create.append(reference)
+            else:
+                values = [getattr(reference, f) for f in self.update_fields]
+                if values == [getattr(obj, f) for f in self.update_fields]:
+                    self.skipped += 1
+                    continue
+                for field_name, value in zip(self.update_fields, values):
+                    setattr(obj, field_name, value)
+                to_update.append(obj)
+        self.save(to_create=to_create, to_update=to_update)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        groups = {(r.identifier, r.timepoint, r.model) for r in to_create + to_update}
+        if groups and self.snapshot_updater.enabled:
+            self.snapshot_updater.refresh(
+                reference_model_cls=self.reference_model_cls, groups=groups)
+        for identifier, timepoint, model in groups:
+            invalidate_references(
+                identifier=identifier, timepoint=timepoint, model=model)
+
+    def save(self, to_create=None, to_update=None):
+        """Inserts `to_create` and updates `to_update` in one
+        transaction.
+        """
+        if to_create:
+            self.set_site(references=to_create)
+        if to_update:
+            self.set_audit_fields(references=to_update)
+        with transaction.atomic():
+            if to_create:
+                self.reference_model_cls.objects.bulk_create(
+                    to_create, batch_size=self.batch_size)
+            if to_update:
+                self.reference_model_cls.objects.bulk_update(
+                    to_update, fields=self.update_fields + self.audit_fields,
+                    batch_size=self.batch_size)
+            if self.send_post_save:
+                self.post_save(references=to_create, created=True)
+                self.post_save(references=to_update, created=False)
+
+    def post_save(self, references=None, created=None):
+        using = self.reference_model_cls.objects.db
+        for reference in references:
+            post_save.send(
+                sender=self.reference_model_cls, instance=reference,
+                created=created, update_fields=None, raw=False, using=using)
+
+    def set_audit_fields(self, references=None):
+        """Sets the audit fields on updated instances as
+        `BaseModel.save` would; `bulk_update` does not call each
+        field's `pre_save`.
+        """
+        modified = get_utcnow()
+        fields = [self.reference_model_cls._meta.get_field(f) for f in self.audit_fields]
+        for reference in references:
+            reference.modified = modified
+            for field in fields:
+                setattr(reference, field.attname, field.pre_save(reference, False))
+
+    def set_site(self, references=None):
+        """Sets the current site on new instances as
+        `SiteModelMixin.save` would.
+        """
+        site_model_cls = django_apps.get_model('sites.site')
+        try:
+            site = site_model_cls.objects.get_current()
+        except ObjectDoesNotExist:
+            site = None
+        for reference in references:
+            if not reference.site_id:
+                reference.site = site
+
+    def get_existing(self, references=None):
+        """Returns a dictionary of existing reference model
+        instances by natural key.
+
+        Lookups are batched by visit (identifier, timepoint,
+        report_datetime, model) to keep the number of query
+        parameters bounded.
+        """
+        existing = {}
+        visit_keys = list({key[:4] for key in map(self.natural_key, references)})
+        for index in range(0, len(visit_keys), self.lookup_batch_size):
+            opts = dict(identifier__in=set(), timepoint__in=set(),
+                        report_datetime__in=set(), model__in=set())
+            for identifier, timepoint, report_datetime, model in visit_keys[
+                    index:index + self.lookup_batch_size]:
+                opts['identifier__in'].add(identifier)
+                opts['timepoint__in'].add(timepoint)
+                opts['report_datetime__in'].add(report_datetime)
+                opts['model__in'].add(model)
+            existing.update({
+                self.natural_key(obj): obj
+                for obj in self.reference_model_cls.objects.filter(**opts)})
+        return existing
@@ -0,0 +1,78 @@
+from django.apps import apps as django_apps
+from django.db import transaction
+
+from ..site import site_reference_configs
+from .bulk_reference_updater import BulkReferenceUpdater
+from .pending import flush_pending, get_pending
+from .reference_updater import ReferenceUpdater
+
+
+class DeferredReferenceUpdater(ReferenceUpdater):
+    """Defers updating the reference model instances for a model
+    instance until the current transaction commits.
+
+    Updates are collected per transaction as (model class, pk) and
+    coalesced per model instance. On commit the rows are read again
+    and their references written in bulk, so references match the
+    committed rows, not in-memory instances. Outside of a
+    transaction, or for an instance without a pk, updates
+    synchronously.
+
+    To use, set `reference_updater_cls` on the model class:
+
+        class CrfOne(ReferenceModelMixin, BaseUuidModel):
+
+            reference_updater_cls = DeferredReferenceUpdater
+            ...
+
+    Code that reads references before the transaction commits
+    should call `DeferredReferenceUpdater.flush()` first.
+
+    See `BulkReferenceWriter` for the `post_save` signal and audit
+    fields of the reference model.
+    """
+
+    bulk_updater_cls = BulkReferenceUpdater
+    pending_name = 'update'
+
+    def __init__(self, model_obj=None):
+        if (model_obj is not None and model_obj.pk is not None
+                and transaction.get_connection().in_atomic_block):
+            super().__init__()
+            get_pending(name=self.pending_name, flush=self.write, factory=set).add(
+                (model_obj.__class__, model_obj.pk))
+        else:
+            super().__init__(model_obj=model_obj)
+
+    @classmethod
+    def flush(cls):
+        """Writes pending updates for this thread now.
+        """
+        flush_pending(name=cls.pending_name, flush=cls.write)
+
+    @classmethod
+    def write(cls, keys=None):
+        """Writes the references for a set of (model class, pk) in
+        bulk from the rows as they are in the database; one read per
+        model class and one write per reference model.
+
+        Rows deleted before the flush are skipped.
+        """
+        pks_by_model = {}
+        for model_cls, pk in keys:
+            pks_by_model.setdefault(model_cls, []).append(pk)
+        updater = cls.bulk_updater_cls()
+        references_by_reference_model = {}
+        for model_cls, pks in pks_by_model.items():
+            related = [fld.name for fld in model_cls._meta.concrete_fields
+                       if fld.many_to_one or fld.one_to_one]
+            for model_obj in model_cls.objects.select_related(*related).filter(pk__in=pks):
+                reference_model_cls = django_apps.get_model(
+                    site_reference_configs.get_reference_model(
+                        name=model_obj.reference_name))
+                references_by_reference_model.setdefault(
+                    reference_model_cls, []).extend(updater.get_references(
+                        model_obj=model_obj, reference_model_cls=reference_model_cls))
+        for reference_model_cls, references in references_by_reference_model.items():
+            writer = updater.writer_cls(reference_model_cls=reference_model_cls)
+            writer.write(references=references)
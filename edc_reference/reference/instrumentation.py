@@ -0,0 +1,162 @@
+import logging
+
+from contextlib import ExitStack
+from django.db import connections
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+from time import perf_counter
+
+
+logger = logging.getLogger('edc_reference')
+
+# sent with keyword argument `measurement`
+reference_operation = Signal()
+
+
+class Measurement:
+
+    """Holds the elapsed seconds, number of SQL queries and rows
+    read and written for one call of a reference operation.
+
+    Queries are counted on every configured database connection.
+    """
+
+    def __init__(self, instrumentation=None, operation=None, name=None):
+        self.instrumentation = instrumentation
+        self.operation = operation
+        self.name = name
+        self.elapsed = None
+        self.queries = 0
+        self.rows_read = 0
+        self.rows_written = 0
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(operation={self.operation}, '
+                f'name={self.name}, elapsed={self.elapsed}, queries={self.queries}, '
+                f'rows_read={self.rows_read}, rows_written={self.rows_written})')
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrappers = ExitStack()
+        for conn in connections.all():
+            self._wrappers.enter_context(conn.execute_wrapper(self))
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = perf_counter() - self._start
+        self._wrappers.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.instrumentation.report(self)
+
+    def as_dict(self):
+        return dict(
+            operation=self.operation,
+            name=self.name,
+            elapsed=self.elapsed,
+            queries=self.queries,
+            rows_read=self.rows_read,
+            rows_written=self.rows_written)
+
+
+class NullMeasurement:
+
+    """A measurement that does nothing; returned when
+    instrumentation is disabled.
+    """
+
+    __slots__ = ()
+    elapsed = None
+    queries = 0
+    rows_read = 0
+    rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def __setattr__(self, name, value):
+        pass
+
+
+null_measurement = NullMeasurement()
+
+
+class ReferenceInstrumentation:
+
+    """Reports the elapsed time, SQL queries and rows read and
+    written per call of the reference updater, deleter, getter,
+    `Refset` and `LongitudinalRefset`.
+
+    Disabled unless enabled. See `EDC_REFERENCE_INSTRUMENTATION`
+    in settings. When disabled, `measure` returns a shared no-op
+    context manager.
+
+    Each measurement is sent with the `reference_operation` signal
+    and passed to each callback.
+
+    For example:
+
+        def callback(measurement):
+            histogram.labels(
+                measurement.operation, measurement.name).observe(
+                    measurement.elapsed)
+
+        reference_instrumentation.enable(callbacks=[callback])
+
+        with reference_instrumentation.measure(
+                operation='updater', name=name) as measurement:
+            ...
+            measurement.rows_written = 1
+    """
+
+    measurement_cls = Measurement
+
+    def __init__(self):
+        self.enabled = False
+        self.callbacks = []
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(enabled={self.enabled})'
+
+    def enable(self, callbacks=None):
+        """Enables instrumentation with a list of callbacks, or
+        dotted paths to callbacks, each called with a measurement.
+        """
+        self.callbacks = [
+            import_string(callback) if isinstance(callback, str) else callback
+            for callback in callbacks or []]
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self.callbacks = []
+
+    def measure(self, operation=None, name=None):
+        if not self.enabled:
+            return null_measurement
+        return self.measurement_cls(
+            instrumentation=self, operation=operation, name=name)
+
+    def report(self, measurement=None):
+        reference_operation.send(sender=self.__class__, measurement=measurement)
+        for callback in self.callbacks:
+            callback(measurement)
+
+
+def log_measurement(measurement=None):
+    """A callback that logs each measurement at DEBUG level to
+    the `edc_reference` logger.
+    """
+    logger.debug(
+        'reference %(operation)s name=%(name)s elapsed=%(elapsed).6f '
+        'queries=%(queries)s rows_read=%(rows_read)s '
+        'rows_written=%(rows_written)s', measurement.as_dict())
+
+
+reference_instrumentation = ReferenceInstrumentation()
@@ -0,0 +1,118 @@
+import threading
+
+from django.db import transaction
+
+
+_local = threading.local()
+
+
+def _get_state():
+    try:
+        return _local.pending
+    except AttributeError:
+        _local.pending = {}
+        return _local.pending
+
+
+def _is_registered(connection=None, callback=None):
+    """Returns True if `callback` is still to run on commit.
+
+    Django drops the callbacks of a transaction or savepoint that
+    is rolled back, so a callback no longer registered marks its
+    pending items as rolled back.
+    """
+    return any(item[1] is callback for item in connection.run_on_commit)
+
+
+def get_pending(name=None, flush=None, factory=None, using=None):
+    """Returns the collection of pending items for `name` in the
+    current transaction, creating it, with `factory`, and
+    registering `flush(items)` to run once on commit.
+
+    Items left by a transaction or savepoint that was rolled back
+    before the first item was added are discarded. Items added in a
+    savepoint that is rolled back after that are flushed with the
+    rest; `flush` must check each item against the database.
+    """
+    connection = transaction.get_connection(using)
+    pending = _get_state()
+    key = (connection.alias, name)
+    try:
+        items, _, callback = pending[key]
+    except KeyError:
+        pass
+    else:
+        if connection.in_atomic_block and _is_registered(connection, callback):
+            return items
+        # left over from a transaction that was rolled back
+        del pending[key]
+    items = (factory or set)()
+
+    def callback():
+        flush_pending(name=name, using=connection.alias, callback=callback)
+
+    pending[key] = (items, flush, callback)
+    transaction.on_commit(callback, using=connection.alias)
+    return items
+
+
+def flush_pending(name=None, flush=None, using=None, callback=None):
+    """Flushes the pending items for `name` now instead of on
+    commit.
+
+    If `callback` is given, only the items registered with it are
+    flushed.
+    """
+    connection = transaction.get_connection(using)
+    pending = _get_state()
+    key = (connection.alias, name)
+    try:
+        items, pending_flush, pending_callback = pending[key]
+    except KeyError:
+        return
+    if callback is not None and callback is not pending_callback:
+        return
+    del pending[key]
+    if items:
+        (flush or pending_flush)(items)
+
+
+def mark_writes_pending(using=None):
+    """Marks the current transaction as having uncommitted
+    reference writes and returns True, or returns False if not in
+    a transaction.
+    """
+    connection = transaction.get_connection(using)
+    if connection.get_autocommit() or not connection.in_atomic_block:
+        return False
+    _get_writes().add(connection.alias)
+    return True
+
+
+def clear_writes_pending(using=None):
+    _get_writes().discard(transaction.get_connection(using).alias)
+
+
+def writes_pending(using=None):
+    """Returns True if reference writes made in this thread are
+    not yet committed.
+
+    A mark left by a transaction that was rolled back is cleared
+    once the connection is outside an atomic block.
+    """
+    connection = transaction.get_connection(using)
+    writes = _get_writes()
+    if connection.alias not in writes:
+        return False
+    if connection.get_autocommit() or not connection.in_atomic_block:
+        writes.discard(connection.alias)
+        return False
+    return True
+
+
+def _get_writes():
+    try:
+        return _local.writes
+    except AttributeError:
+        _local.writes = set()
+        return _local.writes
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from django.db import transaction
+from threading import RLock
+from time import monotonic
+
+from .pending import clear_writes_pending, mark_writes_pending, writes_pending
+from .reference_prefetch import active_prefetches
+from .shared_reference_cache import shared_reference_cache
+
+
+class ReferenceCache:
+    """A bounded, process-local LRU cache of reference model
+    instances keyed on the natural key (identifier, timepoint,
+    report_datetime, model, field_name).
+
+    A cached value of None means the reference does not exist.
+
+    Disabled unless `maxsize` > 0. See `EDC_REFERENCE_CACHE_MAXSIZE`
+    in settings.
+    Entries are invalidated per (identifier, timepoint, model) by
+    `invalidate_references`, called from the updaters, the deleter
+    and the reference model signals, and
+    the cache is cleared at the start of each request so values
+    written by other processes are not served across requests.
+    Outside of requests, e.g. in management commands or task
+    workers, entries expire `ttl` seconds after they are set, see
+    `EDC_REFERENCE_CACHE_TTL` in settings.
+
+    While this thread has uncommitted reference writes, the cache
+    is neither read nor written, so uncommitted values are never
+    cached and a rollback leaves nothing to serve.
+    """
+
+    ttl = 60
+    timer = staticmethod(monotonic)
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or 0
+        self.ttl = ttl or self.ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._data = OrderedDict()
+        self._keys = {}
+        self._lock = RLock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(maxsize={self.maxsize}, ttl={self.ttl})'
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def enable(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or 1024
+        self.ttl = ttl or self.__class__.ttl
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def disable(self):
+        self.maxsize = 0
+        self.clear()
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    maxsize=self.maxsize, currsize=len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys.clear()
+            self.version += 1
+
+    def get(self, key=None):
+        """Returns the cached value for key or raises KeyError,
+        also if the entry has expired.
+        """
+        if writes_pending():
+            self.misses += 1
+            raise KeyError(key)
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            if expires <= self.timer():
+                del self._data[key]
+                self._discard(key)
+                self.misses += 1
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key=None, value=None, version=None):
+        """Sets the value for key unless the cache was invalidated
+        since `version` was read.
+        """
+        if not self.enabled or writes_pending():
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._data[key] = (value, self.timer() + self.ttl)
+            self._data.move_to_end(key)
+            self._keys.setdefault(self.group(key), set()).add(key)
+            while len(self._data) > self.maxsize:
+                old_key, _ = self._data.popitem(last=False)
+                self._discard(old_key)
+
+    def invalidate(self, identifier=None, timepoint=None, model=None):
+        """Removes all entries for this subject, timepoint and
+        reference name.
+        """
+        with self._lock:
+            self.version += 1
+            for key in self._keys.pop((identifier, timepoint, model), []):
+                self._data.pop(key, None)
+
+    @staticmethod
+    def group(key=None):
+        identifier, timepoint, _, model, _ = key
+        return (identifier, timepoint, model)
+
+    def _discard(self, key=None):
+        keys = self._keys.get(self.group(key))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[self.group(key)]
+
+
+reference_cache = ReferenceCache()
+
+
+def invalidate_references(identifier=None, timepoint=None, model=None):
+    """Invalidates the process-local cache, the shared cache, if
+    enabled, and any active `ReferencePrefetch` scopes in this
+    thread for this subject, timepoint and reference name.
+
+    Inside a transaction, the caches are bypassed by this thread
+    until commit and are invalidated again on commit.
+    """
+    _invalidate(identifier=identifier, timepoint=timepoint, model=model)
+    if mark_writes_pending():
+        transaction.on_commit(lambda: _invalidate_on_commit(
+            identifier=identifier, timepoint=timepoint, model=model))
+
+
+def _invalidate_on_commit(identifier=None, timepoint=None, model=None):
+    clear_writes_pending()
+    _invalidate(identifier=identifier, timepoint=timepoint, model=model)
+
+
+def _invalidate(identifier=None, timepoint=None, model=None):
+    reference_cache.invalidate(
+        identifier=identifier, timepoint=timepoint, model=model)
+    if shared_reference_cache.enabled:
+        shared_reference_cache.invalidate(
+            identifier=identifier, timepoint=timepoint, model=model)
+    for prefetch in active_prefetches():
+        prefetch.invalidate(
+            identifier=identifier, timepoint=timepoint, model=model)
@@ -2,6 +2,9 @@ from django.apps import apps as django_apps
 from django.db import transaction
 
 from ..site import site_reference_configs
+from .instrumentation import reference_instrumentation
+from .reference_cache import invalidate_references
+from .reference_snapshot_updater import reference_snapshot_updater
 
 
 class ReferenceDeleter:
@@ -12,15 +15,34 @@ class ReferenceDeleter:
     See signals.
     """
 
+    snapshot_updater = reference_snapshot_updater
+    instrumentation = reference_instrumentation
+
     def __init__(self, model_obj=None):
         reference_model = site_reference_configs.get_reference_model(
             name=model_obj.reference_name)
         self.reference_model_cls = django_apps.get_model(reference_model)
         self.model_obj = model_obj
+        with self.instrumentation.measure(
+                operation='deleter', name=model_obj.reference_name) as measurement:
+            self.delete()
+            measurement.rows_written = self.deleted
+
+    def delete(self):
         self.reference_objects = self.reference_model_cls.objects.filter(
             **self.options)
         with transaction.atomic():
-            self.reference_objects.delete()
+            self.deleted, _ = self.reference_objects.delete()
+        if self.snapshot_updater.enabled:
+            self.snapshot_updater.refresh(
+                reference_model_cls=self.reference_model_cls,
+                groups=[(self.options.get('identifier'),
+                         self.options.get('timepoint'),
+                         self.options.get('model'))])
+        invalidate_references(
+            identifier=self.options.get('identifier'),
+            timepoint=self.options.get('timepoint'),
+            model=self.options.get('model'))
 
     @property
     def options(self):
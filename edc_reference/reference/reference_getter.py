@@ -2,6 +2,10 @@ from django.apps import apps as django_apps
 from django.core.exceptions import ObjectDoesNotExist
 
 from ..site import site_reference_configs
+from .instrumentation import reference_instrumentation
+from .reference_cache import reference_cache
+from .reference_prefetch import get_prefetched
+from .shared_reference_cache import shared_reference_cache
 
 
 class ReferenceObjectDoesNotExist(Exception):
@@ -13,8 +17,16 @@ class ReferenceGetter:
     model or attributes of the model.
 
     See also ReferenceModelMixin.
+
+    Lookups that do not create are served from an active
+    `ReferencePrefetch` scope or, if enabled, `reference_cache`
+    and `shared_reference_cache`.
     """
 
+    cache = reference_cache
+    shared_cache = shared_reference_cache
+    instrumentation = reference_instrumentation
+
     def __init__(self, name=None, field_name=None, model_obj=None, visit_obj=None,
                  subject_identifier=None, report_datetime=None, visit_code=None,
                  create=None):
@@ -50,19 +62,24 @@ class ReferenceGetter:
         reference_model = site_reference_configs.get_reference_model(
             name=self.name)
         reference_model_cls = django_apps.get_model(reference_model)
-        try:
-            self.object = reference_model_cls.objects.get(**self._options)
-        except ObjectDoesNotExist as e:
-            if create:
-                self.object = reference_model_cls.objects.create(
-                    **self._options)
-                # note: updater needs to "update_value"
+        with self.instrumentation.measure(
+                operation='getter', name=self.name) as measurement:
+            try:
+                self.object = self.get_object(
+                    reference_model_cls=reference_model_cls, create=create)
+            except ObjectDoesNotExist as e:
+                if create:
+                    self.object = reference_model_cls.objects.create(
+                        **self._options)
+                    measurement.rows_written = 1
+                    # note: updater needs to "set_value"
+                else:
+                    raise ReferenceObjectDoesNotExist(
+                        f'{e}. Using {self._options}')
             else:
-                raise ReferenceObjectDoesNotExist(
-                    f'{e}. Using {self._options}')
-        else:
-            self.value = getattr(self.object, 'value')
-            self.has_value = True
+                self.value = getattr(self.object, 'value')
+                self.has_value = True
+                measurement.rows_read = 1
         setattr(self, self.field_name, self.value)
 
     def __repr__(self):
@@ -70,6 +87,57 @@ class ReferenceGetter:
                 f'\'{self.subject_identifier},{self.report_datetime}'
                 f') value={self.value}, has_value={self.has_value}>')
 
+    def get_object(self, reference_model_cls=None, create=None):
+        """Returns the reference model instance from an active
+        prefetch scope, the cache, the shared cache or the database.
+
+        Bypasses the prefetch scope and the caches if `create` since
+        the caller will update the instance.
+        """
+        if create:
+            return reference_model_cls.objects.get(**self._options)
+        references = get_prefetched(
+            reference_model_cls=reference_model_cls, **self._options)
+        if references is not None:
+            obj = references[0] if references else None
+        elif self.cache.enabled:
+            try:
+                obj = self.cache.get(self.cache_key)
+            except KeyError:
+                version = self.cache.version
+                obj = self.fetch_object(reference_model_cls=reference_model_cls)
+                self.cache.set(self.cache_key, obj, version=version)
+        else:
+            obj = self.fetch_object(reference_model_cls=reference_model_cls)
+        if obj is None:
+            raise reference_model_cls.DoesNotExist(
+                f'{reference_model_cls._meta.object_name} matching query '
+                'does not exist.')
+        return obj
+
+    def fetch_object(self, reference_model_cls=None):
+        """Returns the reference model instance from the shared
+        cache, if enabled, or the database, or None.
+        """
+        def fetch():
+            try:
+                return reference_model_cls.objects.get(**self._options)
+            except ObjectDoesNotExist:
+                return None
+        if self.shared_cache.enabled:
+            return self.shared_cache.get_or_set(
+                key=self.cache_key,
+                identifier=self.subject_identifier,
+                timepoint=self.visit_code,
+                model=self.name,
+                fetch=fetch)
+        return fetch()
+
+    @property
+    def cache_key(self):
+        return (self.subject_identifier, self.visit_code, self.report_datetime,
+                self.name, self.field_name)
+
     @property
     def _options(self):
         return dict(
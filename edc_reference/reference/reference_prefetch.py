@@ -0,0 +1,128 @@
+import threading
+
+from django.apps import apps as django_apps
+
+
+_local = threading.local()
+
+
+def active_prefetches():
+    """Returns the list of active prefetch scopes for this thread,
+    innermost last.
+    """
+    try:
+        return _local.prefetches
+    except AttributeError:
+        _local.prefetches = []
+        return _local.prefetches
+
+
+def get_prefetched(reference_model_cls=None, identifier=None, model=None,
+                   timepoint=None, **options):
+    """Returns a list of prefetched reference model instances or
+    None if no active prefetch scope covers the lookup.
+    """
+    for prefetch in reversed(active_prefetches()):
+        references = prefetch.filter(
+            reference_model_cls=reference_model_cls,
+            identifier=identifier, model=model, timepoint=timepoint,
+            **options)
+        if references is not None:
+            return references
+    return None
+
+
+class ReferencePrefetch:
+    """A context manager that fetches all reference model
+    instances for a subject, or a subject and timepoint, in one
+    query and serves `ReferenceGetter`, `Refset`,
+    `LongitudinalRefset` and the `ReferenceManager` visit lookups
+    from memory for the life of the scope.
+
+    For example:
+
+        with ReferencePrefetch(subject_identifier='123'):
+            ...
+
+    Scopes are per thread. Writes invalidate the affected
+    (identifier, timepoint, model) so later lookups for it fall
+    through to the database.
+    """
+
+    reference_model = 'edc_reference.reference'
+
+    def __init__(self, subject_identifier=None, timepoint=None,
+                 reference_model_cls=None):
+        self.subject_identifier = subject_identifier
+        self.timepoint = timepoint
+        reference_model_cls = reference_model_cls or self.reference_model
+        try:
+            reference_model_cls = django_apps.get_model(reference_model_cls)
+        except AttributeError:
+            pass
+        self.reference_model_cls = reference_model_cls
+        self.label_lower = self.reference_model_cls._meta.label_lower
+        self.loaded = False
+        self.stale = set()
+        self._references = {}
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(subject_identifier='
+                f'{self.subject_identifier}, timepoint={self.timepoint})')
+
+    def __enter__(self):
+        self.load()
+        active_prefetches().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        prefetches = active_prefetches()
+        if self in prefetches:
+            prefetches.remove(self)
+        return False
+
+    def load(self):
+        """Fetches the reference model instances in one query and
+        groups them by model.
+        """
+        opts = dict(identifier=self.subject_identifier)
+        if self.timepoint is not None:
+            opts.update(timepoint=self.timepoint)
+        self._references = {}
+        for reference in self.reference_model_cls.objects.filter(**opts):
+            self._references.setdefault(reference.model, []).append(reference)
+        self.stale = set()
+        self.loaded = True
+
+    def covers(self, reference_model_cls=None, identifier=None, model=None,
+               timepoint=None):
+        """Returns True if this scope can answer the lookup.
+        """
+        if (not self.loaded
+                or reference_model_cls._meta.label_lower != self.label_lower
+                or identifier != self.subject_identifier):
+            return False
+        if self.timepoint is not None and timepoint != self.timepoint:
+            return False
+        if timepoint is None:
+            return not [s for s in self.stale if s[1] == model]
+        return (timepoint, model) not in self.stale
+
+    def filter(self, reference_model_cls=None, identifier=None, model=None,
+               timepoint=None, **options):
+        """Returns a list of reference model instances matching
+        the exact values in options or None if not covered.
+        """
+        if not self.covers(reference_model_cls=reference_model_cls,
+                           identifier=identifier, model=model,
+                           timepoint=timepoint):
+            return None
+        if timepoint is not None:
+            options.update(timepoint=timepoint)
+        return [
+            r for r in self._references.get(model, [])
+            if all(getattr(r, k) == v for k, v in options.items())]
+
+    def invalidate(self, identifier=None, timepoint=None, model=None):
+        if identifier == self.subject_identifier:
+            self.stale.add((timepoint, model))
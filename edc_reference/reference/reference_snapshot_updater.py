@@ -0,0 +1,246 @@
+import time
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from edc_base.utils import get_utcnow
+
+from .pending import get_pending
+
+
+class ReferenceSnapshotUpdater:
+
+    """A class to maintain the `ReferenceSnapshot` model; one row
+    per (identifier, timepoint, report_datetime, model), the
+    natural key of the references less field_name, with all
+    reference field values in a JSON payload.
+
+    Snapshots are refreshed by group, (identifier, timepoint,
+    model), the unit read by `Refset`; a group has a snapshot for
+    each report_datetime.
+
+    Does nothing unless `EDC_REFERENCE_SNAPSHOT` is True.
+
+    Snapshots are maintained once enabled but only read, see
+    `readable`, after a full `rebuild` has completed, so a
+    partially built snapshot is never served. References written
+    around the updaters, e.g. with `QuerySet.update()` or raw SQL,
+    are not seen; rebuild after such changes. References deleted
+    by any means that sends `post_delete`, e.g. `QuerySet.delete()`,
+    refresh their snapshots when the transaction commits, see
+    `refresh_on_commit`. References received by edc-sync are
+    deserialized with `raw`=True and refresh their snapshot from
+    the `post_save` signal; the snapshot model itself is not
+    synchronized.
+
+    `update` writes snapshots from references in memory, `refresh`
+    re-reads the references for a list of groups and `rebuild`
+    recreates all snapshots from the reference model.
+    """
+
+    snapshot_model = 'edc_reference.referencesnapshot'
+    checkpoint_model = 'edc_reference.populatercheckpoint'
+    # checkpoint name marking a completed full rebuild
+    complete_marker = 'edc_reference.referencesnapshot'
+    # seconds between checks of the marker
+    complete_check_interval = 60
+    batch_size = 100
+
+    def __init__(self):
+        self._complete = None
+        self._complete_checked = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'EDC_REFERENCE_SNAPSHOT', False)
+
+    @property
+    def readable(self):
+        """Returns True if enabled and a full rebuild has completed.
+        """
+        return self.enabled and self.complete
+
+    @property
+    def complete(self):
+        now = time.monotonic()
+        if (self._complete_checked is None
+                or now - self._complete_checked > self.complete_check_interval):
+            self._complete = django_apps.get_model(self.checkpoint_model).objects.filter(
+                name=self.complete_marker, done_datetime__isnull=False).exists()
+            self._complete_checked = now
+        return self._complete
+
+    def mark_complete(self):
+        django_apps.get_model(self.checkpoint_model).objects.update_or_create(
+            name=self.complete_marker, defaults=dict(done_datetime=get_utcnow()))
+        self._complete = True
+        self._complete_checked = time.monotonic()
+
+    def reset(self):
+        """Forgets the cached state of the marker.
+        """
+        self._complete = None
+        self._complete_checked = None
+
+    @property
+    def snapshot_model_cls(self):
+        return django_apps.get_model(self.snapshot_model)
+
+    @staticmethod
+    def group(reference=None):
+        return (reference.identifier, reference.timepoint, reference.model)
+
+    @staticmethod
+    def key(obj=None):
+        return (obj.identifier, obj.timepoint, obj.report_datetime, obj.model)
+
+    def update(self, references=None):
+        """Writes a snapshot for each (identifier, timepoint,
+        report_datetime, model) in references.
+
+        `references` must include all references for each key.
+        """
+        references_by_key = {}
+        for reference in references:
+            references_by_key.setdefault(self.key(reference), []).append(reference)
+        self.write(references_by_key=references_by_key)
+
+    def refresh(self, reference_model_cls=None, groups=None):
+        """Re-reads the references for each (identifier, timepoint,
+        model) in groups and writes or deletes the snapshots.
+        """
+        groups = list(set(groups))
+        for index in range(0, len(groups), self.batch_size):
+            batch = groups[index:index + self.batch_size]
+            q = self.get_q(batch)
+            existing = {
+                self.key(obj): obj for obj in self.snapshot_model_cls.objects.filter(q)}
+            # snapshots of a key with no references left are deleted
+            references_by_key = {key: [] for key in existing}
+            for reference in reference_model_cls.objects.filter(q):
+                references_by_key.setdefault(self.key(reference), []).append(reference)
+            self.write(references_by_key=references_by_key, existing=existing)
+
+    def refresh_on_commit(self, reference_model_cls=None, groups=None):
+        """Refreshes the groups once when the transaction commits,
+        or now if not in a transaction.
+        """
+        if not transaction.get_connection().in_atomic_block:
+            return self.refresh(reference_model_cls=reference_model_cls, groups=groups)
+        pending = get_pending(name='snapshot', flush=self.refresh_pending, factory=set)
+        pending.update((reference_model_cls, group) for group in groups)
+
+    def refresh_pending(self, items=None):
+        groups_by_model = {}
+        for reference_model_cls, group in items:
+            groups_by_model.setdefault(reference_model_cls, []).append(group)
+        for reference_model_cls, groups in groups_by_model.items():
+            self.refresh(reference_model_cls=reference_model_cls, groups=groups)
+
+    def rebuild(self, reference_model_cls=None, names=None):
+        """Deletes and recreates the snapshots for these reference
+        names, or all, from the reference model.
+
+        A rebuild of all names marks the snapshot complete.
+
+        Returns the number of snapshots created.
+        """
+        snapshots = self.snapshot_model_cls.objects.all()
+        references = reference_model_cls.objects.all()
+        if names:
+            snapshots = snapshots.filter(model__in=names)
+            references = references.filter(model__in=names)
+        references = references.order_by(
+            'identifier', 'timepoint', 'model', 'report_datetime').iterator()
+        created = 0
+        with transaction.atomic():
+            snapshots.delete()
+            key = None
+            key_references = []
+            to_create = []
+            for reference in references:
+                if self.key(reference) != key and key_references:
+                    to_create.append(self.get_snapshot(key_references))
+                    key_references = []
+                key = self.key(reference)
+                key_references.append(reference)
+                if len(to_create) == self.batch_size:
+                    self.snapshot_model_cls.objects.bulk_create(to_create)
+                    created += len(to_create)
+                    to_create = []
+            if key_references:
+                to_create.append(self.get_snapshot(key_references))
+            self.snapshot_model_cls.objects.bulk_create(to_create)
+            created += len(to_create)
+            if not names:
+                self.mark_complete()
+        return created
+
+    def write(self, references_by_key=None, existing=None):
+        """Updates, creates or, if a key has no references,
+        deletes the snapshot for each key.
+
+        `existing` is a dictionary of the snapshots by key, if
+        already fetched.
+        """
+        keys = list(references_by_key)
+        if not keys:
+            return
+        if existing is None:
+            existing = {
+                self.key(obj): obj for obj in
+                self.snapshot_model_cls.objects.filter(self.get_key_q(keys))}
+        to_create = []
+        to_update = []
+        to_delete = []
+        modified = get_utcnow()
+        for key, references in references_by_key.items():
+            snapshot = existing.get(key)
+            if not references:
+                if snapshot:
+                    to_delete.append(snapshot.pk)
+            elif snapshot:
+                snapshot.set_values(references)
+                snapshot.modified = modified
+                to_update.append(snapshot)
+            else:
+                to_create.append(self.get_snapshot(references))
+        with transaction.atomic():
+            if to_delete:
+                self.snapshot_model_cls.objects.filter(pk__in=to_delete).delete()
+            if to_create:
+                self.snapshot_model_cls.objects.bulk_create(to_create)
+            if to_update:
+                self.snapshot_model_cls.objects.bulk_update(
+                    to_update, fields=['payload', 'modified'])
+
+    def get_snapshot(self, references=None):
+        """Returns an unsaved snapshot for the references of one
+        group.
+        """
+        snapshot = self.snapshot_model_cls(
+            identifier=references[0].identifier,
+            timepoint=references[0].timepoint,
+            report_datetime=references[0].report_datetime,
+            model=references[0].model)
+        snapshot.set_values(references)
+        return snapshot
+
+    @staticmethod
+    def get_q(groups=None):
+        q = Q()
+        for identifier, timepoint, model in groups:
+            q |= Q(identifier=identifier, timepoint=timepoint, model=model)
+        return q
+
+    @staticmethod
+    def get_key_q(keys=None):
+        q = Q()
+        for identifier, timepoint, report_datetime, model in keys:
+            q |= Q(identifier=identifier, timepoint=timepoint,
+                   report_datetime=report_datetime, model=model)
+        return q
+
+
+reference_snapshot_updater = ReferenceSnapshotUpdater()
@@ -1,5 +1,13 @@
+import warnings
+
+from django.apps import apps as django_apps
+
+from ..reference_model_config import ReferenceFieldValidationError
 from ..site import site_reference_configs
+from .instrumentation import reference_instrumentation
+from .reference_cache import invalidate_references
 from .reference_getter import ReferenceGetter
+from .reference_snapshot_updater import reference_snapshot_updater
 
 
 class ReferenceFieldNotFound(Exception):
@@ -13,48 +21,160 @@ class ReferenceUpdaterModelError(Exception):
 class ReferenceUpdater:
     """Updates or creates each reference model instance; one for
     each field in `edc_reference` for this model_obj.
+
+    Existing references are fetched in one query. References whose
+    value, datatype and related_name are unchanged are not saved
+    and are counted in `skipped`.
+
+    If enabled, the `ReferenceSnapshot` for this model_obj is
+    updated from the same references.
+
+    `getter_cls` is deprecated. If overridden, a DeprecationWarning
+    is issued and references are fetched and saved with it one
+    field at a time, as before.
     """
 
     getter_cls = ReferenceGetter
     crf_visit_attr = 'visit'
+    snapshot_updater = reference_snapshot_updater
+    instrumentation = reference_instrumentation
 
     def __init__(self, model_obj=None):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        if model_obj is not None:
+            with self.instrumentation.measure(
+                    operation='updater', name=model_obj.reference_name) as measurement:
+                self.update_references(model_obj=model_obj)
+                measurement.rows_read = self.updated + self.skipped
+                measurement.rows_written = self.created + self.updated
 
-        reference_fields = site_reference_configs.get_fields(
+    def __repr__(self):
+        return (f'{self.__class__.__name__}() created={self.created}, '
+                f'updated={self.updated}, skipped={self.skipped}')
+
+    def update_references(self, model_obj=None):
+        """Updates or creates each reference model instance, one
+        field at a time, skipping those that have not changed.
+        """
+        if self.getter_cls is not ReferenceGetter:
+            warnings.warn(
+                f'{self.__class__.__name__}.getter_cls is deprecated. References '
+                f'are fetched in one query unless getter_cls is overridden.',
+                DeprecationWarning, stacklevel=2)
+            return self.update_references_with_getter(model_obj=model_obj)
+        reference_model = site_reference_configs.get_reference_model(
             name=model_obj.reference_name)
-        # loop through fields and update or create each
-        # reference model instance
-        for field_name in reference_fields:
-            try:
-                field_obj = [fld for fld in model_obj._meta.get_fields()
-                             if fld.name == field_name][0]
-            except IndexError:
-                raise ReferenceFieldNotFound(
-                    f'Reference field not found on model. Got \'{field_name}\'. '
-                    f'See reference {model_obj.reference_name}. '
-                    f'Model fields are {[fld.name for fld in model_obj._meta.get_fields()]}')
-            reference = self.getter_cls(
-                model_obj=model_obj,
-                field_name=field_name,
-                create=True)
-            if field_obj.name == 'report_datetime':
+        reference_model_cls = django_apps.get_model(reference_model)
+        options = self.get_options(model_obj=model_obj)
+        existing = {
+            obj.field_name: obj
+            for obj in reference_model_cls.objects.filter(**options)}
+        update_fields = list(reference_model_cls.get_value_fields().values()) + [
+            'datatype', 'related_name']
+        for field_name, value, internal_type, related_name, value_field in (
+                self.get_values(model_obj=model_obj)):
+            reference = existing.get(field_name)
+            opts = dict(
+                value=value,
+                internal_type=internal_type,
+                related_name=related_name,
+                value_field=value_field)
+            if reference is None:
+                reference = reference_model_cls(field_name=field_name, **options)
+                reference.set_value(**opts)
+                reference.save(force_insert=True)
+                existing.update({field_name: reference})
+                self.created += 1
+            else:
+                stored = [getattr(reference, f) for f in update_fields]
+                reference.set_value(**opts)
+                if stored == [getattr(reference, f) for f in update_fields]:
+                    self.skipped += 1
+                else:
+                    reference.save()
+                    self.updated += 1
+        if self.created or self.updated:
+            if self.snapshot_updater.enabled:
+                self.snapshot_updater.update(references=existing.values())
+            invalidate_references(
+                identifier=options.get('identifier'),
+                timepoint=options.get('timepoint'),
+                model=options.get('model'))
+
+    def update_references_with_getter(self, model_obj=None):
+        """Updates or creates each reference model instance with
+        `getter_cls`, one get and save per field.
+        """
+        getter = None
+        references = []
+        for field_name, value, internal_type, related_name, value_field in (
+                self.get_values(model_obj=model_obj)):
+            getter = self.getter_cls(
+                model_obj=model_obj, field_name=field_name, create=True)
+            getter.object.set_value(
+                internal_type=internal_type,
+                value=value,
+                related_name=related_name,
+                value_field=value_field)
+            getter.object.save()
+            references.append(getter.object)
+            self.updated += 1
+        if getter:
+            if self.snapshot_updater.enabled:
+                self.snapshot_updater.update(references=references)
+            invalidate_references(
+                identifier=getter.subject_identifier,
+                timepoint=getter.visit_code,
+                model=getter.name)
+
+    def get_options(self, model_obj=None):
+        """Returns the natural key values, less field_name,
+        for the references of this model_obj.
+        """
+        try:
+            # given a crf model as model_obj
+            visit = getattr(model_obj, self.crf_visit_attr)
+        except AttributeError:
+            # given a visit model as model_obj
+            visit = model_obj
+        return dict(
+            identifier=visit.subject_identifier,
+            report_datetime=visit.report_datetime,
+            timepoint=visit.visit_code,
+            model=model_obj.reference_name)
+
+    def get_values(self, model_obj=None):
+        """Returns a list of tuples of (field_name, value,
+        internal_type, related_name, value_field); one for each
+        reference field.
+
+        Values are read from model_obj using the field plan
+        compiled by `ReferenceModelConfig`, no queries are made
+        against the reference model.
+        """
+        values = []
+        reference_config = site_reference_configs.get_config(
+            name=model_obj.reference_name)
+        try:
+            field_plan = reference_config.field_plan
+        except ReferenceFieldValidationError as e:
+            raise ReferenceFieldNotFound(
+                f'Reference field not found on model. {e}')
+        for field_name, attname, internal_type, value_field, related_name in field_plan:
+            if field_name == 'report_datetime':
                 try:
                     visit = getattr(model_obj, self.crf_visit_attr)
                     value = getattr(visit, field_name)
                 except AttributeError:
                     value = getattr(model_obj, field_name)
             else:
-                value = getattr(model_obj, field_name)
-            try:
-                value = value.pk
-            except AttributeError:
-                internal_type = field_obj.get_internal_type()
-                related_name = None
-            else:
-                internal_type = 'UUIDField'
-                related_name = getattr(model_obj, field_name)._meta.label_lower
-            reference.object.update_value(
-                internal_type=internal_type,
-                value=value,
-                related_name=related_name)
-            reference.object.save()
+                value = getattr(model_obj, attname)
+            if related_name:
+                value = getattr(value, 'pk', value)
+                if value is None:
+                    related_name = None
+            values.append(
+                (field_name, value, internal_type, related_name, value_field))
+        return values
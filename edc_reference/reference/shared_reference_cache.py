@@ -0,0 +1,121 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+
+from .pending import writes_pending
+
+
+class SharedReferenceCache:
+    """A cross-process cache of reference model instances using
+    a cache alias from Django's `CACHES` setting.
+
+    Disabled unless `alias` is set. See `EDC_REFERENCE_SHARED_CACHE`
+    in settings.
+
+    Keys include a version per (identifier, timepoint, model) and
+    per (identifier, model). `invalidate` bumps both versions so
+    entries written before an update or delete are never read
+    again and expire with the cache's timeout.
+
+    Inside a transaction, `invalidate_references` bumps the
+    versions when the write is made and again on commit, so a
+    value cached by another process before the commit is not read
+    after it. Until the commit, this thread neither reads nor
+    populates the shared cache, so uncommitted values are never
+    shared and a rollback leaves nothing behind.
+    """
+
+    key_prefix = 'edc_reference'
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(alias={self.alias})'
+
+    @property
+    def enabled(self):
+        return bool(self.alias)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def enable(self, alias=None, timeout=None):
+        self.alias = alias or 'default'
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def disable(self):
+        self.alias = None
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses, alias=self.alias)
+
+    def make_key(self, *parts):
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return f'{self.key_prefix}:{digest}'
+
+    def get_version(self, identifier=None, timepoint=None, model=None):
+        """Returns the current version for this subject, timepoint
+        and reference name. Pass timepoint=None for the version
+        across timepoints.
+        """
+        key = self.make_key('version', identifier, timepoint, model)
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, self.new_version(), timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    @staticmethod
+    def new_version():
+        """Returns a version greater than any version issued before
+        the version key was evicted.
+        """
+        return int(time.time() * 1000000)
+
+    def get_or_set(self, key=None, identifier=None, timepoint=None, model=None,
+                   fetch=None):
+        """Returns the cached value for key under the current version
+        or calls `fetch` and caches the value returned.
+
+        Calls `fetch` without caching while this thread has
+        uncommitted reference writes.
+        """
+        if writes_pending():
+            self.misses += 1
+            return fetch()
+        version = self.get_version(
+            identifier=identifier, timepoint=timepoint, model=model)
+        versioned_key = self.make_key(version, *key)
+        value = self.cache.get(versioned_key)
+        if value is not None:
+            self.hits += 1
+            return value[0]
+        self.misses += 1
+        value = fetch()
+        if self.timeout is None:
+            self.cache.set(versioned_key, (value, ))
+        else:
+            self.cache.set(versioned_key, (value, ), timeout=self.timeout)
+        return value
+
+    def invalidate(self, identifier=None, timepoint=None, model=None):
+        """Bumps the versions for this subject, timepoint and
+        reference name.
+        """
+        for key in [self.make_key('version', identifier, timepoint, model),
+                    self.make_key('version', identifier, None, model)]:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.add(key, self.new_version(), timeout=None)
+
+
+shared_reference_cache = SharedReferenceCache()
@@ -1,4 +1,8 @@
+from collections import namedtuple
 from django.apps import apps as django_apps
+from django.core.exceptions import FieldDoesNotExist
+
+from .reference_record import get_conflicting_field_names, make_record_cls
 
 
 class ReferenceModelValidationError(Exception):
@@ -17,6 +21,10 @@ class ReferenceFieldAlreadyAdded(Exception):
     pass
 
 
+FieldPlan = namedtuple(
+    'FieldPlan', 'field_name attname internal_type value_field related_name')
+
+
 class ReferenceModelConfig:
 
     reference_model = 'edc_reference.reference'
@@ -34,6 +42,8 @@ class ReferenceModelConfig:
         self.field_names.sort()
         self.name = name.lower()
         self.model = '.'.join(name.split('.')[:2])
+        self._field_plan = None
+        self._record_cls = None
 
         if len(fields) != len(self.field_names):
             raise ReferenceDuplicateField(
@@ -47,19 +57,27 @@ class ReferenceModelConfig:
         self.field_names.extend(fields)
         self.field_names = list(set(self.field_names))
         self.field_names.sort()
+        self._field_plan = None
+        self._record_cls = None
 
     def __repr__(self):
         return f'{self.__class__.__name__}(name={self.name}, fields={self.field_names})'
 
     def check(self):
         """Validates the model class by doing a django.get_model lookup
-        and confirming all fields exist on the model class.
+        and confirming all fields exist on the model class and none
+        conflicts with an attribute of `ReferenceRecord`.
         """
         try:
             model_cls = django_apps.get_model(self.model)
         except LookupError:
             raise ReferenceModelValidationError(
                 f'Invalid app label or model name. Got {self.model}. See {repr(self)}.')
+        conflicting = get_conflicting_field_names(self.field_names)
+        if conflicting:
+            raise ReferenceFieldValidationError(
+                f'Invalid reference field. Got {conflicting} conflicts with an '
+                f'attribute of ReferenceRecord. See {repr(self)}.')
         model_field_names = [fld.name for fld in model_cls._meta.get_fields()]
         for field_name in self.field_names:
             if field_name not in model_field_names:
@@ -72,3 +90,59 @@ class ReferenceModelConfig:
         except AttributeError:
             raise ReferenceFieldValidationError(
                 f'Missing reference model mixin. See model {repr(model_cls)}')
+        self._field_plan = self.compile_field_plan()
+
+    @property
+    def field_plan(self):
+        """Returns a list of `FieldPlan` tuples, one per reference
+        field, compiled on first access or by `check`.
+        """
+        if self._field_plan is None:
+            self._field_plan = self.compile_field_plan()
+        return self._field_plan
+
+    @property
+    def record_cls(self):
+        """Returns a slotted `ReferenceRecord` class for this name
+        with one attribute per reference field, generated on first
+        access.
+        """
+        if self._record_cls is None:
+            self._record_cls = make_record_cls(name=self.name, field_names=self.field_names)
+        return self._record_cls
+
+    def compile_field_plan(self):
+        """Returns a list of (field_name, attname, internal_type,
+        value_field, related_name) tuples; one for each reference
+        field.
+
+        For foreign keys to a primary key, `attname` is the column
+        attribute (e.g. subject_visit_id) so the related instance
+        is not fetched. `value_field` is None if the reference
+        model has no value field for the datatype.
+        """
+        model_cls = django_apps.get_model(self.model)
+        reference_model_cls = django_apps.get_model(self.reference_model)
+        value_fields = reference_model_cls.get_value_fields()
+        field_plan = []
+        for field_name in self.field_names:
+            try:
+                field = model_cls._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                raise ReferenceFieldValidationError(
+                    f'Invalid reference field. Got {field_name} not found '
+                    f'on model {repr(model_cls)}. See {repr(self)}.')
+            if field.many_to_one or field.one_to_one:
+                attname = field.name
+                if field.concrete and field.target_field.primary_key:
+                    attname = field.attname
+                internal_type = 'UUIDField'
+                related_name = field.related_model._meta.label_lower
+            else:
+                attname = field.name
+                internal_type = field.get_internal_type()
+                related_name = None
+            field_plan.append(FieldPlan(
+                field_name, attname, internal_type,
+                value_fields.get(internal_type), related_name))
+        return field_plan
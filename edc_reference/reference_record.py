@@ -0,0 +1,86 @@
+class ReferenceRecordError(Exception):
+    pass
+
+
+class ReferenceRecord:
+
+    """A compact record of the reference values of one subject
+    visit for a reference name.
+
+    Do not instantiate directly; each `ReferenceModelConfig`
+    generates a subclass with one slot per reference field, see
+    `ReferenceModelConfig.record_cls`. Instances have no
+    `__dict__` and read like a `Refset`, e.g. `record.field_int`,
+    `record.visit_code`.
+    """
+
+    __slots__ = ('subject_identifier', 'timepoint', 'report_datetime')
+    reserved = ('name', 'model', 'subject_identifier', 'timepoint',
+                'report_datetime', 'visit_code')
+    name = None
+    model = None
+    field_names = ()
+
+    def __init__(self, subject_identifier=None, timepoint=None,
+                 report_datetime=None, values=None):
+        self.subject_identifier = subject_identifier
+        self.timepoint = timepoint
+        self.report_datetime = report_datetime
+        values = values or {}
+        for field_name in self.field_names:
+            setattr(self, field_name, values.get(field_name))
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(name={self.name},'
+                f'subject_identifier={self.subject_identifier},'
+                f'timepoint={self.timepoint}) <{list(self._fields)}>')
+
+    def __eq__(self, other):
+        return (self.__class__ is other.__class__
+                and self.as_tuple() == other.as_tuple())
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    @property
+    def visit_code(self):
+        return self.timepoint
+
+    @property
+    def _fields(self):
+        """Returns a dictionary of field values, as on `Refset`.
+        """
+        fields = {field_name: getattr(self, field_name) for field_name in self.field_names}
+        fields.update(report_datetime=self.report_datetime, visit_code=self.timepoint)
+        return fields
+
+    def as_tuple(self):
+        return (self.subject_identifier, self.timepoint, self.report_datetime,
+                *(getattr(self, field_name) for field_name in self.field_names))
+
+
+def get_conflicting_field_names(field_names=None):
+    """Returns the field names, other than the reserved names,
+    that would shadow an attribute of `ReferenceRecord`, e.g.
+    `field_names` or `as_tuple`.
+    """
+    return [f for f in field_names
+            if f not in ReferenceRecord.reserved and hasattr(ReferenceRecord, f)]
+
+
+def make_record_cls(name=None, field_names=None):
+    """Returns a `ReferenceRecord` subclass for a reference name
+    with a slot for each field name.
+    """
+    conflicting = get_conflicting_field_names(field_names)
+    if conflicting:
+        raise ReferenceRecordError(
+            f'Reference field name conflicts with a ReferenceRecord attribute. '
+            f'Got {conflicting}. See \'{name}\'')
+    field_names = tuple(f for f in field_names if f not in ReferenceRecord.reserved)
+    cls_name = ''.join(part.title() for part in name.split('.')[1:]) + 'Record'
+    return type(cls_name, (ReferenceRecord,), dict(
+        __slots__=field_names,
+        field_names=field_names,
+        name=name,
+        model='.'.join(name.split('.')[:2])))
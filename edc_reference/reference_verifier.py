@@ -0,0 +1,345 @@
+import sys
+
+from django.apps import apps as django_apps
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Collate
+
+from .populater import Populater
+from .reference import BulkReferenceUpdater, BulkReferenceWriter
+from .reference import invalidate_references, reference_snapshot_updater
+from .site import site_reference_configs
+
+
+class ReferenceVerifierError(Exception):
+    pass
+
+
+class ReferenceVerifier:
+
+    """Verifies the reference model against the source models of
+    the registered reference names and, if `repair`=True, fixes
+    only the differences.
+
+    For each name, source rows and references are each read
+    ordered by (identifier, timepoint, report_datetime, pk), one
+    query per `chunk_size` rows by keyset pagination, so no
+    database backend holds more than a chunk in client memory.
+    The two streams are merge-joined on that key so memory is
+    bounded by a chunk of each plus the pending repairs, flushed
+    every `chunk_size` references.
+
+    Both sides are ordered and paged by the identifier and
+    timepoint under a binary collation, see `get_collation`, so
+    the database order matches the Python order of the keys
+    whatever the columns' collation. A stream out of order raises
+    ReferenceVerifierError.
+
+    References of a key with no source row are re-checked against
+    the source model before they are deleted.
+
+    For example:
+
+        verifier = ReferenceVerifier(names=['ambition_subject.bloodresult'])
+        verifier.verify()
+        verifier.summary['ambition_subject.bloodresult']
+        {'missing': 0, 'extra': 2, 'mismatched': 1, 'samples': [...]}
+    """
+
+    bulk_reference_updater_cls = BulkReferenceUpdater
+    bulk_reference_writer_cls = BulkReferenceWriter
+    populater_cls = Populater
+    identifier_attr = 'subject_identifier'
+    timepoint_attr = 'visit_code'
+    chunk_size = 2000
+    max_samples = 10
+    # binary collation by database vendor; on MySQL, derived from
+    # the column's character set. Set `collation` to override.
+    collations = dict(postgresql='C', sqlite='BINARY', oracle='BINARY')
+    collation = None
+
+    def __init__(self, names=None, repair=None, chunk_size=None):
+        self.names = names or list(site_reference_configs.registry)
+        self.repair = repair
+        self.chunk_size = chunk_size or self.chunk_size
+        self.summary = {}
+        self._charsets = {}
+
+    def verify(self):
+        """Verifies each name and returns a dictionary by name of
+        counts of missing, extra and mismatched references.
+        """
+        for name in self.names:
+            sys.stdout.write(f' * {name} ...\r')
+            self.summary.update({name: self.verify_name(name=name)})
+            item = self.summary[name]
+            sys.stdout.write(
+                f' * {name} missing {item["missing"]}, extra {item["extra"]}, '
+                f'mismatched {item["mismatched"]}'
+                f'{" (repaired)" if self.repair else ""}      \n')
+        return self.summary
+
+    def verify_name(self, name=None):
+        reference_model_cls = django_apps.get_model(
+            site_reference_configs.get_reference_model(name=name))
+        updater = self.bulk_reference_updater_cls()
+        writer = self.bulk_reference_writer_cls(reference_model_cls=reference_model_cls)
+        item = dict(missing=0, extra=0, mismatched=0, samples=[])
+        to_write = []
+        to_delete = []
+        orphans = []
+        for expected, existing in self.merge(
+                name=name, reference_model_cls=reference_model_cls, updater=updater):
+            for field_name in set(expected) | set(existing):
+                reference = expected.get(field_name)
+                obj = existing.get(field_name)
+                if obj is None:
+                    difference = 'missing'
+                    to_write.append(reference)
+                elif reference is None:
+                    difference = 'extra'
+                    (to_delete if expected else orphans).append(obj)
+                elif ([getattr(reference, f) for f in writer.update_fields]
+                      != [getattr(obj, f) for f in writer.update_fields]):
+                    difference = 'mismatched'
+                    to_write.append(reference)
+                else:
+                    continue
+                item[difference] += 1
+                if len(item['samples']) < self.max_samples:
+                    item['samples'].append(
+                        (difference, *writer.natural_key(reference or obj)))
+            if len(to_write) + len(to_delete) + len(orphans) >= self.chunk_size:
+                self.flush(name=name, writer=writer, to_write=to_write,
+                           to_delete=to_delete, orphans=orphans)
+                to_write, to_delete, orphans = [], [], []
+        self.flush(name=name, writer=writer, to_write=to_write,
+                   to_delete=to_delete, orphans=orphans)
+        return item
+
+    def merge(self, name=None, reference_model_cls=None, updater=None):
+        """Yields a tuple of dictionaries by field name of
+        (expected, existing) references for each key in either the
+        source model or the reference model.
+
+        Expected references are unsaved instances built from the
+        source row.
+        """
+        sources = self.source_rows(
+            name=name, reference_model_cls=reference_model_cls, updater=updater)
+        groups = self.reference_groups(name=name, reference_model_cls=reference_model_cls)
+        source_key, expected = next(sources, (None, None))
+        group_key, existing = next(groups, (None, None))
+        while source_key is not None or group_key is not None:
+            if group_key is None or (source_key is not None and source_key < group_key):
+                yield expected, {}
+                source_key, expected = next(sources, (None, None))
+            elif source_key is None or group_key < source_key:
+                yield {}, existing
+                group_key, existing = next(groups, (None, None))
+            else:
+                yield expected, existing
+                source_key, expected = next(sources, (None, None))
+                group_key, existing = next(groups, (None, None))
+
+    def source_rows(self, name=None, reference_model_cls=None, updater=None):
+        """Yields (key, expected references by field name) for each
+        source row ordered by key.
+        """
+        queryset = self.get_source_queryset(name=name)
+        previous_key = None
+        for model_obj in self.keyset(
+                queryset=queryset, lookups=self.get_key_lookups(model_cls=queryset.model)):
+            references = updater.get_references(
+                model_obj=model_obj, reference_model_cls=reference_model_cls)
+            key = self.key(references[0])
+            self.check_order(name=name, key=key, previous_key=previous_key)
+            previous_key = key
+            yield (key, {reference.field_name: reference for reference in references})
+
+    def reference_groups(self, name=None, reference_model_cls=None):
+        """Yields (key, references by field name) for each group of
+        references ordered by key.
+        """
+        queryset = reference_model_cls.objects.filter(model=name)
+        group_key = None
+        group = {}
+        for obj in self.keyset(
+                queryset=queryset, lookups=['identifier', 'timepoint', 'report_datetime']):
+            key = self.key(obj)
+            if key != group_key and group:
+                self.check_order(name=name, key=key, previous_key=group_key)
+                yield group_key, group
+                group = {}
+            group_key = key
+            group.update({obj.field_name: obj})
+        if group:
+            yield group_key, group
+
+    def get_source_queryset(self, name=None):
+        return self.populater_cls(names=[name]).get_queryset(name=name)
+
+    def keyset(self, queryset=None, lookups=None):
+        """Yields the rows of the queryset ordered by the
+        identifier, timepoint and report_datetime `lookups` and pk,
+        `chunk_size` rows per query.
+
+        Each query continues after the last key of the previous
+        one, compared under the same collation as the ordering.
+        """
+        identifier, timepoint, report_datetime = lookups
+        fields = ['key_identifier', 'key_timepoint', 'key_report_datetime', 'pk']
+        queryset = queryset.annotate(
+            key_identifier=self.collate(identifier, queryset),
+            key_timepoint=self.collate(timepoint, queryset),
+            key_report_datetime=F(report_datetime)).order_by(*fields)
+        last = None
+        while True:
+            qs = queryset
+            if last is not None:
+                qs = qs.filter(self.after(fields=fields, values=last))
+            chunk = list(qs[:self.chunk_size])
+            if not chunk:
+                break
+            yield from chunk
+            last = [getattr(chunk[-1], f) for f in fields]
+
+    @staticmethod
+    def after(fields=None, values=None):
+        """Returns a Q for rows after `values` in the order of
+        `fields`.
+        """
+        q = Q()
+        for index, field in enumerate(fields):
+            q |= Q(**dict(zip(fields[:index], values[:index])),
+                   **{f'{field}__gt': values[index]})
+        return q
+
+    def collate(self, lookup=None, queryset=None):
+        """Returns `lookup` under the binary collation of the
+        queryset's database, if known.
+        """
+        collation = self.get_collation(lookup=lookup, queryset=queryset)
+        return Collate(lookup, collation) if collation else F(lookup)
+
+    def get_collation(self, lookup=None, queryset=None):
+        """Returns `collation`, if set, or the binary collation for
+        the database vendor or, on MySQL, for the character set of
+        the column, e.g. utf8mb4_bin or utf8mb3_bin.
+        """
+        if self.collation:
+            return self.collation
+        connection = connections[queryset.db]
+        if connection.vendor == 'mysql':
+            charset = self.get_charset(
+                connection=connection, field=self.get_field(queryset.model, lookup))
+            return f'{charset}_bin' if charset else None
+        return self.collations.get(connection.vendor)
+
+    def get_charset(self, connection=None, field=None):
+        """Returns the MySQL character set of the field's column.
+        """
+        key = (connection.alias, field.model._meta.db_table, field.column)
+        if key not in self._charsets:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT CHARACTER_SET_NAME FROM information_schema.COLUMNS '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s '
+                    'AND COLUMN_NAME = %s', key[1:])
+                row = cursor.fetchone()
+            self._charsets[key] = row[0] if row else None
+        return self._charsets[key]
+
+    @staticmethod
+    def get_field(model_cls=None, lookup=None):
+        """Returns the model field of a lookup that may follow
+        relations, e.g. `subject_visit__subject_identifier`.
+        """
+        *path, field_name = lookup.split('__')
+        for name in path:
+            model_cls = model_cls._meta.get_field(name).related_model
+        return model_cls._meta.get_field(field_name)
+
+    @staticmethod
+    def check_order(name=None, key=None, previous_key=None):
+        if previous_key is not None and key < previous_key:
+            raise ReferenceVerifierError(
+                f'Rows are not in key order; the database collation does not match. '
+                f'Got {key} after {previous_key}. See {name}.')
+
+    @staticmethod
+    def key(reference=None):
+        return (reference.identifier, reference.timepoint, reference.report_datetime)
+
+    def get_key_lookups(self, model_cls=None):
+        """Returns the lookups for identifier, timepoint and
+        report_datetime on the model or on its visit model.
+        """
+        attrs = [self.identifier_attr, self.timepoint_attr, 'report_datetime']
+        field_names = [fld.name for fld in model_cls._meta.concrete_fields]
+        if all(attr in field_names for attr in attrs):
+            return attrs
+        for fld in model_cls._meta.concrete_fields:
+            if fld.many_to_one or fld.one_to_one:
+                related_names = [f.name for f in fld.related_model._meta.concrete_fields]
+                if all(attr in related_names for attr in attrs):
+                    return [f'{fld.name}__{attr}' for attr in attrs]
+        raise ReferenceVerifierError(
+            f'Unable to determine the visit of model. Expected a foreign key to a '
+            f'model with fields {attrs}. Got {model_cls._meta.label_lower}.')
+
+    def flush(self, name=None, writer=None, to_write=None, to_delete=None,
+              orphans=None):
+        """Writes missing and mismatched references and deletes
+        extra references if `repair`=True.
+
+        `orphans`, extra references of keys with no source row, are
+        deleted only if the source model still has no row for the
+        key.
+        """
+        if not self.repair:
+            return
+        if to_write:
+            writer.write(references=to_write)
+        to_delete = (to_delete or []) + self.unsourced(name=name, references=orphans)
+        if to_delete:
+            pks = [obj.pk for obj in to_delete]
+            with transaction.atomic():
+                for index in range(0, len(pks), writer.batch_size):
+                    writer.reference_model_cls.objects.filter(
+                        pk__in=pks[index:index + writer.batch_size]).delete()
+            groups = {(obj.identifier, obj.timepoint, obj.model) for obj in to_delete}
+            if reference_snapshot_updater.enabled:
+                reference_snapshot_updater.refresh(
+                    reference_model_cls=writer.reference_model_cls, groups=groups)
+            for identifier, timepoint, model in groups:
+                invalidate_references(
+                    identifier=identifier, timepoint=timepoint, model=model)
+
+    def unsourced(self, name=None, references=None, batch_size=100):
+        """Returns the references whose key has no row in the
+        source model, checked by equality in the database.
+
+        Identifier and timepoint are compared case-insensitively so
+        that a row matched under a case-insensitive collation is
+        treated as a source row.
+        """
+        if not references:
+            return []
+        queryset = self.get_source_queryset(name=name)
+        lookups = self.get_key_lookups(model_cls=queryset.model)
+        keys = list({self.key(obj) for obj in references})
+        sourced = set()
+        for index in range(0, len(keys), batch_size):
+            q = Q()
+            for key in keys[index:index + batch_size]:
+                q |= Q(**dict(zip(lookups, key)))
+            sourced.update(
+                self.folded_key(key) for key in queryset.filter(q).values_list(*lookups))
+        return [obj for obj in references
+                if self.folded_key(self.key(obj)) not in sourced]
+
+    @staticmethod
+    def folded_key(key=None):
+        identifier, timepoint, report_datetime = key
+        return (str(identifier).casefold(), str(timepoint).casefold(), report_datetime)
@@ -1,3 +1,4 @@
+from .cohort_refset import CohortLongitudinalRefset
 from .fieldset import Fieldset, FieldsetError
 from .longitudinal_refset import LongitudinalRefset
 from .longitudinal_refset import NoRefsetObjectsExist, InvalidOrdering
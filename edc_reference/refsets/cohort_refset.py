@@ -0,0 +1,100 @@
+from django.apps import apps as django_apps
+
+from .longitudinal_refset import LongitudinalRefset
+
+
+class CohortLongitudinalRefset:
+    """A collection of `LongitudinalRefset` objects, one per subject,
+    for a list or queryset of subject identifiers.
+
+    References are loaded `chunk_size` subjects at a time with
+    two queries per chunk and grouped by subject in memory.
+
+    Iterate to get (subject_identifier, longitudinal_refset)
+    tuples or use `columns` for a columnar result.
+
+    If `compact`=True, each visit is a compact record instead of
+    a `Refset`, see `LongitudinalRefset`.
+    """
+
+    longitudinal_refset_cls = LongitudinalRefset
+    chunk_size = 500
+
+    def __init__(self, name=None, subject_identifiers=None, visit_model=None,
+                 reference_model_cls=None, chunk_size=None, compact=None, **options):
+        self.name = name
+        self.compact = compact
+        self.visit_model = visit_model
+        self.subject_identifiers = subject_identifiers
+        self.chunk_size = chunk_size or self.chunk_size
+        self.options = options
+        try:
+            reference_model_cls = django_apps.get_model(reference_model_cls)
+        except AttributeError:
+            pass
+        self.reference_model_cls = reference_model_cls
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(name={self.name}, '
+                f'visit_model={self.visit_model})')
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            visit_references = {}
+            for visit_reference in self.reference_model_cls.objects.filter(
+                    identifier__in=chunk,
+                    model=self.visit_model,
+                    field_name='report_datetime',
+                    **self.options):
+                visit_references.setdefault(
+                    visit_reference.identifier, []).append(visit_reference)
+            references = {}
+            for reference in self.reference_model_cls.objects.filter(
+                    identifier__in=chunk, model=self.name):
+                references.setdefault(
+                    reference.identifier, []).append(reference)
+            for subject_identifier in chunk:
+                yield subject_identifier, self.longitudinal_refset_cls(
+                    name=self.name,
+                    subject_identifier=subject_identifier,
+                    visit_model=self.visit_model,
+                    reference_model_cls=self.reference_model_cls,
+                    visit_references=visit_references.get(
+                        subject_identifier, []),
+                    references=references.get(subject_identifier, []),
+                    compact=self.compact)
+
+    def chunks(self):
+        """Yields lists of unique subject identifiers of length
+        `chunk_size` or less.
+        """
+        chunk = []
+        seen = set()
+        for subject_identifier in self.subject_identifiers:
+            if subject_identifier in seen:
+                continue
+            seen.add(subject_identifier)
+            chunk.append(subject_identifier)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def columns(self, *field_names):
+        """Returns a dictionary of equal length lists keyed by
+        subject_identifier, timepoint, report_datetime and each
+        field name; one row per subject visit ordered by
+        report_datetime.
+        """
+        columns = {k: [] for k in [
+            'subject_identifier', 'timepoint', 'report_datetime', *field_names]}
+        for subject_identifier, longitudinal_refset in self:
+            for refset in longitudinal_refset:
+                columns['subject_identifier'].append(subject_identifier)
+                columns['timepoint'].append(refset.timepoint)
+                columns['report_datetime'].append(refset.report_datetime)
+                for field_name in field_names:
+                    columns[field_name].append(
+                        getattr(refset, field_name, None))
+        return columns
@@ -1,44 +1,88 @@
+from array import array
+
+
 class FieldsetError(Exception):
     pass
 
 
 class Fieldset:
+    """A class that represents the values of one field across a
+    list of refsets.
+
+    Values are held in columns, one list per field name, read
+    from the refsets once. Ordering and filtering keep arrays
+    of row indices into the columns; neither the refsets nor
+    the columns are re-sorted. The list of refsets is copied so
+    that re-sorting the caller's list, e.g. by
+    `LongitudinalRefset.order_by`, does not pair the columns
+    with the wrong rows.
+    """
+
     def __init__(self, field=None, refsets=None):
-        self._values = None
         self.field = field
-        self._refsets = refsets
+        self.ordering = None
         self._filter_values = None
-        self.all()
+        self._refsets = refsets
+        self.column(self.field)
 
     def __repr__(self):
         return f'{self.__class__.__name__}(field={self.field}, refsets={self._refsets})'
 
     def __iter__(self):
-        return iter(self.values)
+        column = self.column(self.field)
+        return (column[i] for i in self._index)
 
     def __getitem__(self, i):
-        return self._values[i]
+        column = self.column(self.field)
+        if isinstance(i, slice):
+            return [column[j] for j in self._index[i]]
+        return column[self._index[i]]
 
     def __len__(self):
-        return len(self._values)
+        return len(self._index)
+
+    @property
+    def _refsets(self):
+        return self._refset_list
+
+    @_refsets.setter
+    def _refsets(self, refsets):
+        """Sets the refsets and resets the columns and indices.
+        """
+        self._refset_list = list(refsets or [])
+        self._columns = {}
+        self._order = array('l', range(len(self._refset_list)))
+        self._index = self._order
 
     @property
     def values(self):
-        return self._values
+        return list(self)
+
+    def column(self, field=None):
+        """Returns the list of values of `field`, one per refset,
+        in the original order of the refsets.
+        """
+        try:
+            return self._columns[field]
+        except KeyError:
+            column = [getattr(refset, field) for refset in self._refsets]
+            self._columns.update({field: column})
+            return column
 
     def all(self):
-        self._values = [getattr(t, self.field) for t in self._refsets]
+        self._index = self._order
         return self
 
     def filter(self, *values):
         if len(values) > 0:
-            self._values = [v for v in self._values if v in values]
+            column = self.column(self.field)
+            self._index = array('l', (i for i in self._index if column[i] in values))
             self._filter_values = values
         return self
 
     def order_by(self, field=None):
-        """Re-order the collection ref objects by a single field
-        and rebuild the values list.
+        """Re-orders the row indices by a single field and resets
+        the values to all, re-applying the last filter.
         """
         field = field or 'report_datetime'
         self.ordering = field
@@ -54,8 +98,9 @@ class Fieldset:
         except IndexError:
             pass
         else:
-            self._refsets.sort(
-                key=lambda x: getattr(x, field) or 0, reverse=reverse)
+            column = self.column(field)
+            self._order = array('l', sorted(
+                self._order, key=lambda i: column[i] or 0, reverse=reverse))
         self.all()
         if self._filter_values:
             self.filter(*self._filter_values)
@@ -66,26 +111,23 @@ class Fieldset:
 
         Excludes None.
         """
-        if value:
-            values = [v for v in self._values if v == value]
-        else:
-            values = [v for v in self._values if v is not None]
-        try:
-            return values[0]
-        except IndexError:
-            return None
+        return next(self._matching(value=value, indices=self._index), None)
 
     def last(self, value=None):
         """Returns the last value from the list of values.
 
         Excludes None.
         """
+        return next(self._matching(value=value, indices=reversed(self._index)), None)
+
+    def count(self, value=None):
+        """Returns the number of values equal to `value` or, if not
+        given, the number of values that are not None.
+        """
+        return sum(1 for _ in self._matching(value=value, indices=self._index))
+
+    def _matching(self, value=None, indices=None):
+        column = self.column(self.field)
         if value:
-            values = [v for v in self.values if v == value][-1:]
-        else:
-            values = [v for v in self._values if v is not None][-1:]
-            # values = self.values[-1:]
-        try:
-            return values[0]
-        except IndexError:
-            return None
+            return (column[i] for i in indices if column[i] == value)
+        return (column[i] for i in indices if column[i] is not None)
@@ -1,6 +1,11 @@
 from copy import copy
 from django.apps import apps as django_apps
 
+from ..reference.instrumentation import reference_instrumentation
+from ..reference.reference_prefetch import get_prefetched
+from ..reference.reference_snapshot_updater import reference_snapshot_updater
+from ..reference.shared_reference_cache import shared_reference_cache
+from ..site import SiteReferenceConfigError, site_reference_configs
 from .fieldset import Fieldset
 from .refset import Refset
 
@@ -19,58 +24,314 @@ class NoRefsetObjectsExist(Exception):
 
 class LongitudinalRefset:
     """A collection of a subject's `Refset` objects for a given visit model.
+
+    Visit references and the references for `name` are each
+    fetched in one query and grouped by timepoint in memory,
+    unless already fetched and passed as `visit_references`
+    and `references` or served by an active `ReferencePrefetch`
+    scope, the `ReferenceSnapshot` model or the shared cache.
+
+    `report_datetime_from`, `report_datetime_to` and `timepoints`
+    limit the visits in the SQL against the visit references.
+
+    If `lazy`=True, nothing is fetched until first accessed.
+    Indexing and slicing, e.g. `refset[-1]` or `refset[-3:]`, in
+    the default ordering fetch only the selected visits and their
+    references, each refset built once. Other access fetches all.
+    Where a prefetch scope, the snapshot or the shared cache can
+    serve the subject, it is read for all visits and the selection
+    made in memory; otherwise the selection is made in the SQL.
+
+    If `compact`=True, each visit is a slotted record generated for
+    `name` (see `ReferenceModelConfig.record_cls`) instead of a
+    `Refset`; attribute access is the same at a fraction of the
+    memory.
     """
 
     fieldset_cls = Fieldset
+    instrumentation = reference_instrumentation
     refset_cls = Refset
+    shared_cache = shared_reference_cache
+    snapshot_updater = reference_snapshot_updater
 
     def __init__(self, name=None, subject_identifier=None, visit_model=None,
-                 reference_model_cls=None, **options):
+                 reference_model_cls=None, visit_references=None,
+                 references=None, lazy=None, report_datetime_from=None,
+                 report_datetime_to=None, timepoints=None, compact=None, **options):
         self.name = name
         self.model = '.'.join(name.split('.')[:2])
         self.ordering = None
         self.subject_identifier = subject_identifier
+        self.visit_model = visit_model
         try:
             reference_model_cls = django_apps.get_model(reference_model_cls)
         except AttributeError:
             pass
-        opts = dict(
-            identifier=self.subject_identifier,
-            model=visit_model,
-            field_name='report_datetime',
-            **options)
-        try:
-            self.visit_references = reference_model_cls.objects.filter(**opts)
-        except ValueError as e:
-            raise LongitudinalRefsetError(
-                f'{e}. name={self.name}. Got {opts}.')
+        self.reference_model_cls = reference_model_cls
+        self.record_cls = None
+        if compact:
+            try:
+                self.record_cls = site_reference_configs.get_config(name=self.name).record_cls
+            except SiteReferenceConfigError as e:
+                raise LongitudinalRefsetError(f'{e}. See {self.__class__.__name__}.')
+        if report_datetime_from:
+            options.update(report_datetime__gte=report_datetime_from)
+        if report_datetime_to:
+            options.update(report_datetime__lte=report_datetime_to)
+        if timepoints is not None:
+            options.update(timepoint__in=list(timepoints))
+        self.options = options
+        self._materialized = None
+        self._visit_references = None
+        self._refsets_by_timepoint = {}
+        if lazy and visit_references is None and references is None:
+            self.ordering = 'report_datetime'
+            try:
+                fields = list(site_reference_configs.get_fields(name=self.name))
+            except SiteReferenceConfigError:
+                # not registered, see `order_by`
+                fields = []
+            self.ordering_attrs = list(set(
+                self.refset_cls.ordering_attrs + ['visit_code'] + fields))
+        else:
+            self.materialize(visit_references=visit_references, references=references)
+
+    def materialize(self, visit_references=None, references=None):
+        """Fetches, unless given, all visit references and
+        references and builds a refset for each visit.
+        """
+        with self.instrumentation.measure(
+                operation='longitudinal', name=self.name) as measurement:
+            references_by_timepoint = self.get_references_by_timepoint(
+                visit_model=self.visit_model, reference_model_cls=self.reference_model_cls,
+                visit_references=visit_references, references=references,
+                measurement=measurement, **self.options)
         self._refsets = []
         for visit_reference in self.visit_references:
             self._refsets.append(
-                self.refset_cls(
-                    name=self.name,
-                    subject_identifier=subject_identifier,
-                    report_datetime=visit_reference.report_datetime,
-                    timepoint=visit_reference.timepoint,
-                    reference_model_cls=reference_model_cls))
+                self.get_refset(
+                    visit_reference=visit_reference,
+                    references=references_by_timepoint.get(visit_reference.timepoint, [])))
         self.ordering_attrs = copy(self.refset_cls.ordering_attrs)
         for refset in self._refsets:
             self.ordering_attrs.extend(list(refset._fields))
         self.ordering_attrs = list(set(self.ordering_attrs))
         self.order_by('report_datetime')
 
+    def get_refset(self, visit_reference=None, references=None):
+        if self.record_cls:
+            return self.record_cls(
+                subject_identifier=self.subject_identifier,
+                timepoint=visit_reference.timepoint,
+                report_datetime=visit_reference.report_datetime,
+                values={obj.field_name: obj.value for obj in references})
+        return self.refset_cls(
+            name=self.name,
+            subject_identifier=self.subject_identifier,
+            report_datetime=visit_reference.report_datetime,
+            timepoint=visit_reference.timepoint,
+            reference_model_cls=self.reference_model_cls,
+            references=references)
+
+    @property
+    def _refsets(self):
+        if self._materialized is None:
+            self.materialize()
+        return self._materialized
+
+    @_refsets.setter
+    def _refsets(self, refsets):
+        self._materialized = refsets
+
+    @property
+    def visit_references(self):
+        if self._visit_references is None:
+            self.materialize()
+        return self._visit_references
+
+    @visit_references.setter
+    def visit_references(self, visit_references):
+        self._visit_references = visit_references
+
     def __repr__(self):
         return f'{self.__class__.__name__}({self._refsets})'
 
+    def get_references_by_timepoint(self, visit_model=None, reference_model_cls=None,
+                                    visit_references=None, references=None,
+                                    measurement=None, **options):
+        """Sets the visit references and returns a dictionary of
+        the references for `name` by timepoint.
+        """
+        opts = dict(
+            identifier=self.subject_identifier,
+            model=visit_model,
+            field_name='report_datetime',
+            **options)
+        if visit_references is None and not options:
+            visit_references = self.get_references(
+                reference_model_cls=reference_model_cls, **opts)
+        if visit_references is None:
+            try:
+                visit_references = reference_model_cls.objects.filter(**opts)
+            except ValueError as e:
+                raise LongitudinalRefsetError(
+                    f'{e}. name={self.name}. Got {opts}.')
+        self.visit_references = visit_references
+        if references is None:
+            references = self.get_references(
+                reference_model_cls=reference_model_cls,
+                identifier=self.subject_identifier, model=self.name)
+        references_by_timepoint = {}
+        for reference in references:
+            references_by_timepoint.setdefault(
+                reference.timepoint, []).append(reference)
+        measurement.rows_read = len(references) + len(self.visit_references)
+        return references_by_timepoint
+
+    def get_references(self, reference_model_cls=None, identifier=None,
+                       model=None, **opts):
+        """Returns the reference model instances for this subject
+        and model across timepoints from an active prefetch scope,
+        the snapshot, for `name` only, or the shared cache, if
+        enabled, or the database.
+        """
+        opts.update(identifier=identifier, model=model)
+        references = get_prefetched(
+            reference_model_cls=reference_model_cls, **opts)
+        if (references is None and self.snapshot_updater.readable
+                and model == self.name):
+            references = self.snapshot_updater.snapshot_model_cls.objects.get_references(
+                **opts)
+        if references is None and self.shared_cache.enabled:
+            references = self.shared_cache.get_or_set(
+                key=('longitudinal', *sorted(opts.items())),
+                identifier=identifier,
+                model=model,
+                fetch=lambda: list(reference_model_cls.objects.filter(**opts)))
+        if references is None:
+            references = reference_model_cls.objects.filter(**opts)
+        return references
+
     def __iter__(self):
         return iter(self._refsets)
 
     def __getitem__(self, i):
+        if self._materialized is None and self.ordering == 'report_datetime':
+            visit_references = self.get_visit_references(i)
+            if visit_references is not None:
+                refsets = self.get_refsets(visit_references=visit_references)
+                if isinstance(i, slice):
+                    return refsets
+                try:
+                    return refsets[0]
+                except IndexError:
+                    raise IndexError('list index out of range')
         return self._refsets[i]
 
+    def get_visit_queryset(self):
+        """Returns a queryset of this subject's visit references,
+        with the filters applied, in the default ordering.
+        """
+        return self.reference_model_cls.objects.filter(
+            identifier=self.subject_identifier,
+            model=self.visit_model,
+            field_name='report_datetime',
+            **self.options).order_by('report_datetime', 'timepoint')
+
+    def get_visit_references(self, i=None):
+        """Returns a list of the visit references selected by an
+        index or a slice, or None if the selection needs all visit
+        references.
+
+        Selected in memory from `get_served_visit_references`, if
+        not None, otherwise with the offset and limit in the SQL.
+        """
+        visit_references = self.get_served_visit_references()
+        if visit_references is not None:
+            if isinstance(i, slice):
+                return visit_references[i]
+            try:
+                return [visit_references[i]]
+            except IndexError:
+                return []
+        queryset = self.get_visit_queryset()
+        reverse = queryset.reverse()
+        if not isinstance(i, slice):
+            if i < 0:
+                return list(reverse[-i - 1:-i])
+            return list(queryset[i:i + 1])
+        if i.step not in [None, 1]:
+            return None
+        start, stop = i.start or 0, i.stop
+        if start < 0 and stop is None:
+            return list(reverse[:-start])[::-1]
+        if start >= 0 and stop is not None and stop >= 0:
+            return list(queryset[start:stop])
+        return None
+
+    def get_served_visit_references(self):
+        """Returns a list of all of this subject's visit references,
+        in the default ordering, from an active prefetch scope or
+        the shared cache, or None if neither serves them.
+
+        As in `materialize`, not with the visit filters.
+        """
+        if self.options:
+            return None
+        opts = dict(identifier=self.subject_identifier, model=self.visit_model,
+                    field_name='report_datetime')
+        references = get_prefetched(reference_model_cls=self.reference_model_cls, **opts)
+        if references is None and self.shared_cache.enabled:
+            references = self.get_references(
+                reference_model_cls=self.reference_model_cls, **opts)
+        if references is None:
+            return None
+        return sorted(references, key=lambda r: (r.report_datetime, r.timepoint))
+
+    def get_refsets(self, visit_references=None):
+        """Returns a refset for each visit reference, fetching the
+        references only for timepoints not already built.
+
+        References are read with `get_references` if the snapshot
+        or the shared cache is enabled, otherwise for the selected
+        timepoints only.
+        """
+        timepoints = [v.timepoint for v in visit_references
+                      if v.timepoint not in self._refsets_by_timepoint]
+        if timepoints:
+            with self.instrumentation.measure(
+                    operation='longitudinal', name=self.name) as measurement:
+                opts = dict(identifier=self.subject_identifier, model=self.name)
+                if self.snapshot_updater.readable or self.shared_cache.enabled:
+                    references = self.get_references(
+                        reference_model_cls=self.reference_model_cls, **opts)
+                else:
+                    references = get_prefetched(
+                        reference_model_cls=self.reference_model_cls, **opts)
+                if references is None:
+                    references = self.reference_model_cls.objects.filter(
+                        timepoint__in=timepoints, **opts)
+                references_by_timepoint = {}
+                for reference in references:
+                    references_by_timepoint.setdefault(
+                        reference.timepoint, []).append(reference)
+                for visit_reference in visit_references:
+                    if visit_reference.timepoint in timepoints:
+                        self._refsets_by_timepoint.update({
+                            visit_reference.timepoint: self.get_refset(
+                                visit_reference=visit_reference,
+                                references=references_by_timepoint.get(
+                                    visit_reference.timepoint, []))})
+                measurement.rows_read = len(visit_references) + len(references)
+        return [self._refsets_by_timepoint[v.timepoint] for v in visit_references]
+
     def order_by(self, field=None):
         """Re-order the collection ref objects by a single field.
         """
+        if (field and self._materialized is None
+                and field.replace('-', '') not in self.ordering_attrs):
+            # lazy and not registered, take the fields from the refsets
+            self.materialize()
         if field and field.replace('-', '') not in self.ordering_attrs:
             raise InvalidOrdering(
                 f'Invalid ordering field. field={field}. Expected one of '
@@ -1,6 +1,9 @@
-from django.core.exceptions import ObjectDoesNotExist
 from edc_reference.site import SiteReferenceConfigError
 
+from ..reference.instrumentation import reference_instrumentation
+from ..reference.reference_prefetch import get_prefetched
+from ..reference.reference_snapshot_updater import reference_snapshot_updater
+from ..reference.shared_reference_cache import shared_reference_cache
 from ..site import site_reference_configs
 
 
@@ -15,12 +18,20 @@ class RefsetOverlappingField(Exception):
 class Refset:
     """An class that represents a queryset of a subject's references for a
     timepoint as a single object.
+
+    References are fetched in one query unless already fetched
+    and passed as `references` or served by an active
+    `ReferencePrefetch` scope, the `ReferenceSnapshot` model or
+    the shared cache.
     """
 
     ordering_attrs = ['report_datetime', 'timepoint']
+    instrumentation = reference_instrumentation
+    shared_cache = shared_reference_cache
+    snapshot_updater = reference_snapshot_updater
 
     def __init__(self, name=None, subject_identifier=None, report_datetime=None,
-                 timepoint=None, reference_model_cls=None):
+                 timepoint=None, reference_model_cls=None, references=None):
         # checking for these values so that field values
         # that are None are so because the reference instance
         # does not exist and not because these values were none.
@@ -51,29 +62,60 @@ class Refset:
             self._fields.pop('report_datetime')
         except KeyError:
             pass
+        if references is None:
+            with self.instrumentation.measure(
+                    operation='refset', name=self.name) as measurement:
+                references = self.get_references(
+                    reference_model_cls=reference_model_cls, **opts)
+                self._update_fields(references=references)
+                measurement.rows_read = len(references)
+        else:
+            self._update_fields(references=references)
+
+    def get_references(self, reference_model_cls=None, **opts):
+        """Returns the reference model instances for this
+        timepoint from an active prefetch scope, the snapshot or
+        the shared cache, if enabled, or the database.
+        """
         try:
-            references = reference_model_cls.objects.filter(**opts)
+            references = get_prefetched(
+                reference_model_cls=reference_model_cls, **opts)
+            if references is None and self.snapshot_updater.readable:
+                references = self.snapshot_updater.snapshot_model_cls.objects.get_references(
+                    **opts)
+            if references is None and self.shared_cache.enabled:
+                references = self.shared_cache.get_or_set(
+                    key=('refset', *sorted(opts.items())),
+                    fetch=lambda: list(self.get_queryset(reference_model_cls, **opts)),
+                    **opts)
+            if references is None:
+                references = self.get_queryset(reference_model_cls, **opts)
         except AttributeError as e:
             raise RefsetError(e)
-        self._update_fields(references=references)
+        return references
+
+    @staticmethod
+    def get_queryset(reference_model_cls=None, **opts):
+        """Returns a queryset of the reference model instances for
+        this timepoint with only the columns a refset reads, see
+        `Reference.refset_fields`.
+        """
+        return reference_model_cls.objects.filter(**opts).only(
+            *reference_model_cls.refset_fields)
 
     def _update_fields(self, references=None):
-        """Gets and updates each reference model instance for
-        each field.
+        """Updates each field from the reference model instances
+        for this timepoint.
         """
-        if references.count() == 0:
+        values = {obj.field_name: obj.value for obj in references}
+        if not values:
             self._fields.update(report_datetime=None)
             for field_name in self._fields:
                 self._fields.update({field_name: None})
                 setattr(self, field_name, None)
         else:
             for field_name in self._fields:
-                try:
-                    obj = references.get(field_name=field_name)
-                except ObjectDoesNotExist:
-                    self._fields.update({field_name: None})
-                else:
-                    self._fields.update({field_name: obj.value})
+                self._fields.update({field_name: values.get(field_name)})
             for key, value in self._fields.items():
                 try:
                     existing_value = getattr(self, key)
@@ -87,6 +129,17 @@ class Refset:
             self._fields.update(report_datetime=self.report_datetime)
             self._fields.update(visit_code=self.timepoint)
 
+    def record(self):
+        """Returns the values of this refset as a compact record,
+        see `ReferenceModelConfig.record_cls`.
+        """
+        record_cls = site_reference_configs.get_config(name=self.name).record_cls
+        return record_cls(
+            subject_identifier=self.subject_identifier,
+            timepoint=self.timepoint,
+            report_datetime=self.report_datetime,
+            values=self._fields)
+
     @property
     def visit_code(self):
         return self.timepoint
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+
+from django.apps import apps as django_apps
+
+from .reference_model_config import ReferenceModelConfig
+
+
+class RegistrySnapshot:
+
+    """A JSON file of the `site_reference_configs` registry that
+    can be loaded in place of autodiscovery.
+
+    The snapshot keeps the name, fields and reference model of
+    each config and the path, modification time and size of each
+    module it depends on, see `Site.get_snapshot_modules`, e.g.
+    `reference_model_configs` and the visit schedules and lab
+    profiles, whether or not imported by autodiscovery. The
+    snapshot is stale, and not loaded, if any of those files
+    changed or INSTALLED_APPS changed.
+
+    Set `EDC_REFERENCE_REGISTRY_SNAPSHOT` in settings to a file
+    path to use it on startup.
+    """
+
+    version = 1
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(path={self.path})'
+
+    def write(self, registry=None, modules=None):
+        """Writes the registry and the fingerprint of the list of
+        module names.
+        """
+        data = dict(
+            version=self.version,
+            apps=self.get_apps(),
+            files=self.get_files(modules=modules),
+            registry={
+                name: dict(
+                    fields=reference_config.field_names,
+                    reference_model=reference_config.reference_model)
+                for name, reference_config in registry.items()})
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def read(self):
+        """Returns a dictionary of `ReferenceModelConfig` instances
+        by name or None if the snapshot does not exist or is stale.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != self.version or data.get('apps') != self.get_apps()
+                or not self.is_current(files=data.get('files'))):
+            return None
+        registry = {}
+        for name, item in data['registry'].items():
+            reference_config = ReferenceModelConfig(name=name, fields=item['fields'])
+            reference_config.reference_model = item['reference_model']
+            registry.update({name: reference_config})
+        return registry
+
+    def is_current(self, files=None):
+        for path, mtime_ns, size in files or []:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if stat.st_mtime_ns != mtime_ns or stat.st_size != size:
+                return False
+        return files is not None
+
+    @staticmethod
+    def get_apps():
+        return [app_config.name for app_config in django_apps.get_app_configs()]
+
+    @staticmethod
+    def get_files(modules=None):
+        """Returns a sorted list of (path, mtime_ns, size) for the
+        source file of each module name.
+        """
+        files = set()
+        for module_name in modules or []:
+            path = getattr(sys.modules.get(module_name), '__file__', None)
+            if path and os.path.exists(path):
+                stat = os.stat(path)
+                files.add((path, stat.st_mtime_ns, stat.st_size))
+        return [list(item) for item in sorted(files)]
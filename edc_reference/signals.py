@@ -1,6 +1,10 @@
-from django.db.models.signals import post_delete
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .reference import invalidate_references, reference_cache
+from .reference import reference_snapshot_updater
+
 
 @receiver(post_delete, weak=False, dispatch_uid="edc_reference_post_delete")
 def reference_post_delete(instance, using, **kwargs):
@@ -8,3 +12,31 @@ def reference_post_delete(instance, using, **kwargs):
         instance.reference_deleter_cls(model_obj=instance)
     except AttributeError:
         pass
+
+
+@receiver(post_save, sender='edc_reference.reference', weak=False,
+          dispatch_uid="edc_reference_cache_post_save")
+@receiver(post_delete, sender='edc_reference.reference', weak=False,
+          dispatch_uid="edc_reference_cache_post_delete")
+def reference_cache_invalidate(instance, signal=None, **kwargs):
+    if reference_snapshot_updater.enabled:
+        if kwargs.get('raw'):
+            # deserialized, e.g. received by edc-sync
+            reference_snapshot_updater.refresh(
+                reference_model_cls=instance.__class__,
+                groups=[reference_snapshot_updater.group(instance)])
+        elif signal is post_delete:
+            # e.g. QuerySet.delete(); once per group on commit
+            reference_snapshot_updater.refresh_on_commit(
+                reference_model_cls=instance.__class__,
+                groups=[reference_snapshot_updater.group(instance)])
+    invalidate_references(
+        identifier=instance.identifier,
+        timepoint=instance.timepoint,
+        model=instance.model)
+
+
+@receiver(request_started, weak=False, dispatch_uid="edc_reference_cache_clear")
+def reference_cache_clear(**kwargs):
+    if reference_cache.enabled:
+        reference_cache.clear()
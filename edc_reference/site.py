@@ -3,13 +3,12 @@ import sys
 
 from django.apps import apps as django_apps
 from django.utils.module_loading import import_module, module_has_submodule
-from edc_visit_schedule.site_visit_schedules import site_visit_schedules
-from edc_lab.site_labs import site_labs
 
 from .reference_model_config import ReferenceDuplicateField, ReferenceModelValidationError
 from .reference_model_config import ReferenceFieldValidationError
 from .reference_model_config import ReferenceModelConfig
 from .reference_model_config import ReferenceFieldAlreadyAdded
+from .registry_snapshot import RegistrySnapshot
 
 
 class AlreadyRegistered(Exception):
@@ -40,22 +39,28 @@ class ReferenceUpdater:
         except SiteReferenceConfigError:
             reference = ReferenceModelConfig(name=name, fields=fields)
         else:
-            for field in fields:
-                try:
-                    reference.add_fields([field])
-                except ReferenceFieldAlreadyAdded:
-                    pass
+            fields = [f for f in fields if f not in reference.field_names]
+            if fields:
+                reference.add_fields(fields)
         return reference
 
 
 class Site:
 
     reference_updater = ReferenceUpdater()
+    registry_snapshot_cls = RegistrySnapshot
+    # all loaded modules of apps with any of these modules are
+    # fingerprinted by `write_snapshot`
+    snapshot_module_names = [
+        'reference_model_configs', 'visit_schedules', 'visit_schedule', 'labs',
+        'lab_profiles']
 
     def __init__(self):
         self.registry = {}
         self.loaded = False
         self.registered_from_visit_schedules = False
+        self.discovered_modules = []
+        self.visit_schedules_discovered = False
 
     def register(self, reference=None):
         if reference.name in self.registry:
@@ -120,70 +125,131 @@ class Site:
     def autodiscover(self, module_name=None):
         """Autodiscovers classes in the reference_model_configs.py file of any
         INSTALLED_APP.
+
+        Only apps with the module are imported. The names of the
+        modules imported are kept in `discovered_modules`, see
+        `write_snapshot`.
         """
         module_name = module_name or 'reference_model_configs'
         sys.stdout.write(f' * checking for {module_name} ...\n')
-        for app in django_apps.app_configs:
+        before_import_modules = set(sys.modules)
+        for app_config in django_apps.get_app_configs():
+            app = app_config.name
+            if not module_has_submodule(app_config.module, module_name):
+                continue
+            before_import_registry = copy.copy(self.registry)
             try:
-                mod = import_module(app)
-                try:
-                    before_import_registry = copy.copy(
-                        site_reference_configs.registry)
-                    import_module(f'{app}.{module_name}')
-                    sys.stdout.write(
-                        f' * registered reference model configs from application \'{app}\'\n')
-                except Exception as e:
-                    if f'No module named \'{app}.{module_name}\'' not in str(e):
-                        site_reference_configs.registry = before_import_registry
-                        if module_has_submodule(mod, module_name):
-                            raise
-            except ModuleNotFoundError:
-                pass
+                import_module(f'{app}.{module_name}')
+            except Exception:
+                self.registry = before_import_registry
+                raise
+            self.discovered_modules.append(f'{app}.{module_name}')
+            sys.stdout.write(
+                f' * registered reference model configs from application \'{app}\'\n')
+        self.discovered_modules.extend(sorted(set(sys.modules) - before_import_modules))
+
+    def write_snapshot(self, path=None):
+        """Writes the registry and the fingerprint of the modules
+        it depends on to a snapshot file, see `get_snapshot_modules`.
+        """
+        self.registry_snapshot_cls(path=path).write(
+            registry=self.registry, modules=self.get_snapshot_modules())
+
+    def get_snapshot_modules(self):
+        """Returns the names of the modules imported by
+        `autodiscover` and of all loaded modules of apps with
+        reference model configs, visit schedules or lab profiles.
+
+        Visit schedules and lab profiles are usually imported before
+        autodiscovery, by `edc_visit_schedule` and `edc_lab`, and
+        drive `register_from_visit_schedule`.
+        """
+        apps = [
+            app_config.name for app_config in django_apps.get_app_configs()
+            if any(f'{app_config.name}.{module_name}' in sys.modules
+                   for module_name in self.snapshot_module_names)]
+        modules = set(self.discovered_modules)
+        for name in list(sys.modules):
+            if any(name == app or name.startswith(f'{app}.') for app in apps):
+                modules.add(name)
+        return sorted(modules)
+
+    def load_snapshot(self, path=None):
+        """Registers the configs from a snapshot file and returns
+        True, or returns False if the file does not exist or is
+        stale.
+        """
+        registry = self.registry_snapshot_cls(path=path).read()
+        if registry is None:
+            return False
+        for reference in registry.values():
+            self._register_if_new(reference)
+        self.loaded = True
+        return True
 
     def register_from_visit_schedule(self, visit_models=None, extra_requisition_fields=None):
         """Registers CRFs and Requisitions for all visits
         under schedules using this visit model.
 
+        Each distinct name is registered once with all of its
+        fields, see `get_names_from_visit_schedule`.
+
         Note: Unscheduled and PRN forms are automatically add as well.
         """
+        if not self.visit_schedules_discovered:
+            from edc_lab.site_labs import site_labs
+            from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+            site_labs.autodiscover(verbose=False)
+            site_visit_schedules.autodiscover(verbose=False)
+            self.visit_schedules_discovered = True
+        self.registered_visit_model = True
+        names = self.get_names_from_visit_schedule(
+            visit_models=visit_models, extra_requisition_fields=extra_requisition_fields)
+        for name, fields in names.items():
+            reference = self.reference_updater.update(
+                name=name, fields=fields, get_config=self.get_config)
+            self._register_if_new(reference)
+
+    def get_names_from_visit_schedule(self, visit_models=None,
+                                      extra_requisition_fields=None):
+        """Returns a dictionary of fields by reference name for
+        the visit models, CRFs and requisitions of all visit
+        schedules, collected in one pass.
+
+        Not memoized; a key that detects every change to the
+        schedules would walk them just the same.
+        """
+        from edc_lab.site_labs import site_labs
+        from edc_visit_schedule.site_visit_schedules import site_visit_schedules
+
         requisition_fields = ['requisition_datetime', 'panel', 'is_drawn',
                               'reason_not_drawn']
         requisition_fields.extend(extra_requisition_fields or [])
-        requisition_fields = list(set(requisition_fields))
-
-        self.registered_visit_model = True
-        site_labs.autodiscover(verbose=False)
-        site_visit_schedules.autodiscover(verbose=False)
+        requisition_fields = sorted(set(requisition_fields))
+        names = {}
         for visit_schedule in site_visit_schedules.registry.values():
             for schedule in visit_schedule.schedules.values():
-                # for visit_model in visit_models[schedule.appointment_model]:
-                for visit_model in visit_models[schedule.appointment_model]:
-                    reference = self.reference_updater.update(
-                        name=visit_model,
-                        fields=['report_datetime'],
-                        get_config=self.get_config)
-                    self._register_if_new(reference)
-                    for visit in schedule.visits.values():
-                        for crf in visit.all_crfs:
-                            reference = self.reference_updater.update(
-                                name=crf.model,
-                                fields=['report_datetime'],
-                                get_config=self.get_config)
-                            self._register_if_new(reference)
-                        for requisition in visit.all_requisitions:
-                            if not requisition.panel.requisition_model:
-                                raise SiteReferenceConfigError(
-                                    'Requisition\'s panel \'requisition_model\' attribute '
-                                    f'not set. See "{requisition}". Has the requisition '
-                                    'been added to a lab profile and registered? Is the '
-                                    'APP in INSTALLED_APPS? Currently '
-                                    'registered lab profiles are '
-                                    f'{list(site_labs._registry)}.')
-                            reference = self.reference_updater.update(
-                                name=f'{requisition.model}.{requisition.panel.name}',
-                                fields=requisition_fields,
-                                get_config=self.get_config)
-                            self._register_if_new(reference)
+                visit_model_names = visit_models[schedule.appointment_model]
+                if isinstance(visit_model_names, str):
+                    visit_model_names = [visit_model_names]
+                for visit_model in visit_model_names:
+                    names.setdefault(visit_model, ['report_datetime'])
+                for visit in schedule.visits.values():
+                    for crf in visit.all_crfs:
+                        names.setdefault(crf.model, ['report_datetime'])
+                    for requisition in visit.all_requisitions:
+                        if not requisition.panel.requisition_model:
+                            raise SiteReferenceConfigError(
+                                'Requisition\'s panel \'requisition_model\' attribute '
+                                f'not set. See "{requisition}". Has the requisition '
+                                'been added to a lab profile and registered? Is the '
+                                'APP in INSTALLED_APPS? Currently '
+                                'registered lab profiles are '
+                                f'{list(site_labs._registry)}.')
+                        names.setdefault(
+                            f'{requisition.model}.{requisition.panel.name}',
+                            requisition_fields)
+        return names
 
     def _register_if_new(self, reference):
         try:
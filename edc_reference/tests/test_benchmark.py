@@ -0,0 +1,88 @@
+import json
+import os
+
+from django.test import TestCase, tag
+
+from ..benchmarks import ReferenceBenchmark, BenchmarkQueryCountError
+from ..benchmarks import RefsetMemoryBenchmark
+from ..reference_model_config import ReferenceModelConfig
+from ..site import site_reference_configs
+
+
+class TestReferenceBenchmark(TestCase):
+
+    """Set EDC_REFERENCE_BENCHMARK_SIZES (e.g. "1,10,100") and
+    EDC_REFERENCE_BENCHMARK_OUTPUT (a file path) in the environment
+    to run larger sizes and keep the results.
+    """
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        site_reference_configs.loaded = False
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_date', 'field_datetime', 'field_int', 'field_str']))
+        sizes = os.environ.get('EDC_REFERENCE_BENCHMARK_SIZES') or '1,3'
+        self.sizes = [int(size) for size in sizes.split(',')]
+
+    @tag('benchmark')
+    def test_query_counts(self):
+        benchmark = ReferenceBenchmark(sizes=self.sizes, repeat=1)
+        benchmark.run()
+        benchmark.check()
+        path = os.environ.get('EDC_REFERENCE_BENCHMARK_OUTPUT')
+        if path:
+            benchmark.write(path)
+
+    def test_results(self):
+        benchmark = ReferenceBenchmark(sizes=[1, 2], repeat=1)
+        results = benchmark.run()
+        self.assertEqual(
+            sorted({(r['operation'], r['size']) for r in results}),
+            sorted((operation, size) for size in [1, 2] for operation in [
+                'updater', 'getter', 'refset', 'longitudinal', 'fieldset',
+                'populater']))
+        for result in results:
+            with self.subTest(result=result):
+                self.assertGreater(result['best'], 0)
+                self.assertGreaterEqual(result['peak_memory'], 0)
+        data = json.loads(benchmark.to_json())
+        self.assertEqual(data['sizes'], [1, 2])
+        self.assertEqual(len(data['results']), len(results))
+
+    def test_check_raises_on_extra_queries(self):
+        benchmark = ReferenceBenchmark(sizes=[1])
+        benchmark.results = [
+            dict(operation='getter', size=1, rows=5, queries=1),
+            dict(operation='getter', size=10, rows=5, queries=1)]
+        benchmark.check()
+        benchmark.results[1].update(queries=2)
+        self.assertRaises(BenchmarkQueryCountError, benchmark.check)
+
+    def test_check_raises_if_queries_grow_with_size(self):
+        benchmark = ReferenceBenchmark(sizes=[1])
+        benchmark.results = [
+            dict(operation='populater', size=1, rows=10, queries=10),
+            dict(operation='populater', size=10, rows=100, queries=14)]
+        benchmark.check()
+        benchmark.results[1].update(queries=100)
+        self.assertRaises(BenchmarkQueryCountError, benchmark.check)
+
+    def test_compare(self):
+        previous = [dict(operation='getter', size=1, queries=1, best=0.002,
+                         peak_memory=1000)]
+        current = [dict(operation='getter', size=1, queries=2, best=0.001,
+                        peak_memory=2000)]
+        comparison = ReferenceBenchmark.compare(previous=previous, current=current)
+        self.assertEqual(comparison[0]['queries'], 1)
+        self.assertEqual(comparison[0]['best'], 0.5)
+        self.assertEqual(comparison[0]['peak_memory'], 2.0)
+
+    def test_record_memory(self):
+        result = RefsetMemoryBenchmark(name='edc_reference.crfone', visits=100).run()
+        self.assertEqual(result['fields'], 4)
+        self.assertGreater(result['record'], 0)
+        self.assertLess(result['record'], result['refset'])
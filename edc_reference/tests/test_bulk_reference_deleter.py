@@ -0,0 +1,104 @@
+from django.db import connection, transaction
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Reference
+from ..reference import BulkReferenceDeleter, DeferredReferenceDeleter
+from ..reference import ReferenceDeleter
+from ..reference_model_config import ReferenceModelConfig
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestBulkReferenceDeleter(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_int']))
+        for subject_identifier in ['1', '2']:
+            for visit_code in ['1000', '2000', '3000']:
+                subject_visit = SubjectVisit.objects.create(
+                    subject_identifier=subject_identifier,
+                    visit_code=visit_code)
+                CrfOne.objects.create(
+                    subject_visit=subject_visit,
+                    field_str='erik',
+                    field_int=100)
+
+    def test_delete_for_queryset(self):
+        deleter = BulkReferenceDeleter()
+        with CaptureQueriesContext(connection) as context:
+            deleter.delete_for_queryset(
+                queryset=CrfOne.objects.filter(
+                    subject_visit__subject_identifier='1'))
+        self.assertLessEqual(len(context.captured_queries), 10)
+        self.assertEqual(deleter.deleted, 6)
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.crfone').count(), 0)
+        self.assertEqual(Reference.objects.filter(
+            identifier='2', model='edc_reference.crfone').count(), 6)
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.subjectvisit').count(), 6)
+
+    def test_delete_for_queryset_batches(self):
+        deleter = BulkReferenceDeleter()
+        deleter.batch_size = 1
+        deleter.delete_for_queryset(queryset=CrfOne.objects.all())
+        self.assertEqual(deleter.deleted, 12)
+        self.assertEqual(Reference.objects.filter(
+            model='edc_reference.crfone').count(), 0)
+
+    def test_delete_for_subject(self):
+        deleter = BulkReferenceDeleter()
+        deleter.delete_for_subject(subject_identifier='1')
+        self.assertEqual(Reference.objects.filter(identifier='1').count(), 0)
+        self.assertEqual(Reference.objects.filter(identifier='2').count(), 12)
+
+    def test_delete_for_subject_by_name(self):
+        deleter = BulkReferenceDeleter()
+        deleter.delete_for_subject(
+            subject_identifier='1', names=['edc_reference.crfone'])
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.crfone').count(), 0)
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.subjectvisit').count(), 6)
+
+    def test_deferred_deletes_on_commit(self):
+        CrfOne.reference_deleter_cls = DeferredReferenceDeleter
+        self.addCleanup(setattr, CrfOne, 'reference_deleter_cls', ReferenceDeleter)
+        with self.captureOnCommitCallbacks() as callbacks:
+            for crf_one in CrfOne.objects.filter(
+                    subject_visit__subject_identifier='1'):
+                crf_one.delete()
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.crfone').count(), 6)
+        with CaptureQueriesContext(connection) as context:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.crfone').count(), 0)
+        self.assertLessEqual(len(context.captured_queries), 7)
+
+    def test_deferred_not_deleted_on_rollback(self):
+        CrfOne.reference_deleter_cls = DeferredReferenceDeleter
+        self.addCleanup(setattr, CrfOne, 'reference_deleter_cls', ReferenceDeleter)
+        crf_one = CrfOne.objects.filter(
+            subject_visit__subject_identifier='1')[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    crf_one.delete()
+                    raise ValueError()
+            except ValueError:
+                pass
+            DeferredReferenceDeleter(model_obj=CrfOne.objects.filter(
+                subject_visit__subject_identifier='2')[0])
+        self.assertEqual(Reference.objects.filter(
+            identifier='1', model='edc_reference.crfone').count(), 6)
+        self.assertEqual(Reference.objects.filter(
+            identifier='2', model='edc_reference.crfone').count(), 6)
@@ -0,0 +1,116 @@
+from datetime import date
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference import BulkReferenceUpdater, ReferenceUpdater
+from ..reference_model_config import ReferenceModelConfig
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestBulkReferenceUpdater(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        self.subject_identifier = '1'
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_date', 'field_datetime',
+                    'field_int', 'report_datetime']))
+        self.subject_visit = SubjectVisit.objects.create(
+            subject_identifier=self.subject_identifier,
+            visit_code='code')
+        self.crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik',
+            field_int=100,
+            field_date=date.today(),
+            field_datetime=get_utcnow())
+        Reference.objects.filter(model='edc_reference.crfone').delete()
+
+    def test_creates_references(self):
+        updater = BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertEqual(updater.writer.created, 5)
+        self.assertEqual(updater.writer.updated, 0)
+        for field_name in ['field_str', 'field_date', 'field_datetime', 'field_int']:
+            with self.subTest(field_name=field_name):
+                reference = Reference.objects.get(
+                    identifier=self.subject_identifier,
+                    model='edc_reference.crfone',
+                    timepoint=self.subject_visit.visit_code,
+                    report_datetime=self.subject_visit.report_datetime,
+                    field_name=field_name)
+                self.assertEqual(
+                    reference.value, getattr(self.crf_one, field_name))
+
+    def test_report_datetime_uses_visit_report_datetime(self):
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        reference = Reference.objects.get(
+            model='edc_reference.crfone', field_name='report_datetime')
+        self.assertEqual(reference.value, self.subject_visit.report_datetime)
+
+    def test_updates_references(self):
+        ReferenceUpdater(model_obj=self.crf_one)
+        self.crf_one.field_str = 'bob'
+        updater = BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertEqual(updater.writer.created, 0)
+        self.assertEqual(updater.writer.updated, 1)
+        self.assertEqual(updater.writer.skipped, 4)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 5)
+        reference = Reference.objects.get(
+            model='edc_reference.crfone', field_name='field_str')
+        self.assertEqual(reference.value, 'bob')
+
+    def test_same_result_as_reference_updater(self):
+        ReferenceUpdater(model_obj=self.crf_one)
+        expected = {obj.field_name: (obj.value, obj.datatype) for obj in
+                    Reference.objects.filter(model='edc_reference.crfone')}
+        Reference.objects.filter(model='edc_reference.crfone').delete()
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertEqual(
+            {obj.field_name: (obj.value, obj.datatype) for obj in
+             Reference.objects.filter(model='edc_reference.crfone')},
+            expected)
+
+    def test_fewer_queries_than_reference_updater(self):
+        with CaptureQueriesContext(connection) as context:
+            ReferenceUpdater(model_obj=self.crf_one)
+        queries = len(context.captured_queries)
+        with CaptureQueriesContext(connection) as context:
+            BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertLess(len(context.captured_queries), queries)
+
+    def test_sends_post_save(self):
+        sent = []
+
+        def receiver(instance, created, **kwargs):
+            sent.append((instance.field_name, created))
+
+        post_save.connect(receiver, sender=Reference, weak=False)
+        self.addCleanup(post_save.disconnect, receiver, sender=Reference)
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertEqual(len(sent), 5)
+        self.assertTrue(all(created for _, created in sent))
+        sent.clear()
+        self.crf_one.field_str = 'bob'
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        self.assertEqual(sent, [('field_str', False)])
+
+    def test_updates_audit_fields(self):
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        Reference.objects.filter(model='edc_reference.crfone').update(
+            hostname_modified='', modified=self.subject_visit.report_datetime)
+        self.crf_one.field_str = 'bob'
+        BulkReferenceUpdater(model_obj=self.crf_one)
+        reference = Reference.objects.get(
+            model='edc_reference.crfone', field_name='field_str')
+        self.assertNotEqual(reference.hostname_modified, '')
+        self.assertGreater(reference.modified, self.subject_visit.report_datetime)
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, tag
+
+from ..models import Reference
+from ..reference import DeferredReferenceUpdater
+from ..reference.pending import get_pending
+from ..reference_model_config import ReferenceModelConfig
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class DeferredReferenceUpdaterMixin:
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_int']))
+        self.crf_ones = []
+        for visit_code in ['1000', '2000']:
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier='1', visit_code=visit_code)
+            self.crf_ones.append(CrfOne.objects.create(
+                subject_visit=subject_visit, field_str='erik', field_int=1))
+        Reference.objects.filter(model='edc_reference.crfone').delete()
+
+    def count(self):
+        return Reference.objects.filter(model='edc_reference.crfone').count()
+
+
+class TestDeferredReferenceUpdater(DeferredReferenceUpdaterMixin, TestCase):
+
+    def test_deferred_until_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for crf_one in self.crf_ones:
+                DeferredReferenceUpdater(model_obj=crf_one)
+            self.assertEqual(self.count(), 0)
+        self.assertEqual(self.count(), 4)
+
+    def test_coalesced_per_instance(self):
+        crf_one = self.crf_ones[0]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            DeferredReferenceUpdater(model_obj=crf_one)
+            CrfOne.objects.filter(pk=crf_one.pk).update(field_str='bob')
+            DeferredReferenceUpdater(model_obj=crf_one)
+            pending = get_pending(
+                name=DeferredReferenceUpdater.pending_name,
+                flush=DeferredReferenceUpdater.write, factory=set)
+            self.assertEqual(len(pending), 1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Reference.objects.get(
+            model='edc_reference.crfone', field_name='field_str').value, 'bob')
+
+    def test_written_from_committed_row(self):
+        crf_one = self.crf_ones[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                inner = CrfOne.objects.get(pk=crf_one.pk)
+                inner.field_str = 'inner'
+                inner.save()
+                DeferredReferenceUpdater(model_obj=inner)
+            crf_one.field_str = 'outer'
+            crf_one.save()
+            DeferredReferenceUpdater(model_obj=crf_one)
+            crf_one.field_str = 'unsaved'
+        self.assertEqual(Reference.objects.get(
+            model='edc_reference.crfone', field_name='field_str').value, 'outer')
+
+    def test_flush_now(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DeferredReferenceUpdater(model_obj=self.crf_ones[0])
+            DeferredReferenceUpdater.flush()
+            self.assertEqual(self.count(), 2)
+        self.assertEqual(self.count(), 2)
+
+    def test_rolled_back_savepoint_writes_committed_row(self):
+        crf_one = self.crf_ones[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    CrfOne.objects.filter(pk=crf_one.pk).update(field_str='bob')
+                    DeferredReferenceUpdater(model_obj=crf_one)
+                    raise ValueError()
+            except ValueError:
+                pass
+            DeferredReferenceUpdater(model_obj=self.crf_ones[1])
+        self.assertEqual(
+            list(Reference.objects.filter(
+                model='edc_reference.crfone', field_name='field_str').values_list(
+                    'value_str', flat=True).distinct()), ['erik'])
+
+    def test_deleted_instance_skipped(self):
+        crf_one = self.crf_ones[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            DeferredReferenceUpdater(model_obj=crf_one)
+            CrfOne.objects.filter(pk=crf_one.pk).delete()
+        self.assertEqual(self.count(), 0)
+
+
+class TestDeferredReferenceUpdaterTransaction(
+        DeferredReferenceUpdaterMixin, TransactionTestCase):
+
+    def test_rolled_back_transaction_not_flushed_in_next(self):
+        try:
+            with transaction.atomic():
+                DeferredReferenceUpdater(model_obj=self.crf_ones[0])
+                raise ValueError()
+        except ValueError:
+            pass
+        with transaction.atomic():
+            DeferredReferenceUpdater(model_obj=self.crf_ones[1])
+            pending = get_pending(
+                name=DeferredReferenceUpdater.pending_name,
+                flush=DeferredReferenceUpdater.write, factory=set)
+            self.assertEqual(len(pending), 1)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(
+            set(Reference.objects.filter(
+                model='edc_reference.crfone').values_list('timepoint', flat=True)),
+            {'2000'})
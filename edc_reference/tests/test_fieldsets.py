@@ -83,3 +83,31 @@ class TestFieldset(TestCase):
 
     def test_len_support(self):
         self.assertEqual(len(self.fieldset), 5)
+
+    def test_count(self):
+        self.assertEqual(self.fieldset.count(), 5)
+        self.assertEqual(self.fieldset.count(3), 1)
+        self.assertEqual(self.fieldset.filter(2, 3).count(), 2)
+
+    def test_slice_support(self):
+        self.assertEqual(self.fieldset.order_by('-f1')[1:3], [3, 2])
+
+    def test_order_by_does_not_reorder_refsets(self):
+        refsets = self.fieldset._refsets
+        self.fieldset.order_by('-f1')
+        self.assertEqual([refset.f1 for refset in refsets], [0, 1, 2, 3, 4])
+        self.assertEqual(list(self.fieldset), [4, 3, 2, 1, 0])
+
+    def test_values_read_once(self):
+        refsets = [DummyRefset(i) for i in range(0, 5)]
+        fieldset = Fieldset(field='f1', refsets=refsets)
+        for refset in refsets:
+            refset.f1 = None
+        self.assertEqual(fieldset.order_by('-f1').first(), 4)
+
+    def test_refsets_resorted_by_caller(self):
+        refsets = [DummyRefset(i) for i in range(0, 5)]
+        fieldset = Fieldset(field='f1', refsets=refsets)
+        refsets.sort(key=lambda refset: refset.f1, reverse=True)
+        self.assertEqual(list(fieldset.order_by('f2')), [4, 0, 1, 2, 3])
+        self.assertEqual(list(fieldset.order_by('f1')), [0, 1, 2, 3, 4])
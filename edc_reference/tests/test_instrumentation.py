@@ -0,0 +1,124 @@
+from datetime import date
+from django.test import TestCase, tag
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference import ReferenceGetter, reference_instrumentation
+from ..reference import log_measurement, reference_operation
+from ..reference.instrumentation import null_measurement
+from ..reference_model_config import ReferenceModelConfig
+from ..refsets import LongitudinalRefset, Refset
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        self.subject_identifier = '1'
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_date', 'field_datetime',
+                    'field_int', 'report_datetime']))
+        self.subject_visit = SubjectVisit.objects.create(
+            subject_identifier=self.subject_identifier,
+            visit_code='code')
+        self.crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik',
+            field_int=100,
+            field_date=date.today(),
+            field_datetime=get_utcnow())
+        self.measurements = []
+        reference_instrumentation.enable(callbacks=[self.measurements.append])
+
+    def tearDown(self):
+        reference_instrumentation.disable()
+
+    def get_measurements(self, operation=None):
+        return [m for m in self.measurements if m.operation == operation]
+
+    def test_disabled(self):
+        reference_instrumentation.disable()
+        self.assertIs(
+            reference_instrumentation.measure(operation='getter'), null_measurement)
+        self.crf_one.field_int = 101
+        self.crf_one.save()
+        self.assertEqual(self.measurements, [])
+
+    def test_updater(self):
+        self.crf_one.field_int = 101
+        self.crf_one.save()
+        measurement = self.get_measurements('updater')[0]
+        self.assertEqual(measurement.name, 'edc_reference.crfone')
+        self.assertEqual(measurement.rows_read, 5)
+        self.assertEqual(measurement.rows_written, 1)
+        self.assertEqual(measurement.queries, 2)
+        self.assertGreater(measurement.elapsed, 0)
+
+    def test_deleter(self):
+        self.crf_one.delete()
+        measurement = self.get_measurements('deleter')[0]
+        self.assertEqual(measurement.name, 'edc_reference.crfone')
+        self.assertEqual(measurement.rows_written, 5)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 0)
+
+    def test_getter(self):
+        ReferenceGetter(
+            name='edc_reference.crfone',
+            field_name='field_int',
+            visit_obj=self.subject_visit)
+        measurement = self.get_measurements('getter')[0]
+        self.assertEqual(measurement.rows_read, 1)
+        self.assertEqual(measurement.queries, 1)
+
+    def test_refset(self):
+        Refset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visit.report_datetime,
+            timepoint=self.subject_visit.visit_code,
+            reference_model_cls=Reference)
+        measurement = self.get_measurements('refset')[0]
+        self.assertEqual(measurement.rows_read, 5)
+        self.assertEqual(measurement.queries, 1)
+
+    def test_longitudinal_refset(self):
+        LongitudinalRefset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            reference_model_cls=Reference)
+        measurement = self.get_measurements('longitudinal')[0]
+        self.assertEqual(measurement.rows_read, 6)
+        self.assertEqual(measurement.queries, 2)
+        # refsets built from references already fetched are not measured
+        self.assertEqual(self.get_measurements('refset'), [])
+
+    def test_signal(self):
+        received = []
+
+        def receiver(measurement=None, **kwargs):
+            received.append(measurement)
+
+        reference_operation.connect(receiver)
+        try:
+            self.crf_one.field_int = 101
+            self.crf_one.save()
+        finally:
+            reference_operation.disconnect(receiver)
+        self.assertEqual(received, self.measurements)
+
+    def test_log_measurement(self):
+        reference_instrumentation.enable(
+            callbacks=['edc_reference.reference.log_measurement'])
+        with self.assertLogs('edc_reference', level='DEBUG') as cm:
+            self.crf_one.field_int = 101
+            self.crf_one.save()
+        self.assertIn('reference updater name=edc_reference.crfone', cm.output[0])
+        self.assertIs(reference_instrumentation.callbacks[0], log_measurement)
@@ -3,7 +3,10 @@ from django.test import TestCase, tag
 
 from edc_base.utils import get_utcnow
 
+from ..refsets import CohortLongitudinalRefset
 from ..refsets import LongitudinalRefset, InvalidOrdering, NoRefsetObjectsExist
+from ..refsets import RefsetError
+from ..refsets.longitudinal_refset import LongitudinalRefsetError
 from ..models import Reference
 from ..reference_model_config import ReferenceModelConfig
 from ..site import site_reference_configs
@@ -109,6 +112,17 @@ class TestLongitudinal(TestCase):
                 '-report_datetime').values,
             ['POS', 'POS', 'NEG'])
 
+    def test_fieldset_after_refset_order_by(self):
+        refset = LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference)
+        fieldset = refset.fieldset('visit_code')
+        refset.order_by('-report_datetime')
+        self.assertEqual(
+            fieldset.order_by('report_datetime').values, ['3', '2', '1'])
+
     def test_get2(self):
         refset = LongitudinalRefset(
             subject_identifier=self.subject_identifier,
@@ -154,3 +168,176 @@ class TestLongitudinal(TestCase):
         self.assertTrue(repr(refset))
         for ref in refset:
             self.assertTrue(repr(ref))
+
+    def test_longitudinal_refset_two_queries(self):
+        with self.assertNumQueries(2):
+            LongitudinalRefset(
+                subject_identifier=self.subject_identifier,
+                visit_model='edc_reference.subjectvisit',
+                name='edc_reference.crfone',
+                reference_model_cls=Reference)
+
+    def test_longitudinal_refset_with_references(self):
+        visit_references = list(Reference.objects.filter(
+            identifier=self.subject_identifier,
+            model='edc_reference.subjectvisit',
+            field_name='report_datetime'))
+        references = list(Reference.objects.filter(
+            identifier=self.subject_identifier,
+            model='edc_reference.crfone'))
+        with self.assertNumQueries(0):
+            refset = LongitudinalRefset(
+                subject_identifier=self.subject_identifier,
+                visit_model='edc_reference.subjectvisit',
+                name='edc_reference.crfone',
+                reference_model_cls=Reference,
+                visit_references=visit_references,
+                references=references)
+        self.assertEqual(
+            refset.fieldset('field_str').all().values, ['NEG', 'POS', 'POS'])
+
+    def get_lazy_refset(self, **kwargs):
+        return LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference,
+            lazy=True, **kwargs)
+
+    def test_lazy_fetches_nothing_until_accessed(self):
+        with self.assertNumQueries(0):
+            self.get_lazy_refset()
+
+    def test_lazy_index(self):
+        refset = self.get_lazy_refset()
+        with self.assertNumQueries(2):
+            self.assertEqual(refset[-1].timepoint, '1')
+            self.assertEqual(refset[-1].field_str, 'POS')
+        with self.assertNumQueries(1):
+            self.assertEqual(refset[-1].timepoint, '1')
+        self.assertEqual(refset[0].timepoint, '3')
+        self.assertEqual(refset[0].field_str, 'NEG')
+        self.assertRaises(IndexError, refset.__getitem__, 5)
+
+    def test_lazy_slice(self):
+        refset = self.get_lazy_refset()
+        with self.assertNumQueries(2):
+            self.assertEqual([r.timepoint for r in refset[-2:]], ['2', '1'])
+        self.assertEqual([r.timepoint for r in refset[0:2]], ['3', '2'])
+        self.assertEqual([r.timepoint for r in refset[:-1]], ['3', '2'])
+
+    def test_lazy_not_registered(self):
+        site_reference_configs.unregister(name='edc_reference.crfone')
+        with self.assertNumQueries(0):
+            refset = self.get_lazy_refset()
+        self.assertRaises(RefsetError, refset.__getitem__, -1)
+
+    def test_lazy_materializes_on_iteration(self):
+        refset = self.get_lazy_refset()
+        self.assertEqual([ref.timepoint for ref in refset], ['3', '2', '1'])
+        self.assertEqual(
+            refset.fieldset('field_str').all().values, ['NEG', 'POS', 'POS'])
+        self.assertEqual(len(refset.visit_references), 3)
+
+    def test_report_datetime_window(self):
+        kwargs = dict(
+            report_datetime_from=get_utcnow() - relativedelta(months=2, days=1),
+            report_datetime_to=get_utcnow() - relativedelta(months=1, days=1))
+        refset = LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference, **kwargs)
+        self.assertEqual([ref.timepoint for ref in refset], ['2'])
+        self.assertEqual(
+            [ref.timepoint for ref in self.get_lazy_refset(**kwargs)[-1:]], ['2'])
+
+    def test_timepoints(self):
+        refset = self.get_lazy_refset(timepoints=['1', '3'])
+        self.assertEqual([ref.timepoint for ref in refset[-2:]], ['3', '1'])
+        self.assertEqual([ref.timepoint for ref in refset], ['3', '1'])
+
+    def test_compact(self):
+        refset = LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference,
+            compact=True)
+        record_cls = site_reference_configs.get_config(name='edc_reference.crfone').record_cls
+        self.assertTrue(all(isinstance(record, record_cls) for record in refset))
+        self.assertEqual([record.visit_code for record in refset], ['3', '2', '1'])
+        self.assertEqual(
+            refset.fieldset('field_str').all().values, ['NEG', 'POS', 'POS'])
+        refset.order_by('-field_datetime')
+        self.assertEqual([record.field_str for record in refset], ['POS', 'POS', 'NEG'])
+        self.assertEqual(self.get_lazy_refset(compact=True)[-1].field_str, 'POS')
+
+    def test_compact_raises_if_not_registered(self):
+        self.assertRaises(
+            LongitudinalRefsetError,
+            LongitudinalRefset,
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.blah',
+            reference_model_cls=Reference,
+            compact=True)
+
+
+class TestCohortLongitudinal(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        site_reference_configs.loaded = False
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_date', 'field_datetime', 'field_int', 'field_str']))
+        self.subject_identifiers = ['11111', '22222', '33333']
+        for subject_identifier in self.subject_identifiers:
+            for index in [1, 2]:
+                subject_visit = SubjectVisit.objects.create(
+                    subject_identifier=subject_identifier,
+                    report_datetime=get_utcnow() - relativedelta(months=index),
+                    visit_code=str(index))
+                CrfOne.objects.create(
+                    subject_visit=subject_visit,
+                    field_str=f'{subject_identifier}-{index}')
+
+    def test_cohort_refset(self):
+        cohort = CohortLongitudinalRefset(
+            subject_identifiers=self.subject_identifiers,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference)
+        results = dict(cohort)
+        self.assertEqual(list(results), self.subject_identifiers)
+        for subject_identifier, longitudinal_refset in results.items():
+            with self.subTest(subject_identifier=subject_identifier):
+                self.assertEqual(
+                    longitudinal_refset.fieldset('field_str').all().values,
+                    [f'{subject_identifier}-2', f'{subject_identifier}-1'])
+
+    def test_cohort_refset_two_queries_per_chunk(self):
+        cohort = CohortLongitudinalRefset(
+            subject_identifiers=self.subject_identifiers,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference,
+            chunk_size=2)
+        with self.assertNumQueries(4):
+            list(cohort)
+
+    def test_cohort_refset_columns(self):
+        cohort = CohortLongitudinalRefset(
+            subject_identifiers=self.subject_identifiers,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls='edc_reference.reference')
+        columns = cohort.columns('field_str')
+        self.assertEqual(len(columns['subject_identifier']), 6)
+        self.assertEqual(
+            columns['field_str'][:2], ['11111-2', '11111-1'])
+        self.assertEqual(columns['timepoint'][:2], ['2', '1'])
@@ -21,3 +21,23 @@ class TestModel(TestCase):
             self.reference_model_cls.objects.get(id=reference.id).value, '5')
         self.assertEqual(
             self.reference_model_cls.objects.get(id=reference.id).value_str, '5')
+
+    def test_value_fields(self):
+        self.assertEqual(
+            self.reference_model_cls.get_value_fields(),
+            {'CharField': 'value_str', 'IntegerField': 'value_int',
+             'DateField': 'value_date', 'DateTimeField': 'value_datetime',
+             'UUIDField': 'value_uuid'})
+
+    def test_set_value_clears_other_value_fields(self):
+        reference = self.reference_model_cls(
+            model='edc_reference.testmodel',
+            identifier=self.subject_identifier,
+            report_datetime=get_utcnow(),
+            field_name='field_name')
+        reference.set_value(value=5, internal_type='IntegerField')
+        reference.set_value(
+            value='5', internal_type='CharField', value_field='value_str')
+        self.assertEqual(reference.value_str, '5')
+        self.assertIsNone(reference.value_int)
+        self.assertEqual(reference.datatype, 'CharField')
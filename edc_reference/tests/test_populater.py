@@ -1,17 +1,22 @@
+import multiprocessing
+
 from dateutil.relativedelta import relativedelta
+from datetime import timedelta
 from django.core.exceptions import ObjectDoesNotExist
-from django.test import TestCase, tag
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, tag
 
 from edc_base.utils import get_utcnow
 
-from ..models import Reference
-from ..populater import Populater
+from ..models import Reference, PopulaterCheckpoint
+from ..parallel_populater import ParallelPopulater
+from ..populater import Populater, PopulaterAttributeError
 from ..reference_model_config import ReferenceModelConfig
 from ..site import site_reference_configs
 from .models import SubjectVisit, CrfOne
 
 
-class TestPopulater(TestCase):
+class PopulaterTestMixin:
 
     def setUp(self):
         self.subject_identifier = '12345'
@@ -46,6 +51,9 @@ class TestPopulater(TestCase):
             field_int=1,
             field_str='erik')
 
+
+class TestPopulater(PopulaterTestMixin, TestCase):
+
     def test_populates_for_visit(self):
         Reference.objects.all().delete()
         populater = Populater()
@@ -140,3 +148,231 @@ class TestPopulater(TestCase):
                         value_int=1)
                 except ObjectDoesNotExist as e:
                     self.fail(f'Object unexpectedly DoesNotExist. Got {e}')
+
+    def test_populates_in_bulk(self):
+        Reference.objects.all().delete()
+        populater = Populater(bulk=True, chunk_size=1)
+        populater.populate()
+        for visit in SubjectVisit.objects.all():
+            with self.subTest(report_datetime=visit.report_datetime):
+                for field_name, value in [('field_int', 1), ('field_str', 'erik')]:
+                    reference = Reference.objects.get(
+                        identifier=self.subject_identifier,
+                        model='edc_reference.crfone',
+                        report_datetime=visit.report_datetime,
+                        field_name=field_name)
+                    self.assertEqual(reference.value, value)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 8)
+
+    def test_populater_bulk_updates(self):
+        CrfOne.objects.all().update(field_str='bob')
+        populater = Populater(bulk=True)
+        populater.populate()
+        self.assertEqual(
+            Reference.objects.filter(
+                model='edc_reference.crfone', field_name='field_str',
+                value_str='bob').count(), 2)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 8)
+
+    def test_populater_saves_checkpoint(self):
+        populater = Populater(chunk_size=1)
+        populater.populate()
+        checkpoint = PopulaterCheckpoint.objects.get(
+            name='edc_reference.crfone')
+        self.assertEqual(checkpoint.rows, 2)
+        self.assertIsNotNone(checkpoint.done_datetime)
+
+    def test_populater_resumes_from_checkpoint(self):
+        Reference.objects.all().delete()
+        first = CrfOne.objects.all().order_by('pk')[0]
+        PopulaterCheckpoint.objects.create(
+            name='edc_reference.crfone', last_pk=str(first.pk), rows=1)
+        populater = Populater(names=['edc_reference.crfone'], resume=True)
+        populater.populate()
+        self.assertFalse(Reference.objects.filter(
+            model='edc_reference.crfone',
+            report_datetime=first.subject_visit.report_datetime).exists())
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 4)
+
+    def test_populater_resume_skips_done(self):
+        Reference.objects.all().delete()
+        PopulaterCheckpoint.objects.create(
+            name='edc_reference.crfone', rows=2, done_datetime=get_utcnow())
+        populater = Populater(names=['edc_reference.crfone'], resume=True)
+        populater.populate()
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 0)
+
+    def test_populater_dry_run_bulk(self):
+        Reference.objects.all().delete()
+        populater = Populater(bulk=True, dry_run=True)
+        populater.populate()
+        self.assertEqual(Reference.objects.all().count(), 0)
+
+    def test_parallel_populater_partitions(self):
+        populater = ParallelPopulater(workers=2, partition_size=1)
+        partitions = populater.partitions(name='edc_reference.crfone')
+        self.assertEqual(len(partitions), 2)
+        self.assertIsNone(partitions[0][0])
+        self.assertEqual(partitions[0][1], partitions[1][0])
+        self.assertIsNone(partitions[1][1])
+
+    def test_parallel_populater_one_partition_if_small(self):
+        populater = ParallelPopulater(workers=2)
+        self.assertEqual(
+            populater.partitions(name='edc_reference.crfone'), [(None, None)])
+
+    def test_parallel_populater_in_process(self):
+        Reference.objects.all().delete()
+        populater = ParallelPopulater(workers=1, partition_size=1, bulk=True)
+        populater.populate()
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 8)
+        checkpoint = PopulaterCheckpoint.objects.get(
+            name='edc_reference.crfone')
+        self.assertEqual(checkpoint.rows, 2)
+        self.assertIsNotNone(checkpoint.done_datetime)
+
+    def test_summary(self):
+        populater = Populater()
+        with self.assertNumQueries(3):
+            summary = populater.get_summary()
+        self.assertEqual(summary['edc_reference.crfone']['references'], 8)
+        self.assertEqual(summary['edc_reference.crfone']['source_rows'], 2)
+        self.assertEqual(summary['edc_reference.crfone']['coverage'], 1.0)
+        self.assertEqual(summary['edc_reference.crfone']['missing'], 0)
+        self.assertEqual(summary['edc_reference.crfone']['orphans'], 0)
+        self.assertEqual(summary['edc_reference.subjectvisit']['references'], 4)
+
+    def test_summary_missing_and_orphans(self):
+        Reference.objects.filter(
+            model='edc_reference.crfone', field_name='field_int',
+            report_datetime=self.subject_visit1.report_datetime).delete()
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='1',
+            report_datetime=self.report_datetime, model='edc_reference.crfone',
+            field_name='old_field', datatype='CharField', value_str='x')
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='1',
+            report_datetime=self.report_datetime, model='edc_reference.crftwo',
+            field_name='field_str', datatype='CharField', value_str='x')
+        summary = Populater().summarize()
+        self.assertEqual(summary['edc_reference.crfone']['missing'], 1)
+        self.assertEqual(summary['edc_reference.crfone']['orphans'], 1)
+        self.assertEqual(summary['edc_reference.crfone']['coverage'], 7 / 8)
+        self.assertFalse(summary['edc_reference.crftwo']['registered'])
+        self.assertEqual(summary['edc_reference.crftwo']['references'], 1)
+
+    def test_summary_missing_and_orphans_are_net(self):
+        Reference.objects.filter(
+            model='edc_reference.crfone', field_name='field_int',
+            report_datetime=self.subject_visit1.report_datetime).delete()
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='3',
+            report_datetime=self.report_datetime, model='edc_reference.crfone',
+            field_name='field_int', datatype='IntegerField', value_int=1)
+        summary = Populater(names=['edc_reference.crfone']).get_summary()
+        self.assertEqual(summary['edc_reference.crfone']['missing'], 0)
+        self.assertEqual(summary['edc_reference.crfone']['orphans'], 0)
+
+    def test_summary_group_by(self):
+        summary = Populater(names=['edc_reference.crfone']).get_summary(
+            group_by=['datatype'])
+        self.assertEqual(
+            sorted((g['field_name'], g['datatype'], g['count'])
+                   for g in summary['edc_reference.crfone']['groups']),
+            [('field_date', 'DateField', 2), ('field_datetime', 'DateTimeField', 2),
+             ('field_int', 'IntegerField', 2), ('field_str', 'CharField', 2)])
+        self.assertRaises(
+            PopulaterAttributeError,
+            Populater().get_summary, group_by=['identifier'])
+
+    def test_skip_existing(self):
+        Reference.objects.filter(model='edc_reference.crfone').delete()
+        populater = Populater(skip_existing=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(populater.skip(name='edc_reference.subjectvisit'))
+            self.assertFalse(populater.skip(name='edc_reference.crfone'))
+
+    def test_populater_incremental(self):
+        populater = Populater(names=['edc_reference.crfone'], incremental=True)
+        populater.high_water_mark_overlap = timedelta(0)
+        self.assertEqual(populater.populate_incremental(name='edc_reference.crfone'), 2)
+        checkpoint = PopulaterCheckpoint.objects.get(name='edc_reference.crfone')
+        self.assertIsNotNone(checkpoint.high_water_mark)
+        self.assertEqual(populater.populate_incremental(name='edc_reference.crfone'), 0)
+        CrfOne.objects.filter(subject_visit=self.subject_visit1).update(
+            field_str='bob', modified=get_utcnow())
+        self.assertEqual(populater.populate_incremental(name='edc_reference.crfone'), 1)
+        self.assertEqual(
+            Reference.objects.get(
+                model='edc_reference.crfone', field_name='field_str',
+                report_datetime=self.subject_visit1.report_datetime).value, 'bob')
+
+    def test_populater_incremental_includes_modified_visit(self):
+        populater = Populater(names=['edc_reference.crfone'], incremental=True)
+        populater.high_water_mark_overlap = timedelta(0)
+        populater.populate_incremental(name='edc_reference.crfone')
+        SubjectVisit.objects.filter(pk=self.subject_visit2.pk).update(
+            modified=get_utcnow())
+        self.assertEqual(populater.populate_incremental(name='edc_reference.crfone'), 1)
+
+    def test_incremental_with_remove_orphans_raises(self):
+        self.assertRaises(
+            PopulaterAttributeError,
+            Populater, names=['edc_reference.crfone'], incremental=True,
+            remove_orphans=True)
+
+    def test_incremental_with_delete_existing_raises(self):
+        self.assertRaises(
+            PopulaterAttributeError,
+            Populater, names=['edc_reference.crfone'], incremental=True,
+            delete_existing=True)
+
+    def test_populater_deletes_orphans(self):
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='1',
+            report_datetime=self.report_datetime, model='edc_reference.crfone',
+            field_name='old_field', datatype='CharField', value_str='x')
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='99',
+            report_datetime=self.report_datetime - relativedelta(years=2),
+            model='edc_reference.crfone', field_name='field_str',
+            datatype='CharField', value_str='x')
+        populater = Populater(names=['edc_reference.crfone'], dry_run=True)
+        self.assertEqual(populater.delete_orphans(name='edc_reference.crfone'), 2)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 10)
+        populater = Populater(names=['edc_reference.crfone'])
+        self.assertEqual(populater.delete_orphans(name='edc_reference.crfone'), 2)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 8)
+
+
+class TestParallelPopulaterWorkers(PopulaterTestMixin, TransactionTestCase):
+
+    def setUp(self):
+        if multiprocessing.get_start_method() != 'fork':
+            self.skipTest('workers are forked from the test process')
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('workers cannot open an in-memory test database')
+        super().setUp()
+
+    def test_parallel_populater_with_workers(self):
+        Reference.objects.all().delete()
+        populater = ParallelPopulater(workers=2, partition_size=1, bulk=True)
+        populater.populate()
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 8)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.subjectvisit').count(), 4)
+        for name in ['edc_reference.crfone', 'edc_reference.subjectvisit']:
+            with self.subTest(name=name):
+                checkpoint = PopulaterCheckpoint.objects.get(name=name)
+                self.assertEqual(checkpoint.rows, 2)
+                self.assertIsNotNone(checkpoint.done_datetime)
+        # the parent's connection is usable after the pool
+        self.assertEqual(SubjectVisit.objects.count(), 2)
@@ -84,6 +84,26 @@ class TestReferenceModel(TestCase):
             field_name='field_str')
         self.assertEqual(reference.value, 'bob')
 
+    def test_updater_with_getter_cls_overridden(self):
+
+        class MyReferenceGetter(ReferenceGetter):
+            pass
+
+        class MyReferenceUpdater(ReferenceUpdater):
+            getter_cls = MyReferenceGetter
+
+        model_obj = TestModel.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik')
+        model_obj.field_str = 'bob'
+        with self.assertWarns(DeprecationWarning):
+            MyReferenceUpdater(model_obj=model_obj)
+        reference = Reference.objects.get(
+            identifier=self.subject_identifier,
+            timepoint=self.subject_visit.visit_code,
+            field_name='field_str')
+        self.assertEqual(reference.value, 'bob')
+
     def test_updater_with_bad_field_name(self):
         site_reference_configs.registry = {}
         self.testmodel_reference = ReferenceModelConfig(
@@ -530,3 +550,50 @@ class TestReferenceModel(TestCase):
                     timepoint=self.subject_visit.visit_code,
                     field_name='panel',
                     value_uuid=panel.id)
+
+    def test_updater_skips_unchanged_references(self):
+        crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik',
+            field_int=100)
+        updater = ReferenceUpdater(model_obj=crf_one)
+        self.assertEqual(updater.created, 0)
+        self.assertEqual(updater.updated, 0)
+        self.assertEqual(updater.skipped, 5)
+
+    def test_updater_saves_changed_references_only(self):
+        crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik',
+            field_int=100)
+        crf_one.field_str = 'bob'
+        updater = ReferenceUpdater(model_obj=crf_one)
+        self.assertEqual(updater.updated, 1)
+        self.assertEqual(updater.skipped, 4)
+        reference = Reference.objects.get(
+            model='edc_reference.crfone', field_name='field_str')
+        self.assertEqual(reference.value, 'bob')
+
+    def test_updater_saves_changed_datatype(self):
+        crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik')
+        Reference.objects.filter(
+            model='edc_reference.crfone',
+            field_name='field_str').update(datatype='TextField')
+        updater = ReferenceUpdater(model_obj=crf_one)
+        self.assertEqual(updater.updated, 1)
+        self.assertEqual(
+            Reference.objects.get(
+                model='edc_reference.crfone', field_name='field_str').datatype,
+            'CharField')
+
+    def test_updater_creates_new_references(self):
+        crf_one = CrfOne.objects.create(
+            subject_visit=self.subject_visit,
+            field_str='erik')
+        Reference.objects.filter(model='edc_reference.crfone').delete()
+        updater = ReferenceUpdater(model_obj=crf_one)
+        self.assertEqual(updater.created, 5)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 5)
@@ -0,0 +1,144 @@
+from datetime import date
+from django.db import connection, transaction
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference import ReferenceCache, ReferenceGetter, ReferenceObjectDoesNotExist
+from ..reference import reference_cache
+from ..reference_model_config import ReferenceModelConfig
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestReferenceCache(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        self.subject_identifier = '1'
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_date', 'field_datetime',
+                    'field_int', 'report_datetime']))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subject_visit = SubjectVisit.objects.create(
+                subject_identifier=self.subject_identifier,
+                visit_code='code')
+            self.crf_one = CrfOne.objects.create(
+                subject_visit=self.subject_visit,
+                field_str='erik',
+                field_int=100,
+                field_date=date.today(),
+                field_datetime=get_utcnow())
+        reference_cache.enable(maxsize=100)
+
+    def tearDown(self):
+        reference_cache.disable()
+
+    def get_reference(self, field_name=None):
+        return ReferenceGetter(
+            name='edc_reference.crfone',
+            field_name=field_name,
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visit.report_datetime,
+            visit_code=self.subject_visit.visit_code)
+
+    def test_lru_evicts_oldest(self):
+        cache = ReferenceCache(maxsize=2)
+        for i in range(3):
+            cache.set(('1', 'code', None, 'model', f'f{i}'), i)
+        self.assertRaises(KeyError, cache.get, ('1', 'code', None, 'model', 'f0'))
+        self.assertEqual(cache.get(('1', 'code', None, 'model', 'f2')), 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_disabled_cache_does_not_store(self):
+        cache = ReferenceCache()
+        cache.set(('1', 'code', None, 'model', 'f'), 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_version_not_stored(self):
+        cache = ReferenceCache(maxsize=2)
+        version = cache.version
+        cache.invalidate(identifier='1', timepoint='code', model='model')
+        cache.set(('1', 'code', None, 'model', 'f'), 1, version=version)
+        self.assertEqual(len(cache), 0)
+
+    def test_expired_entry_not_served(self):
+        cache = ReferenceCache(maxsize=2, ttl=10)
+        now = cache.timer()
+        cache.timer = lambda: now
+        cache.set(('1', 'code', None, 'model', 'f'), 1)
+        cache.timer = lambda: now + 9
+        self.assertEqual(cache.get(('1', 'code', None, 'model', 'f')), 1)
+        cache.timer = lambda: now + 10
+        self.assertRaises(KeyError, cache.get, ('1', 'code', None, 'model', 'f'))
+        self.assertEqual(len(cache), 0)
+
+    def test_getter_served_from_cache(self):
+        self.get_reference(field_name='field_str')
+        with CaptureQueriesContext(connection) as context:
+            reference = self.get_reference(field_name='field_str')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(reference.value, 'erik')
+        self.assertEqual(reference_cache.info()['hits'], 1)
+        self.assertEqual(reference_cache.info()['misses'], 1)
+
+    def test_invalidated_on_save(self):
+        self.get_reference(field_name='field_str')
+        self.crf_one.field_str = 'bob'
+        self.crf_one.save()
+        reference = self.get_reference(field_name='field_str')
+        self.assertEqual(reference.value, 'bob')
+
+    def test_invalidated_on_reference_delete(self):
+        self.get_reference(field_name='field_str')
+        Reference.objects.filter(
+            model='edc_reference.crfone', field_name='field_str').delete()
+        self.assertRaises(
+            ReferenceObjectDoesNotExist,
+            self.get_reference, field_name='field_str')
+
+    def test_invalidated_on_model_delete(self):
+        self.get_reference(field_name='field_str')
+        self.crf_one.delete()
+        self.assertRaises(
+            ReferenceObjectDoesNotExist,
+            self.get_reference, field_name='field_str')
+
+    def test_does_not_exist_is_cached(self):
+        self.assertRaises(
+            ReferenceObjectDoesNotExist,
+            self.get_reference, field_name='blah')
+        with CaptureQueriesContext(connection) as context:
+            self.assertRaises(
+                ReferenceObjectDoesNotExist,
+                self.get_reference, field_name='blah')
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_uncommitted_values_not_cached(self):
+        self.get_reference(field_name='field_str')
+        try:
+            with transaction.atomic():
+                self.crf_one.field_str = 'bob'
+                self.crf_one.save()
+                self.assertEqual(self.get_reference(field_name='field_str').value, 'bob')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.get_reference(field_name='field_str').value, 'erik')
+
+    def test_cached_again_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crf_one.field_str = 'bob'
+            self.crf_one.save()
+            self.get_reference(field_name='field_str')
+            self.assertEqual(len(reference_cache), 0)
+        self.get_reference(field_name='field_str')
+        with CaptureQueriesContext(connection) as context:
+            reference = self.get_reference(field_name='field_str')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(reference.value, 'bob')
@@ -0,0 +1,144 @@
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference import ReferenceGetter, ReferenceObjectDoesNotExist
+from ..reference import ReferencePrefetch, get_prefetched
+from ..reference_model_config import ReferenceModelConfig
+from ..refsets import LongitudinalRefset, Refset
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestReferencePrefetch(TestCase):
+
+    def setUp(self):
+        self.subject_identifier = '12345'
+        site_reference_configs.registry = {}
+        site_reference_configs.loaded = False
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_date', 'field_datetime', 'field_int', 'field_str']))
+        self.subject_visits = []
+        for index in [1, 2, 3]:
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier=self.subject_identifier,
+                report_datetime=get_utcnow() - relativedelta(months=index),
+                visit_code=str(index))
+            self.subject_visits.append(subject_visit)
+            CrfOne.objects.create(
+                subject_visit=subject_visit,
+                field_str=f'str{index}',
+                field_int=index)
+        SubjectVisit.objects.create(
+            subject_identifier='99999',
+            report_datetime=get_utcnow(),
+            visit_code='1')
+
+    def get_reference(self, subject_visit=None, field_name=None):
+        return ReferenceGetter(
+            name='edc_reference.crfone',
+            field_name=field_name,
+            subject_identifier=subject_visit.subject_identifier,
+            report_datetime=subject_visit.report_datetime,
+            visit_code=subject_visit.visit_code)
+
+    def test_loads_in_one_query(self):
+        with CaptureQueriesContext(connection) as context:
+            with ReferencePrefetch(subject_identifier=self.subject_identifier):
+                pass
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_scope_ends_on_exit(self):
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            self.assertIsNotNone(get_prefetched(
+                reference_model_cls=Reference,
+                identifier=self.subject_identifier,
+                model='edc_reference.crfone'))
+        self.assertIsNone(get_prefetched(
+            reference_model_cls=Reference,
+            identifier=self.subject_identifier,
+            model='edc_reference.crfone'))
+
+    def test_getter_served_from_prefetch(self):
+        subject_visit = self.subject_visits[0]
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            with CaptureQueriesContext(connection) as context:
+                reference = self.get_reference(
+                    subject_visit=subject_visit, field_name='field_str')
+                self.assertRaises(
+                    ReferenceObjectDoesNotExist,
+                    self.get_reference,
+                    subject_visit=subject_visit, field_name='blah')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(reference.value, 'str1')
+
+    def test_other_subject_not_covered(self):
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            self.assertIsNone(get_prefetched(
+                reference_model_cls=Reference,
+                identifier='99999',
+                model='edc_reference.subjectvisit'))
+
+    def test_visit_scope(self):
+        with ReferencePrefetch(subject_identifier=self.subject_identifier,
+                               timepoint='1'):
+            self.assertEqual(len(get_prefetched(
+                reference_model_cls=Reference,
+                identifier=self.subject_identifier,
+                model='edc_reference.crfone',
+                timepoint='1')), 4)
+            self.assertIsNone(get_prefetched(
+                reference_model_cls=Reference,
+                identifier=self.subject_identifier,
+                model='edc_reference.crfone',
+                timepoint='2'))
+
+    def test_refsets_served_from_prefetch(self):
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            with CaptureQueriesContext(connection) as context:
+                refset = Refset(
+                    name='edc_reference.crfone',
+                    subject_identifier=self.subject_identifier,
+                    report_datetime=self.subject_visits[0].report_datetime,
+                    timepoint='1',
+                    reference_model_cls=Reference)
+                longitudinal_refset = LongitudinalRefset(
+                    subject_identifier=self.subject_identifier,
+                    visit_model='edc_reference.subjectvisit',
+                    name='edc_reference.crfone',
+                    reference_model_cls=Reference)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(refset.field_str, 'str1')
+        self.assertEqual(
+            [r.field_str for r in longitudinal_refset], ['str3', 'str2', 'str1'])
+
+    def test_manager_served_from_prefetch(self):
+        subject_visit = self.subject_visits[0]
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            with CaptureQueriesContext(connection) as context:
+                reference = Reference.objects.get_crf_for_visit(
+                    name='edc_reference.crfone', visit=subject_visit,
+                    field_name='field_int')
+                missing = Reference.objects.get_crf_for_visit(
+                    name='edc_reference.crfone', visit=subject_visit,
+                    field_name='blah')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(reference.value, 1)
+        self.assertIsNone(missing)
+
+    def test_write_falls_through_to_database(self):
+        subject_visit = self.subject_visits[0]
+        with ReferencePrefetch(subject_identifier=self.subject_identifier):
+            crf_one = CrfOne.objects.get(subject_visit=subject_visit)
+            crf_one.field_str = 'bob'
+            crf_one.save()
+            reference = self.get_reference(
+                subject_visit=subject_visit, field_name='field_str')
+            self.assertEqual(reference.value, 'bob')
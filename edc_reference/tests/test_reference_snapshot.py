@@ -0,0 +1,223 @@
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase, tag, override_settings
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+
+from ..models import PopulaterCheckpoint, Reference, ReferenceSnapshot
+from ..populater import Populater
+from ..reference import BulkReferenceDeleter, BulkReferenceUpdater
+from ..reference import ReferenceSnapshotUpdater, reference_snapshot_updater
+from ..reference_model_config import ReferenceModelConfig
+from ..refsets import LongitudinalRefset, Refset
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+@override_settings(EDC_REFERENCE_SNAPSHOT=True)
+class TestReferenceSnapshot(TestCase):
+
+    def setUp(self):
+        self.subject_identifier = '12345'
+        site_reference_configs.registry = {}
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_date', 'field_datetime', 'field_int', 'field_str']))
+        self.subject_visits = []
+        for index in [1, 2, 3]:
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier=self.subject_identifier,
+                report_datetime=get_utcnow() - relativedelta(months=index),
+                visit_code=str(index))
+            self.subject_visits.append(subject_visit)
+            CrfOne.objects.create(
+                subject_visit=subject_visit,
+                field_str=f'str{index}',
+                field_int=index,
+                field_date=get_utcnow().date(),
+                field_datetime=get_utcnow())
+        reference_snapshot_updater.mark_complete()
+
+    def tearDown(self):
+        reference_snapshot_updater.reset()
+
+    def get_refset(self):
+        return Refset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visits[0].report_datetime,
+            timepoint='1',
+            reference_model_cls=Reference)
+
+    def test_snapshot_maintained_by_updater(self):
+        snapshot = ReferenceSnapshot.objects.get(
+            identifier=self.subject_identifier,
+            timepoint='1',
+            model='edc_reference.crfone')
+        values = snapshot.get_values()
+        for reference in Reference.objects.filter(
+                identifier=self.subject_identifier,
+                timepoint='1',
+                model='edc_reference.crfone'):
+            with self.subTest(field_name=reference.field_name):
+                self.assertEqual(
+                    values[reference.field_name],
+                    (reference.datatype, reference.value))
+
+    def test_snapshot_updated(self):
+        crf_one = CrfOne.objects.get(subject_visit=self.subject_visits[0])
+        crf_one.field_str = 'bob'
+        crf_one.save()
+        snapshot = ReferenceSnapshot.objects.get(
+            identifier=self.subject_identifier,
+            timepoint='1',
+            model='edc_reference.crfone')
+        self.assertEqual(snapshot.get_values()['field_str'], ('CharField', 'bob'))
+
+    def test_snapshot_updated_by_bulk_updater(self):
+        crf_one = CrfOne.objects.get(subject_visit=self.subject_visits[0])
+        crf_one.field_int = 100
+        BulkReferenceUpdater(model_obj=crf_one)
+        snapshot = ReferenceSnapshot.objects.get(
+            identifier=self.subject_identifier,
+            timepoint='1',
+            model='edc_reference.crfone')
+        self.assertEqual(snapshot.get_values()['field_int'], ('IntegerField', 100))
+
+    def test_snapshot_deleted(self):
+        CrfOne.objects.get(subject_visit=self.subject_visits[0]).delete()
+        self.assertFalse(ReferenceSnapshot.objects.filter(
+            identifier=self.subject_identifier,
+            timepoint='1',
+            model='edc_reference.crfone').exists())
+
+    def test_snapshot_deleted_by_bulk_deleter(self):
+        BulkReferenceDeleter().delete_for_queryset(queryset=CrfOne.objects.all())
+        self.assertFalse(ReferenceSnapshot.objects.filter(
+            model='edc_reference.crfone').exists())
+        BulkReferenceDeleter().delete_for_subject(
+            subject_identifier=self.subject_identifier)
+        self.assertFalse(ReferenceSnapshot.objects.filter(
+            identifier=self.subject_identifier).exists())
+
+    def test_rebuild(self):
+        ReferenceSnapshot.objects.all().delete()
+        updater = ReferenceSnapshotUpdater()
+        updater.batch_size = 2
+        created = updater.rebuild(reference_model_cls=Reference)
+        self.assertEqual(created, 6)
+        self.assertEqual(ReferenceSnapshot.objects.filter(
+            model='edc_reference.crfone').count(), 3)
+
+    def test_rebuild_by_name(self):
+        ReferenceSnapshot.objects.all().delete()
+        created = ReferenceSnapshotUpdater().rebuild(
+            reference_model_cls=Reference, names=['edc_reference.crfone'])
+        self.assertEqual(created, 3)
+
+    def test_refset_reads_snapshot(self):
+        with CaptureQueriesContext(connection) as context:
+            refset = Refset(
+                name='edc_reference.crfone',
+                subject_identifier=self.subject_identifier,
+                report_datetime=self.subject_visits[0].report_datetime,
+                timepoint='1',
+                reference_model_cls=Reference)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('referencesnapshot', context.captured_queries[0]['sql'])
+        self.assertEqual(refset.field_str, 'str1')
+        self.assertEqual(refset.field_int, 1)
+
+    def test_longitudinal_refset_reads_snapshot(self):
+        longitudinal_refset = LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference)
+        self.assertEqual(
+            [r.field_str for r in longitudinal_refset], ['str3', 'str2', 'str1'])
+        self.assertEqual(
+            [r.field_date for r in longitudinal_refset],
+            [get_utcnow().date()] * 3)
+
+    def test_not_read_until_rebuilt(self):
+        reference_snapshot_updater.reset()
+        PopulaterCheckpoint.objects.all().delete()
+        Reference.objects.filter(
+            identifier=self.subject_identifier, timepoint='1',
+            model='edc_reference.crfone', field_name='field_str').update(value_str='raw')
+        self.assertEqual(self.get_refset().field_str, 'raw')
+        ReferenceSnapshotUpdater().rebuild(reference_model_cls=Reference)
+        reference_snapshot_updater.reset()
+        self.assertTrue(reference_snapshot_updater.readable)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.get_refset().field_str, 'raw')
+        self.assertIn('referencesnapshot', context.captured_queries[0]['sql'])
+
+    def test_rebuild_by_name_does_not_mark_complete(self):
+        reference_snapshot_updater.reset()
+        PopulaterCheckpoint.objects.all().delete()
+        ReferenceSnapshotUpdater().rebuild(
+            reference_model_cls=Reference, names=['edc_reference.crfone'])
+        self.assertFalse(reference_snapshot_updater.readable)
+
+    def test_refreshed_by_deserialized_reference(self):
+        reference = Reference.objects.get(
+            identifier=self.subject_identifier, timepoint='1',
+            model='edc_reference.crfone', field_name='field_str')
+        reference.value_str = 'synced'
+        Reference.objects.filter(pk=reference.pk).update(value_str='synced')
+        post_save.send(
+            sender=Reference, instance=reference, created=False, raw=True,
+            using='default', update_fields=None)
+        self.assertEqual(self.get_refset().field_str, 'synced')
+
+    def test_snapshot_deleted_by_queryset_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Reference.objects.filter(
+                model='edc_reference.crfone', timepoint='1').delete()
+        self.assertFalse(ReferenceSnapshot.objects.filter(
+            model='edc_reference.crfone', timepoint='1').exists())
+        self.assertEqual(ReferenceSnapshot.objects.filter(
+            model='edc_reference.crfone').count(), 2)
+
+    def test_snapshot_refreshed_by_queryset_delete_of_one_field(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Reference.objects.filter(
+                model='edc_reference.crfone', timepoint='1',
+                field_name='field_str').delete()
+        snapshot = ReferenceSnapshot.objects.get(
+            model='edc_reference.crfone', timepoint='1')
+        self.assertNotIn('field_str', snapshot.get_values())
+
+    def test_snapshots_deleted_by_populater_delete_existing(self):
+        Populater(names=['edc_reference.crfone'], delete_existing=True).delete_references(
+            names=['edc_reference.crfone'])
+        self.assertFalse(ReferenceSnapshot.objects.filter(
+            model='edc_reference.crfone').exists())
+        self.assertTrue(ReferenceSnapshot.objects.filter(
+            model='edc_reference.subjectvisit').exists())
+
+    def test_snapshot_per_report_datetime(self):
+        subject_visit = SubjectVisit.objects.create(
+            subject_identifier=self.subject_identifier,
+            report_datetime=get_utcnow() - relativedelta(days=1),
+            visit_code='1')
+        CrfOne.objects.create(
+            subject_visit=subject_visit,
+            field_str='unscheduled',
+            field_int=4,
+            field_date=get_utcnow().date(),
+            field_datetime=get_utcnow())
+        opts = dict(identifier=self.subject_identifier, timepoint='1',
+                    model='edc_reference.crfone')
+        self.assertEqual(ReferenceSnapshot.objects.filter(**opts).count(), 2)
+        self.assertEqual(
+            sorted((r.report_datetime, r.field_name, r.value)
+                   for r in ReferenceSnapshot.objects.get_references(**opts)),
+            sorted((r.report_datetime, r.field_name, r.value)
+                   for r in Reference.objects.filter(**opts)))
@@ -0,0 +1,162 @@
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test import TestCase, tag
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference_model_config import ReferenceModelConfig
+from ..reference_verifier import ReferenceVerifier
+from ..site import site_reference_configs
+from .models import SubjectVisit, CrfOne
+
+
+class TestReferenceVerifier(TestCase):
+
+    def setUp(self):
+        self.subject_identifier = '12345'
+        site_reference_configs.registry = {}
+        site_reference_configs.loaded = False
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_date', 'field_datetime', 'field_int', 'field_str']))
+        self.report_datetime = get_utcnow()
+        for index in range(3):
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier=self.subject_identifier,
+                report_datetime=self.report_datetime - relativedelta(months=index),
+                visit_code=str(1000 + index))
+            CrfOne.objects.create(
+                subject_visit=subject_visit,
+                field_date=self.report_datetime.date(),
+                field_datetime=self.report_datetime,
+                field_int=index,
+                field_str='erik')
+        self.subject_visit = SubjectVisit.objects.get(visit_code='1001')
+
+    def make_differences(self):
+        Reference.objects.filter(
+            model='edc_reference.crfone', timepoint='1000',
+            field_name='field_str').delete()
+        Reference.objects.filter(
+            model='edc_reference.crfone', timepoint='1001',
+            field_name='field_int').update(value_int=99)
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='1001',
+            report_datetime=self.subject_visit.report_datetime,
+            model='edc_reference.crfone', field_name='old_field',
+            datatype='CharField', value_str='x')
+        Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='9999',
+            report_datetime=self.report_datetime,
+            model='edc_reference.crfone', field_name='field_str',
+            datatype='CharField', value_str='x')
+
+    def test_verifies_consistent(self):
+        verifier = ReferenceVerifier()
+        with self.assertNumQueries(2):
+            item = verifier.verify_name(name='edc_reference.crfone')
+        self.assertEqual(
+            (item['missing'], item['extra'], item['mismatched']), (0, 0, 0))
+        summary = verifier.verify()
+        self.assertEqual(summary['edc_reference.subjectvisit']['missing'], 0)
+
+    def test_reports_differences(self):
+        self.make_differences()
+        count = Reference.objects.count()
+        summary = ReferenceVerifier(names=['edc_reference.crfone']).verify()
+        item = summary['edc_reference.crfone']
+        self.assertEqual(item['missing'], 1)
+        self.assertEqual(item['extra'], 2)
+        self.assertEqual(item['mismatched'], 1)
+        self.assertIn(
+            ('mismatched', self.subject_identifier, '1001',
+             self.subject_visit.report_datetime, 'edc_reference.crfone', 'field_int'),
+            item['samples'])
+        self.assertEqual(Reference.objects.count(), count)
+
+    def test_repairs_differences(self):
+        self.make_differences()
+        ReferenceVerifier(names=['edc_reference.crfone'], repair=True).verify()
+        item = ReferenceVerifier(names=['edc_reference.crfone']).verify()[
+            'edc_reference.crfone']
+        self.assertEqual(
+            (item['missing'], item['extra'], item['mismatched']), (0, 0, 0))
+        self.assertEqual(
+            Reference.objects.get(
+                model='edc_reference.crfone', timepoint='1001',
+                field_name='field_int').value, 1)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), 12)
+
+    def test_repairs_in_chunks(self):
+        self.make_differences()
+        ReferenceVerifier(
+            names=['edc_reference.crfone'], repair=True, chunk_size=1).verify()
+        item = ReferenceVerifier(names=['edc_reference.crfone']).verify()[
+            'edc_reference.crfone']
+        self.assertEqual(
+            (item['missing'], item['extra'], item['mismatched']), (0, 0, 0))
+
+    def test_mixed_case_identifiers_with_missing_key(self):
+        for subject_identifier in ['abc-1', 'ABC-2', 'Abc-3', 'abd-4']:
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier=subject_identifier,
+                report_datetime=self.report_datetime,
+                visit_code='1000')
+            CrfOne.objects.create(subject_visit=subject_visit, field_str=subject_identifier)
+        Reference.objects.filter(
+            identifier='ABC-2', model='edc_reference.crfone').delete()
+        count = Reference.objects.filter(model='edc_reference.crfone').count()
+        item = ReferenceVerifier(names=['edc_reference.crfone'], repair=True).verify()[
+            'edc_reference.crfone']
+        self.assertEqual(item['missing'], 4)
+        self.assertEqual(item['extra'], 0)
+        self.assertEqual(
+            Reference.objects.filter(model='edc_reference.crfone').count(), count + 4)
+
+    def test_orphans_with_a_source_row_not_deleted(self):
+        verifier = ReferenceVerifier(names=['edc_reference.crfone'], repair=True)
+        references = list(Reference.objects.filter(model='edc_reference.crfone'))
+        orphan = Reference.objects.create(
+            identifier=self.subject_identifier, timepoint='9999',
+            report_datetime=self.report_datetime,
+            model='edc_reference.crfone', field_name='field_str',
+            datatype='CharField', value_str='x')
+        self.assertEqual(
+            verifier.unsourced(name='edc_reference.crfone', references=references + [orphan]),
+            [orphan])
+
+    def test_keyset_pages_in_key_order(self):
+        for subject_identifier in ['abc-1', 'ABC-2', 'Abc-3', 'abd-4']:
+            subject_visit = SubjectVisit.objects.create(
+                subject_identifier=subject_identifier,
+                report_datetime=self.report_datetime,
+                visit_code='1000')
+            CrfOne.objects.create(subject_visit=subject_visit, field_str=subject_identifier)
+        verifier = ReferenceVerifier(names=['edc_reference.crfone'], chunk_size=1)
+        references = Reference.objects.filter(model='edc_reference.crfone')
+        rows = list(verifier.keyset(
+            queryset=references, lookups=['identifier', 'timepoint', 'report_datetime']))
+        self.assertEqual(len(rows), references.count())
+        keys = [verifier.key(obj) for obj in rows]
+        self.assertEqual(keys, sorted(keys))
+        item = verifier.verify()['edc_reference.crfone']
+        self.assertEqual(
+            (item['missing'], item['extra'], item['mismatched']), (0, 0, 0))
+
+    def test_collation_override(self):
+        verifier = ReferenceVerifier(names=['edc_reference.crfone'])
+        queryset = Reference.objects.all()
+        if connection.vendor != 'mysql':
+            self.assertEqual(
+                verifier.get_collation(lookup='identifier', queryset=queryset),
+                verifier.collations.get(connection.vendor))
+        verifier.collation = 'custom_bin'
+        self.assertEqual(
+            verifier.get_collation(lookup='identifier', queryset=queryset), 'custom_bin')
+        self.assertEqual(
+            verifier.get_field(CrfOne, 'subject_visit__subject_identifier'),
+            SubjectVisit._meta.get_field('subject_identifier'))
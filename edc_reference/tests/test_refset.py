@@ -1,11 +1,14 @@
 from dateutil.relativedelta import relativedelta
 
+from django.db import connection
 from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
 
 from edc_base.utils import get_utcnow
 
 from ..models import Reference
-from ..reference_model_config import ReferenceModelConfig
+from ..reference_model_config import ReferenceFieldValidationError, ReferenceModelConfig
+from ..reference_record import ReferenceRecordError
 from ..refsets import Refset, RefsetError, RefsetOverlappingField
 from ..site import site_reference_configs
 from .models import SubjectVisit, CrfOne
@@ -171,3 +174,92 @@ class TestRefset(TestCase):
             report_datetime=self.subject_visits[0].report_datetime,
             timepoint=self.subject_visits[0].visit_code,
             reference_model_cls=Reference)
+
+    def test_refset_one_query(self):
+        with self.assertNumQueries(1):
+            Refset(
+                name='edc_reference.crfone',
+                subject_identifier=self.subject_identifier,
+                report_datetime=self.subject_visits[0].report_datetime,
+                timepoint=self.subject_visits[0].visit_code,
+                reference_model_cls=Reference)
+
+    def test_refset_reads_only_refset_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            refset = Refset(
+                name='edc_reference.crfone',
+                subject_identifier=self.subject_identifier,
+                report_datetime=self.subject_visits[0].report_datetime,
+                timepoint=self.subject_visits[0].visit_code,
+                reference_model_cls=Reference)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('hostname_created', queries[0]['sql'])
+        self.assertIn('value_str', queries[0]['sql'])
+        self.assertEqual(refset.field_str, 'NEG')
+
+    def test_refset_index_includes_refset_fields(self):
+        index = [index for index in Reference._meta.indexes
+                 if index.name == 'edc_reference_refset_idx'][0]
+        self.assertEqual(index.fields, ['identifier', 'timepoint', 'model'])
+        self.assertEqual(list(index.include), Reference.refset_fields)
+
+    def test_refset_with_references(self):
+        subject_visit = self.subject_visits[1]
+        references = list(Reference.objects.filter(
+            identifier=self.subject_identifier,
+            timepoint=subject_visit.visit_code,
+            model='edc_reference.crfone'))
+        with self.assertNumQueries(0):
+            refset = Refset(
+                name='edc_reference.crfone',
+                subject_identifier=self.subject_identifier,
+                report_datetime=subject_visit.report_datetime,
+                timepoint=subject_visit.visit_code,
+                references=references)
+        crf_one = CrfOne.objects.get(subject_visit=subject_visit)
+        self.assertEqual(refset.field_str, crf_one.field_str)
+        self.assertEqual(refset.field_int, crf_one.field_int)
+
+    def test_refset_with_no_references(self):
+        refset = Refset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visits[0].report_datetime,
+            timepoint=self.subject_visits[0].visit_code,
+            references=[])
+        for value in refset._fields.values():
+            self.assertIsNone(value)
+
+    def test_record(self):
+        refset = Refset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visits[1].report_datetime,
+            timepoint=self.subject_visits[1].visit_code,
+            reference_model_cls=Reference)
+        record = refset.record()
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.__class__.__name__, 'CrfoneRecord')
+        for attr in ['subject_identifier', 'report_datetime', 'timepoint', 'visit_code',
+                     'field_date', 'field_datetime', 'field_int', 'field_str']:
+            with self.subTest(attr=attr):
+                self.assertEqual(getattr(record, attr), getattr(refset, attr))
+        self.assertEqual(record._fields, refset._fields)
+        self.assertEqual(record, refset.record())
+        self.assertRaises(AttributeError, setattr, record, 'field_blah', 1)
+
+    def test_record_field_name_conflicts_with_attribute(self):
+        for field_name in ['field_names', 'as_tuple', 'reserved']:
+            with self.subTest(field_name=field_name):
+                config = ReferenceModelConfig(
+                    name='edc_reference.crfone', fields=['field_str', field_name])
+                self.assertRaisesRegex(
+                    ReferenceFieldValidationError, 'ReferenceRecord', config.check)
+                self.assertRaises(ReferenceRecordError, getattr, config, 'record_cls')
+
+    def test_record_cls_reset_on_add_fields(self):
+        config = site_reference_configs.get_config(name='edc_reference.crfone')
+        record_cls = config.record_cls
+        self.assertIs(config.record_cls, record_cls)
+        config.add_fields(fields=['field_blah'])
+        self.assertIn('field_blah', config.record_cls.field_names)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+from django.apps import apps as django_apps
+from django.test import TestCase, tag
+
+from ..reference_model_config import ReferenceModelConfig
+from ..registry_snapshot import RegistrySnapshot
+from ..site import Site
+
+
+class TestRegistrySnapshot(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'registry.json')
+        self.module_path = os.path.join(self.tmpdir, 'configs.py')
+        with open(self.module_path, 'w') as f:
+            f.write('# configs\n')
+        self.site = Site()
+        self.site.register(ReferenceModelConfig(
+            name='edc_reference.crfone', fields=['field_int', 'field_str']))
+        reference = ReferenceModelConfig(
+            name='edc_reference.subjectvisit', fields=['report_datetime'])
+        reference.reference_model = 'edc_reference.otherreference'
+        self.site.register(reference)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self):
+        snapshot = RegistrySnapshot(path=self.path)
+        snapshot.write(registry=self.site.registry, modules=[])
+        return snapshot
+
+    def test_load_snapshot(self):
+        self.site.write_snapshot(path=self.path)
+        site = Site()
+        self.assertTrue(site.load_snapshot(path=self.path))
+        self.assertTrue(site.loaded)
+        self.assertEqual(
+            site.get_fields(name='edc_reference.crfone'), ['field_int', 'field_str'])
+        self.assertEqual(
+            site.get_reference_model(name='edc_reference.subjectvisit'),
+            'edc_reference.otherreference')
+
+    def test_unwritable_snapshot_logged(self):
+        app_config = django_apps.get_app_config('edc_reference')
+        path = os.path.join(self.tmpdir, 'missing', 'registry.json')
+        with self.assertLogs('edc_reference', level='WARNING') as cm:
+            app_config.load_reference_configs(snapshot_path=path, site=self.site)
+        self.assertIn(path, cm.output[0])
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(
+            self.site.get_fields(name='edc_reference.crfone'), ['field_int', 'field_str'])
+
+    def test_load_snapshot_missing(self):
+        self.assertFalse(Site().load_snapshot(path=self.path))
+
+    def test_stale_if_module_changed(self):
+        module = types.ModuleType('edc_reference_snapshot_configs')
+        module.__file__ = self.module_path
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__)
+        snapshot = RegistrySnapshot(path=self.path)
+        snapshot.write(registry=self.site.registry, modules=[module.__name__])
+        self.assertIsNotNone(snapshot.read())
+        with open(self.module_path, 'a') as f:
+            f.write('# changed\n')
+        self.assertIsNone(snapshot.read())
+        snapshot.write(registry=self.site.registry, modules=[module.__name__])
+        self.assertIsNotNone(snapshot.read())
+        os.remove(self.module_path)
+        self.assertIsNone(snapshot.read())
+
+    def test_stale_if_apps_changed(self):
+        snapshot = self.write()
+        self.assertIsNotNone(snapshot.read())
+        with open(self.path) as f:
+            data = f.read()
+        with open(self.path, 'w') as f:
+            f.write(data.replace('"edc_reference"', '"edc_blah"'))
+        self.assertIsNone(snapshot.read())
+
+    def test_stale_if_visit_schedule_changed(self):
+        module = types.ModuleType('edc_reference.visit_schedules')
+        module.__file__ = self.module_path
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__)
+        self.assertIn(module.__name__, self.site.get_snapshot_modules())
+        self.site.write_snapshot(path=self.path)
+        self.assertTrue(Site().load_snapshot(path=self.path))
+        with open(self.module_path, 'a') as f:
+            f.write('# a crf added\n')
+        self.assertFalse(Site().load_snapshot(path=self.path))
@@ -0,0 +1,158 @@
+from datetime import date
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from edc_base.utils import get_utcnow
+
+from ..models import Reference
+from ..reference import ReferenceGetter, ReferenceObjectDoesNotExist
+from ..reference import shared_reference_cache
+from ..reference_model_config import ReferenceModelConfig
+from ..refsets import LongitudinalRefset, Refset
+from ..site import site_reference_configs
+from .models import CrfOne, SubjectVisit
+
+
+class TestSharedReferenceCache(TestCase):
+
+    def setUp(self):
+        site_reference_configs.registry = {}
+        self.subject_identifier = '1'
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.subjectvisit',
+            fields=['report_datetime', 'visit_code']))
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_date', 'field_datetime',
+                    'field_int', 'report_datetime']))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subject_visit = SubjectVisit.objects.create(
+                subject_identifier=self.subject_identifier,
+                visit_code='code')
+            self.crf_one = CrfOne.objects.create(
+                subject_visit=self.subject_visit,
+                field_str='erik',
+                field_int=100,
+                field_date=date.today(),
+                field_datetime=get_utcnow())
+        cache.clear()
+        shared_reference_cache.enable(alias='default')
+
+    def tearDown(self):
+        shared_reference_cache.disable()
+
+    def get_reference(self, field_name=None):
+        return ReferenceGetter(
+            name='edc_reference.crfone',
+            field_name=field_name,
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visit.report_datetime,
+            visit_code=self.subject_visit.visit_code)
+
+    def get_refset(self):
+        return Refset(
+            name='edc_reference.crfone',
+            subject_identifier=self.subject_identifier,
+            report_datetime=self.subject_visit.report_datetime,
+            timepoint=self.subject_visit.visit_code,
+            reference_model_cls=Reference)
+
+    def get_longitudinal_refset(self, **kwargs):
+        return LongitudinalRefset(
+            subject_identifier=self.subject_identifier,
+            visit_model='edc_reference.subjectvisit',
+            name='edc_reference.crfone',
+            reference_model_cls=Reference, **kwargs)
+
+    def test_getter_served_from_shared_cache(self):
+        self.get_reference(field_name='field_str')
+        with CaptureQueriesContext(connection) as context:
+            reference = self.get_reference(field_name='field_str')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(reference.value, 'erik')
+        self.assertEqual(shared_reference_cache.info()['hits'], 1)
+
+    def test_getter_not_stale_after_update(self):
+        self.get_reference(field_name='field_str')
+        self.crf_one.field_str = 'bob'
+        self.crf_one.save()
+        self.assertEqual(self.get_reference(field_name='field_str').value, 'bob')
+
+    def test_getter_not_stale_after_delete(self):
+        self.get_reference(field_name='field_str')
+        self.crf_one.delete()
+        self.assertRaises(
+            ReferenceObjectDoesNotExist,
+            self.get_reference, field_name='field_str')
+
+    def test_does_not_exist_is_cached(self):
+        self.assertRaises(
+            ReferenceObjectDoesNotExist,
+            self.get_reference, field_name='blah')
+        with CaptureQueriesContext(connection) as context:
+            self.assertRaises(
+                ReferenceObjectDoesNotExist,
+                self.get_reference, field_name='blah')
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_refset_served_from_shared_cache(self):
+        self.get_refset()
+        with CaptureQueriesContext(connection) as context:
+            refset = self.get_refset()
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(refset.field_str, 'erik')
+        self.crf_one.field_str = 'bob'
+        self.crf_one.save()
+        self.assertEqual(self.get_refset().field_str, 'bob')
+
+    def test_longitudinal_refset_served_from_shared_cache(self):
+        self.get_longitudinal_refset()
+        with CaptureQueriesContext(connection) as context:
+            longitudinal_refset = self.get_longitudinal_refset()
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual([r.field_str for r in longitudinal_refset], ['erik'])
+        self.crf_one.field_str = 'bob'
+        self.crf_one.save()
+        self.assertEqual(
+            [r.field_str for r in self.get_longitudinal_refset()], ['bob'])
+
+    def test_rollback_leaves_no_uncommitted_values(self):
+        self.get_reference(field_name='field_str')
+        try:
+            with transaction.atomic():
+                self.crf_one.field_str = 'bob'
+                self.crf_one.save()
+                self.assertEqual(self.get_reference(field_name='field_str').value, 'bob')
+                self.assertEqual(self.get_refset().field_str, 'bob')
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.get_reference(field_name='field_str').value, 'erik')
+        self.assertEqual(self.get_refset().field_str, 'erik')
+
+    def test_concurrent_reader_before_commit_not_served(self):
+        stale = Reference.objects.get(
+            identifier=self.subject_identifier, model='edc_reference.crfone',
+            field_name='field_str')
+        key = (self.subject_identifier, self.subject_visit.visit_code,
+               self.subject_visit.report_datetime, 'edc_reference.crfone', 'field_str')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crf_one.field_str = 'bob'
+            self.crf_one.save()
+            # another process reads the committed value after the
+            # version was bumped but before this transaction commits
+            version = shared_reference_cache.get_version(
+                identifier=self.subject_identifier,
+                timepoint=self.subject_visit.visit_code,
+                model='edc_reference.crfone')
+            shared_reference_cache.cache.set(
+                shared_reference_cache.make_key(version, *key), (stale, ))
+        self.assertEqual(self.get_reference(field_name='field_str').value, 'bob')
+
+    def test_lazy_longitudinal_refset_served_from_shared_cache(self):
+        self.assertEqual(self.get_longitudinal_refset(lazy=True)[-1].field_str, 'erik')
+        with self.assertNumQueries(0):
+            refset = self.get_longitudinal_refset(lazy=True)
+            self.assertEqual(refset[-1].field_str, 'erik')
+            self.assertEqual([r.timepoint for r in refset[0:1]], ['code'])
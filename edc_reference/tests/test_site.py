@@ -1,7 +1,7 @@
 from django.test import TestCase, tag
 from edc_visit_schedule.site_visit_schedules import site_visit_schedules
 
-from ..reference_model_config import ReferenceModelConfig
+from ..reference_model_config import FieldPlan, ReferenceModelConfig
 from ..reference_model_config import ReferenceFieldValidationError, ReferenceDuplicateField
 from ..reference_model_config import ReferenceModelValidationError
 from ..site import site_reference_configs
@@ -150,6 +150,32 @@ class TestSite(TestCase):
         self.assertTrue(
             site_reference_configs.get_config(name='edc_reference.crfone'))
 
+    def test_register_from_visit_schedule_registers_each_name_once(self):
+        site_reference_configs.registry = {}
+        visit_models = {'edc_appointment.appointment': 'edc_reference.subjectvisit'}
+        site_reference_configs.register_from_visit_schedule(visit_models=visit_models)
+        self.assertEqual(
+            sorted(site_reference_configs.registry),
+            ['edc_reference.crfone', 'edc_reference.subjectvisit'])
+        self.assertEqual(
+            site_reference_configs.get_fields(name='edc_reference.crfone'),
+            ['report_datetime'])
+        names = site_reference_configs.get_names_from_visit_schedule(
+            visit_models=visit_models)
+        self.assertEqual(
+            site_reference_configs.get_names_from_visit_schedule(visit_models=visit_models),
+            names)
+
+    def test_register_from_visit_schedule_adds_missing_fields(self):
+        site_reference_configs.registry = {}
+        site_reference_configs.register(ReferenceModelConfig(
+            name='edc_reference.crfone', fields=['field_int']))
+        site_reference_configs.register_from_visit_schedule(
+            visit_models={'edc_appointment.appointment': ['edc_reference.subjectvisit']})
+        self.assertEqual(
+            site_reference_configs.get_fields(name='edc_reference.crfone'),
+            ['field_int', 'report_datetime'])
+
     def test_add_fields_to_reference_config(self):
         name = 'edc_reference.crfone'
         fields = ['f1']
@@ -160,3 +186,34 @@ class TestSite(TestCase):
         site_reference_configs.add_fields_to_config(
             name=name, fields=['f2', 'f3'])
         self.assertEqual(reference_config.field_names, ['f1', 'f2', 'f3'])
+
+    def test_field_plan(self):
+        reference_config = ReferenceModelConfig(
+            name='edc_reference.crfone',
+            fields=['field_str', 'field_int', 'subject_visit'])
+        self.assertEqual(
+            reference_config.field_plan,
+            [FieldPlan('field_int', 'field_int', 'IntegerField', 'value_int', None),
+             FieldPlan('field_str', 'field_str', 'CharField', 'value_str', None),
+             FieldPlan('subject_visit', 'subject_visit_id', 'UUIDField',
+                       'value_uuid', 'edc_reference.subjectvisit')])
+
+    def test_field_plan_compiled_on_check(self):
+        reference_config = ReferenceModelConfig(
+            name='edc_reference.crfone', fields=['field_str'])
+        reference_config.check()
+        self.assertEqual(len(reference_config._field_plan), 1)
+
+    def test_field_plan_reset_on_add_fields(self):
+        reference_config = ReferenceModelConfig(
+            name='edc_reference.crfone', fields=['field_str'])
+        self.assertEqual(len(reference_config.field_plan), 1)
+        reference_config.add_fields(fields=['field_int'])
+        self.assertEqual(len(reference_config.field_plan), 2)
+
+    def test_field_plan_bad_field(self):
+        reference_config = ReferenceModelConfig(
+            name='edc_reference.crfone', fields=['blah'])
+        self.assertRaises(
+            ReferenceFieldValidationError,
+            getattr, reference_config, 'field_plan')
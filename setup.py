@@ -21,6 +21,8 @@ setup(
     description='pivoted reference model for edc modules',
     long_description=README,
     zip_safe=False,
+    # TestCase.captureOnCommitCallbacks, and Collate in the verifier
+    install_requires=['Django>=3.2'],
     keywords='django edc reference model',
     classifiers=[
         'Environment :: Web Environment',